@@ -0,0 +1,64 @@
+"""Measures a cold load of a large study from `RDBDatabase`.
+
+The journal is generated as in ``replay.py`` and written to a temporary SQLite database, unless
+``--url`` points to an existing database. Reports the peak memory of the load and the memory that
+the loaded study retains, as traced by ``tracemalloc``.
+
+Usage: python benchmarks/load.py [--url URL] [--trials N] [--params N] [--steps N]
+"""
+
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+from optjournal import _models
+from optjournal import JournalStorage
+from optjournal import RDBDatabase
+
+from replay import make_operations
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url")
+    parser.add_argument("--trials", type=int, default=20000)
+    parser.add_argument("--params", type=int, default=5)
+    parser.add_argument("--steps", type=int, default=10)
+    args = parser.parse_args()
+    args.codec = "json"
+
+    url = args.url
+    if url is None:
+        url = "sqlite:///{}".format(os.path.join(tempfile.mkdtemp(), "db.sqlite3"))
+
+    db = RDBDatabase(url)
+    study_id = db.create_study("load-{}".format(time.time())).id
+    ops = make_operations(args)
+    db.append_operations(
+        [_models.OperationModel(study_id=study_id, data=op.data) for op in ops]
+    )
+
+    storage = JournalStorage(RDBDatabase(url))
+    tracemalloc.start()
+    start = time.perf_counter()
+    trials = storage.get_all_trials(study_id, deepcopy=False)
+    elapsed = time.perf_counter() - start
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    assert len(trials) == args.trials
+    print(
+        "records={} elapsed={:.2f}s peak={:.1f}MiB retained={:.1f}MiB transient={:.1f}MiB".format(
+            len(ops),
+            elapsed,
+            peak / 2 ** 20,
+            retained / 2 ** 20,
+            (peak - retained) / 2 ** 20,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,273 @@
+"""Stress-tests the file locks of `FileSystemDatabase` with many processes appending to one study.
+
+Every worker process appends ``--appends`` records of about ``--record-bytes`` bytes, one per
+``append_operations`` call. Afterwards, the journal is checked line by line: every line has to
+be a well-formed record, and every successful append has to be in it exactly once, in the
+order of its worker.
+
+Reported per lock: append throughput, append latency, lock acquisition time and retries (link
+lock only), and appends that failed because the lock couldn't be acquired. Workers that raise or
+die are reported as problems.
+
+Pass ``--root`` to run on another file system (e.g. an NFS mount). It has to be empty or not
+exist.
+
+Usage: python benchmarks/locks.py [--workers N] [--appends N] [--lock flock|link|both]
+    [--root DIR] [--fsync] [--output results.json]
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import queue as queue_module
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import traceback
+
+from optjournal import _codec
+from optjournal import _models
+from optjournal._operation import _Operation
+from optjournal import CallbackSink
+from optjournal import FileSystemDatabase
+
+from suite import percentile
+
+
+# Seconds to wait for the workers to start, and between checks whether they are still alive.
+STARTUP_TIMEOUT = 60
+POLL_INTERVAL = 1
+
+
+def worker(root, avoid_flock, fsync, study_id, index, n_appends, record_bytes, barrier, queue):
+    # Failures are reported to the parent, which would otherwise wait for the workers forever.
+    try:
+        run_worker(
+            root, avoid_flock, fsync, study_id, index, n_appends, record_bytes, barrier, queue
+        )
+    except Exception:
+        barrier.abort()
+        queue.put({"worker": index, "error": traceback.format_exc()})
+
+
+def run_worker(root, avoid_flock, fsync, study_id, index, n_appends, record_bytes, barrier, queue):
+    acquire_seconds = []
+    retries = []
+
+    def observe(name, value):
+        if name == "file_lock.acquire_seconds":
+            acquire_seconds.append(value)
+        elif name == "file_lock.retries":
+            retries.append(value)
+
+    db = FileSystemDatabase(
+        root, avoid_flock=avoid_flock, fsync=fsync, metrics=CallbackSink(observe)
+    )
+    codec = _codec.get_codec("json")
+    pad = "x" * record_bytes
+    barrier.wait()
+
+    latencies = []
+    appended = []
+    n_failures = 0
+    for i in range(n_appends):
+        data = codec.encode(
+            _Operation.SET_STUDY_USER_ATTR.value,
+            {"key": "w{}".format(index), "value": [i, pad]},
+        )
+        start = time.perf_counter()
+        try:
+            db.append_operations([_models.OperationModel(study_id=study_id, data=data)])
+        except RuntimeError:
+            # The link lock gives up after a timeout.
+            n_failures += 1
+            continue
+        latencies.append(time.perf_counter() - start)
+        appended.append(i)
+
+    queue.put(
+        {
+            "worker": index,
+            "latencies": latencies,
+            "acquire_seconds": acquire_seconds,
+            "retries": retries,
+            "appended": appended,
+            "failures": n_failures,
+        }
+    )
+
+
+def check_journal(path, n_workers, results):
+    """Return the problems found in the journal (empty if there are none)."""
+
+    problems = []
+    expected = {r["worker"]: r["appended"] for r in results}
+    found = {index: [] for index in range(n_workers)}
+    data = b""
+    if os.path.exists(path):
+        # It isn't created if all workers have failed before appending.
+        with open(path, "rb") as f:
+            data = f.read()
+    if data and not data.endswith(b"\n"):
+        problems.append("the journal doesn't end with a newline")
+
+    for n, line in enumerate(data.split(b"\n")[:-1]):
+        try:
+            kind, item = _codec.decode(line.decode())
+            index = int(item["key"][1:])
+            i = item["value"][0]
+        except Exception as e:
+            problems.append("line {}: malformed record ({!r})".format(n, e))
+            continue
+        if kind != _Operation.SET_STUDY_USER_ATTR.value or index not in found:
+            problems.append("line {}: unexpected record".format(n))
+            continue
+        found[index].append(i)
+
+    for index, appended in expected.items():
+        if found[index] != appended:
+            missing = len(set(appended) - set(found[index]))
+            problems.append(
+                "worker {}: {} records expected, {} found ({} missing, order {})".format(
+                    index,
+                    len(appended),
+                    len(found[index]),
+                    missing,
+                    "kept" if found[index] == sorted(found[index]) else "broken",
+                )
+            )
+
+    return problems
+
+
+def collect(queue, processes):
+    """Return the results of the workers, and the problems of those that failed or died."""
+
+    results = []
+    problems = []
+    while len(results) + len(problems) < len(processes):
+        try:
+            result = queue.get(timeout=POLL_INTERVAL)
+        except queue_module.Empty:
+            if any(p.is_alive() for p in processes):
+                continue
+            # Results are put before a worker exits, so there are no more to come.
+            reported = {r["worker"] for r in results} | {index for index, _ in problems}
+            for index, p in enumerate(processes):
+                if index not in reported:
+                    message = "worker {} died (exit code {})".format(index, p.exitcode)
+                    problems.append((index, message))
+            break
+
+        if "error" in result:
+            message = "worker {} failed:\n{}".format(result["worker"], result["error"])
+            problems.append((result["worker"], message))
+        else:
+            results.append(result)
+
+    return results, [problem for _, problem in sorted(problems)]
+
+
+def run(lock, args):
+    root = args.root if args.root is not None else tempfile.mkdtemp()
+    root = os.path.join(root, "locks-{}".format(lock))
+    db = FileSystemDatabase(root, avoid_flock=lock == "link")
+    study_id = db.create_study("stress").id
+
+    queue = multiprocessing.Queue()
+    barrier = multiprocessing.Barrier(args.workers + 1)
+    processes = [
+        multiprocessing.Process(
+            target=worker,
+            args=(
+                root,
+                lock == "link",
+                args.fsync,
+                study_id,
+                index,
+                args.appends,
+                args.record_bytes,
+                barrier,
+                queue,
+            ),
+        )
+        for index in range(args.workers)
+    ]
+    for p in processes:
+        p.start()
+    try:
+        barrier.wait(timeout=STARTUP_TIMEOUT)
+    except threading.BrokenBarrierError:
+        # A worker has failed to start. It is reported below.
+        pass
+    start = time.perf_counter()
+    results, problems = collect(queue, processes)
+    elapsed = time.perf_counter() - start
+    for p in processes:
+        p.join()
+
+    problems += check_journal(db._journal_path(study_id), args.workers, results)
+    shutil.rmtree(root)
+
+    latencies = [v for r in results for v in r["latencies"]]
+    acquire_seconds = [v for r in results for v in r["acquire_seconds"]]
+    retries = [v for r in results for v in r["retries"]]
+    result = {
+        "lock": lock,
+        "workers": args.workers,
+        "appends": len(latencies),
+        "failures": sum(r["failures"] for r in results),
+        "appends_per_second": len(latencies) / elapsed,
+        "problems": problems,
+    }
+    for name, values in [("latency", latencies), ("acquire", acquire_seconds)]:
+        if values:
+            for q in [0.5, 0.9, 0.99]:
+                result["{}_p{}_ms".format(name, int(q * 100))] = percentile(values, q) * 1000
+            result["{}_max_ms".format(name)] = max(values) * 1000
+    if retries:
+        result["retries_mean"] = sum(retries) / len(retries)
+        result["retries_max"] = max(retries)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=64)
+    parser.add_argument("--appends", type=int, default=100)
+    parser.add_argument("--record-bytes", type=int, default=200)
+    parser.add_argument("--lock", default="both", choices=["flock", "link", "both"])
+    parser.add_argument("--root")
+    parser.add_argument("--fsync", action="store_true")
+    parser.add_argument("--output", help="Path of the JSON results.")
+    args = parser.parse_args()
+
+    locks = ["flock", "link"] if args.lock == "both" else [args.lock]
+    results = []
+    for lock in locks:
+        result = run(lock, args)
+        results.append(result)
+        print(
+            " ".join(
+                "{}={}".format(k, "{:.4g}".format(v) if isinstance(v, float) else len(v))
+                if isinstance(v, (float, list))
+                else "{}={}".format(k, v)
+                for k, v in result.items()
+            )
+        )
+        for problem in result["problems"]:
+            print("  " + problem)
+
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if any(result["problems"] for result in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""Measures how fast a journal is replayed into a `_Study`.
+
+Usage: python benchmarks/replay.py [--trials N] [--params N] [--steps N] [--codec json|binary]
+"""
+
+import argparse
+import time
+
+import optuna
+
+from optjournal import _codec
+from optjournal import _id
+from optjournal import _models
+from optjournal._operation import _Operation
+from optjournal._study import _Study
+
+
+def make_operations(args):
+    codec = _codec.get_codec(args.codec)
+    distribution = optuna.distributions.distribution_to_json(
+        optuna.distributions.UniformDistribution(0, 1)
+    )
+
+    records = [codec.encode(_Operation.SET_STUDY_DIRECTIONS.value, {"directions": [1]})]
+    now = time.time()
+    for number in range(args.trials):
+        trial_id = _id.make_trial_id(0, number)
+        items = [
+            (_Operation.CREATE_TRIAL, {"worker_id": "w", "datetime_start": now}),
+        ]
+        for i in range(args.params):
+            items.append(
+                (
+                    _Operation.SET_TRIAL_PARAM,
+                    {
+                        "trial_id": trial_id,
+                        "name": "x{}".format(i),
+                        "value": 0.5,
+                        "distribution": distribution,
+                    },
+                )
+            )
+        for step in range(args.steps):
+            items.append(
+                (
+                    _Operation.SET_TRIAL_INTERMEDIATE_VALUE,
+                    {"trial_id": trial_id, "step": step, "value": 0.1 * step},
+                )
+            )
+        items.append((_Operation.SET_TRIAL_VALUES, {"trial_id": trial_id, "values": [0.5]}))
+        items.append(
+            (
+                _Operation.SET_TRIAL_STATE,
+                {"trial_id": trial_id, "state": 1, "worker_id": "w", "datetime_complete": now},
+            )
+        )
+
+        # Coalesce items the way `JournalStorage._enqueue_op` does.
+        record = None
+        for kind, data in items:
+            encoded = codec.encode(kind.value, data)
+            if record is not None:
+                merged = codec.concat(record, encoded)
+                if len(merged) < _models.MAX_DATA_LENGTH:
+                    record = merged
+                    continue
+                records.append(record)
+            record = encoded
+        records.append(record)
+
+    return [
+        _models.OperationModel(id=i, study_id=0, data=data) for i, data in enumerate(records)
+    ]
+
+
+def replay(ops):
+    study = _Study(0)
+    if hasattr(study, "execute_all"):
+        study.execute_all(ops, "w")
+    else:
+        for op in ops:
+            study.execute(op, "w")
+    return study
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--trials", type=int, default=20000)
+    parser.add_argument("--params", type=int, default=5)
+    parser.add_argument("--steps", type=int, default=10)
+    parser.add_argument("--codec", default="json")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    ops = make_operations(args)
+    n_items = args.trials * (args.params + args.steps + 3) + 1
+
+    best = float("inf")
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        study = replay(ops)
+        best = min(best, time.perf_counter() - start)
+
+    assert len(study.trials) == args.trials
+    print(
+        "records={} items={} best={:.3f}s items/s={:.0f}".format(
+            len(ops), n_items, best, n_items / best
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""Measures concurrent optimization with `JournalStorage` on top of a SQLite database.
+
+Every worker process runs its own share of the trials of a single study. Each trial suggests
+``--params`` parameters and reports ``--steps`` intermediate values.
+
+Usage: python benchmarks/sqlite.py [--workers N] [--trials N] [--profile default|wal|wal-thread]
+
+``default`` uses SQLAlchemy's defaults, ``wal`` uses ``SQLiteOptions()`` and ``wal-thread`` uses
+``SQLiteOptions(checkpoint_interval_ms=1000)``.
+"""
+
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+
+import optuna
+
+from optjournal import JournalStorage
+from optjournal import RDBDatabase
+from optjournal import SQLiteOptions
+
+
+PROFILES = {
+    "default": None,
+    "wal": SQLiteOptions(),
+    "wal-thread": SQLiteOptions(checkpoint_interval_ms=1000),
+}
+
+
+def make_storage(url, profile):
+    return JournalStorage(RDBDatabase(url, sqlite_options=PROFILES[profile]))
+
+
+def worker(url, profile, study_name, n_trials, n_params, n_steps, barrier):
+    def objective(trial):
+        value = sum(trial.suggest_float("x{}".format(i), 0, 1) for i in range(n_params))
+        for step in range(n_steps):
+            trial.report(value / (step + 1), step)
+        return value
+
+    study = optuna.load_study(study_name=study_name, storage=make_storage(url, profile))
+    barrier.wait()
+    study.optimize(objective, n_trials=n_trials)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--trials", type=int, default=100)
+    parser.add_argument("--params", type=int, default=5)
+    parser.add_argument("--steps", type=int, default=10)
+    parser.add_argument("--profile", default="wal", choices=sorted(PROFILES))
+    args = parser.parse_args()
+
+    optuna.logging.set_verbosity(optuna.logging.WARNING)
+    url = "sqlite:///{}".format(os.path.join(tempfile.mkdtemp(), "db.sqlite3"))
+    study = optuna.create_study(storage=make_storage(url, args.profile))
+
+    barrier = multiprocessing.Barrier(args.workers + 1)
+    processes = [
+        multiprocessing.Process(
+            target=worker,
+            args=(
+                url,
+                args.profile,
+                study.study_name,
+                args.trials,
+                args.params,
+                args.steps,
+                barrier,
+            ),
+        )
+        for _ in range(args.workers)
+    ]
+    for p in processes:
+        p.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for p in processes:
+        p.join()
+    elapsed = time.perf_counter() - start
+
+    n_trials = args.workers * args.trials
+    assert len(study.trials) == n_trials
+    print(
+        "profile={} workers={} trials={} elapsed={:.2f}s trials/s={:.1f}".format(
+            args.profile, args.workers, n_trials, elapsed, n_trials / elapsed
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,344 @@
+"""Runs the benchmark scenarios against every backend and writes the results as JSON.
+
+Scenarios:
+
+* ``trials``: throughput of ``create_new_trial`` -> ``set_trial_param`` -> ``set_trial_values``
+  -> ``set_trial_state``, ``--trials`` times per process.
+* ``replay``: cold load of a study with a journal of ``--replay-ops`` operations (generated as
+  in ``replay.py``).
+* ``get_all_trials``: latency of ``get_all_trials`` on a loaded study of ``--study-sizes``
+  trials, which includes syncing with the journal.
+* ``summaries``: ``get_all_study_summaries`` over ``--studies`` studies, cold and warm.
+
+Backends are ``fs`` (``FileSystemDatabase`` with flock), ``fs-link`` (with the link lock) and
+``sqlite`` (``RDBDatabase`` on SQLite with ``SQLiteOptions()``). Every scenario runs with each
+number of ``--processes``, which all work on the same study (or studies) at once.
+
+Usage: python benchmarks/suite.py [--scenarios trials,replay,...] [--backends fs,sqlite,...]
+    [--processes 1,4] [--output results.json]
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+
+import optuna
+from optuna.trial import TrialState
+import sqlalchemy
+
+from optjournal import _models
+from optjournal import FileSystemDatabase
+from optjournal import JournalStorage
+from optjournal import RDBDatabase
+from optjournal import SQLiteOptions
+
+from replay import make_operations
+
+
+BACKENDS = ["fs", "fs-link", "sqlite"]
+SCENARIOS = ["trials", "replay", "get_all_trials", "summaries"]
+
+# Shape of the generated trials: a CREATE_TRIAL, SET_TRIAL_VALUES and SET_TRIAL_STATE operation
+# and these many params and intermediate values.
+N_PARAMS = 2
+N_STEPS = 5
+OPS_PER_TRIAL = N_PARAMS + N_STEPS + 3
+
+_APPEND_BATCH_SIZE = 10000
+
+
+def make_database(backend, root):
+    if backend == "sqlite":
+        os.makedirs(root, exist_ok=True)
+        url = "sqlite:///{}".format(os.path.join(root, "db.sqlite3"))
+        return RDBDatabase(url, sqlite_options=SQLiteOptions())
+
+    return FileSystemDatabase(root, avoid_flock=backend == "fs-link")
+
+
+def populate(db, study_name, n_trials):
+    args = argparse.Namespace(trials=n_trials, params=N_PARAMS, steps=N_STEPS, codec="json")
+    study_id = db.create_study(study_name).id
+    ops = [
+        _models.OperationModel(study_id=study_id, data=op.data) for op in make_operations(args)
+    ]
+    for i in range(0, len(ops), _APPEND_BATCH_SIZE):
+        db.append_operations(ops[i : i + _APPEND_BATCH_SIZE])
+    return study_id
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(int(len(values) * q), len(values) - 1)]
+
+
+def run_processes(target, n_processes, *args):
+    """Runs ``target(*args)`` in processes that start measuring at the same time.
+
+    ``target`` sets up a process and returns the function to measure, whose results are returned
+    together with the wall time of all processes.
+    """
+
+    queue = multiprocessing.Queue()
+    barrier = multiprocessing.Barrier(n_processes + 1)
+    processes = [
+        multiprocessing.Process(target=_run, args=(target, barrier, queue) + args)
+        for _ in range(n_processes)
+    ]
+    for p in processes:
+        p.start()
+    barrier.wait()
+    start = time.perf_counter()
+    results = [queue.get() for _ in processes]
+    elapsed = time.perf_counter() - start
+    for p in processes:
+        p.join()
+    for result in results:
+        if isinstance(result, Exception):
+            raise result
+    return results, elapsed
+
+
+def _run(target, barrier, queue, *args):
+    # Failures are passed on to the parent, which would otherwise wait for the results forever.
+    # Exceptions aren't necessarily picklable, so their tracebacks are.
+    optuna.logging.set_verbosity(optuna.logging.WARNING)
+    try:
+        run = target(*args)
+    except Exception:
+        barrier.abort()
+        queue.put(RuntimeError(traceback.format_exc()))
+        return
+
+    barrier.wait()
+    try:
+        queue.put(run())
+    except Exception:
+        queue.put(RuntimeError(traceback.format_exc()))
+
+
+def _trials_worker(backend, root, study_name, n_trials):
+    storage = JournalStorage(make_database(backend, root))
+    study_id = storage.get_study_id_from_name(study_name)
+    distribution = optuna.distributions.UniformDistribution(0, 1)
+
+    def run():
+        latencies = []
+        for _ in range(n_trials):
+            start = time.perf_counter()
+            trial_id = storage.create_new_trial(study_id)
+            storage.set_trial_param(trial_id, "x", 0.5, distribution)
+            storage.set_trial_values(trial_id, [0.5])
+            storage.set_trial_state(trial_id, TrialState.COMPLETE)
+            latencies.append(time.perf_counter() - start)
+        return latencies
+
+    return run
+
+
+def _replay_worker(backend, root, study_id, n_trials):
+    storage = JournalStorage(make_database(backend, root))
+
+    def run():
+        start = time.perf_counter()
+        trials = storage.get_all_trials(study_id, deepcopy=False)
+        elapsed = time.perf_counter() - start
+        assert len(trials) == n_trials
+        return elapsed
+
+    return run
+
+
+def _get_all_trials_worker(backend, root, study_id, n_repeats):
+    storage = JournalStorage(make_database(backend, root))
+    storage.get_all_trials(study_id, deepcopy=False)
+
+    def run():
+        latencies = []
+        for _ in range(n_repeats):
+            start = time.perf_counter()
+            storage.get_all_trials(study_id, deepcopy=False)
+            latencies.append(time.perf_counter() - start)
+        return latencies
+
+    return run
+
+
+def _summaries_worker(backend, root, n_studies):
+    storage = JournalStorage(make_database(backend, root))
+
+    def run():
+        elapsed = []
+        for _ in range(2):
+            start = time.perf_counter()
+            summaries = storage.get_all_study_summaries()
+            for summary in summaries:
+                summary.n_trials
+            elapsed.append(time.perf_counter() - start)
+        assert len(summaries) == n_studies
+        return elapsed
+
+    return run
+
+
+def bench_trials(backend, root, n_processes, args):
+    storage = JournalStorage(make_database(backend, root))
+    optuna.create_study(study_name="bench", storage=storage)
+    results, elapsed = run_processes(
+        _trials_worker, n_processes, backend, root, "bench", args.trials
+    )
+    latencies = [latency for result in results for latency in result]
+    yield args.trials, {
+        "trials_per_second": len(latencies) / elapsed,
+        "latency_p50_ms": percentile(latencies, 0.5) * 1000,
+        "latency_p99_ms": percentile(latencies, 0.99) * 1000,
+    }
+
+
+def bench_replay(backend, root, n_processes, args):
+    for n_ops in args.replay_ops:
+        n_trials = n_ops // OPS_PER_TRIAL
+        path = os.path.join(root, str(n_ops))
+        study_id = populate(make_database(backend, path), "bench", n_trials)
+        results, _ = run_processes(_replay_worker, n_processes, backend, path, study_id, n_trials)
+        mean = sum(results) / len(results)
+        yield n_ops, {
+            "load_seconds_mean": mean,
+            "load_seconds_max": max(results),
+            "ops_per_second": n_ops / mean,
+        }
+
+
+def bench_get_all_trials(backend, root, n_processes, args):
+    for n_trials in args.study_sizes:
+        path = os.path.join(root, str(n_trials))
+        study_id = populate(make_database(backend, path), "bench", n_trials)
+        results, _ = run_processes(
+            _get_all_trials_worker, n_processes, backend, path, study_id, args.repeats
+        )
+        latencies = [latency for result in results for latency in result]
+        yield n_trials, {
+            "latency_p50_ms": percentile(latencies, 0.5) * 1000,
+            "latency_p99_ms": percentile(latencies, 0.99) * 1000,
+        }
+
+
+def bench_summaries(backend, root, n_processes, args):
+    db = make_database(backend, root)
+    populate_args = argparse.Namespace(trials=10, params=N_PARAMS, steps=N_STEPS, codec="json")
+    records = [op.data for op in make_operations(populate_args)]
+    ops = []
+    for i in range(args.studies):
+        study_id = db.create_study("study-{}".format(i)).id
+        ops.extend(_models.OperationModel(study_id=study_id, data=data) for data in records)
+    db.append_operations(ops)
+
+    results, _ = run_processes(_summaries_worker, n_processes, backend, root, args.studies)
+    yield args.studies, {
+        "cold_seconds_max": max(cold for cold, _ in results),
+        "warm_seconds_max": max(warm for _, warm in results),
+    }
+
+
+BENCHMARKS = {
+    "trials": bench_trials,
+    "replay": bench_replay,
+    "get_all_trials": bench_get_all_trials,
+    "summaries": bench_summaries,
+}
+
+
+def get_metadata():
+    try:
+        revision = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        revision = None
+
+    return {
+        "revision": revision,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "optuna": optuna.__version__,
+        "sqlalchemy": sqlalchemy.__version__,
+    }
+
+
+def main():
+    def int_list(value):
+        return [int(v) for v in value.split(",")]
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--backends", default=",".join(BACKENDS))
+    parser.add_argument("--processes", type=int_list, default=[1, 4])
+    parser.add_argument("--trials", type=int, default=200)
+    parser.add_argument("--replay-ops", type=int_list, default=[10000, 100000, 1000000])
+    parser.add_argument("--study-sizes", type=int_list, default=[100, 1000, 10000])
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--studies", type=int, default=1000)
+    parser.add_argument("--output", help="Path of the JSON results (stdout if omitted).")
+    args = parser.parse_args()
+
+    scenarios = args.scenarios.split(",")
+    backends = args.backends.split(",")
+    for name, choices in [("scenario", scenarios), ("backend", backends)]:
+        unknown = set(choices) - set(SCENARIOS if name == "scenario" else BACKENDS)
+        if unknown:
+            parser.error("unknown {}: {}".format(name, ", ".join(sorted(unknown))))
+
+    results = []
+    for scenario in scenarios:
+        for backend in backends:
+            for n_processes in args.processes:
+                root = tempfile.mkdtemp()
+                try:
+                    for size, metrics in BENCHMARKS[scenario](backend, root, n_processes, args):
+                        results.append(
+                            {
+                                "scenario": scenario,
+                                "backend": backend,
+                                "processes": n_processes,
+                                "size": size,
+                                "metrics": metrics,
+                            }
+                        )
+                        print(
+                            "scenario={} backend={} processes={} size={} {}".format(
+                                scenario,
+                                backend,
+                                n_processes,
+                                size,
+                                " ".join("{}={:.4g}".format(k, v) for k, v in metrics.items()),
+                            ),
+                            file=sys.stderr,
+                        )
+                finally:
+                    shutil.rmtree(root)
+
+    document = {"metadata": get_metadata(), "results": results}
+    if args.output is None:
+        json.dump(document, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.output, "w") as f:
+            json.dump(document, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""Measures `get_all_study_summaries` over many studies.
+
+Every study gets a journal of ``--trials`` finished trials (generated as in ``replay.py``). The
+first pass replays the journals and stores the summaries, and the second one reads them.
+
+Usage: python benchmarks/summaries.py [--backend rdb|fs] [--studies N] [--trials N]
+"""
+
+import argparse
+import tempfile
+import time
+
+from sqlalchemy import event
+
+from optjournal import _models
+from optjournal import FileSystemDatabase
+from optjournal import JournalStorage
+from optjournal import RDBDatabase
+
+from replay import make_operations
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backend", default="rdb", choices=["rdb", "fs"])
+    parser.add_argument("--studies", type=int, default=2000)
+    parser.add_argument("--trials", type=int, default=10)
+    args = parser.parse_args()
+    args.params, args.steps, args.codec = 2, 2, "json"
+
+    root = tempfile.mkdtemp()
+    if args.backend == "rdb":
+        db = RDBDatabase("sqlite:///{}/db.sqlite3".format(root))
+    else:
+        db = FileSystemDatabase(root)
+
+    records = [op.data for op in make_operations(args)]
+    ops = []
+    for i in range(args.studies):
+        study_id = db.create_study("study-{}".format(i)).id
+        ops.extend(_models.OperationModel(study_id=study_id, data=data) for data in records)
+    db.append_operations(ops)
+
+    n_queries = [0]
+    if args.backend == "rdb":
+
+        @event.listens_for(db._engine, "before_cursor_execute")
+        def count(*args):
+            n_queries[0] += 1
+
+    storage = JournalStorage(db)
+    for name in ["cold", "warm"]:
+        n_queries[0] = 0
+        start = time.perf_counter()
+        n_trials = sum(summary.n_trials for summary in storage.get_all_study_summaries())
+        elapsed = time.perf_counter() - start
+        assert n_trials == args.studies * args.trials
+        print(
+            "backend={} studies={} pass={} elapsed={:.2f}s queries={}".format(
+                args.backend, args.studies, name, elapsed, n_queries[0]
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,13 @@
 from optjournal._file_system import FileSystemDatabase  # NOQA
+from optjournal._metrics import CallbackSink  # NOQA
+from optjournal._metrics import InMemoryMetrics  # NOQA
+from optjournal._metrics import MetricsSink  # NOQA
+from optjournal._metrics import PrometheusTextfileSink  # NOQA
+from optjournal._policy import CheckpointPolicy  # NOQA
+from optjournal._policy import RetryPolicy  # NOQA
+from optjournal._policy import SyncPolicy  # NOQA
 from optjournal._rdb import RDBDatabase  # NOQA
+from optjournal._sqlite import SQLiteOptions  # NOQA
 from optjournal._storage import JournalStorage  # NOQA
+from optjournal._tracing import merge_traces  # NOQA
+from optjournal._tracing import Tracer  # NOQA
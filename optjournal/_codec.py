@@ -0,0 +1,262 @@
+import abc
+import base64
+import binascii
+import json
+import struct
+import zlib
+from typing import Any
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+# Binary records are stored as text (the journal is a text column or a text file), so the payload
+# is base64-encoded behind a prefix made of a marker character and the format version.
+_BINARY_MARKER = "~"
+_BINARY_VERSION = "1"
+_BINARY_PREFIX = _BINARY_MARKER + _BINARY_VERSION
+
+# Compressed records of either codec are zlib-compressed and base64-encoded behind this marker.
+_COMPRESSED_MARKER = "z"
+
+# Value tags of the binary format (version 1).
+_NONE = 0
+_FALSE = 1
+_TRUE = 2
+_FLOAT = 3
+_INT = 4
+_STR = 5
+_LIST = 6
+_DICT = 7
+_KEY = 8  # Followed by an index into `_KEYS`.
+_SMALL_INT = 0x80  # 0x80 + n for 0 <= n < 0x80.
+
+# Interned names. Entries may only ever be appended to this list.
+_KEYS = [
+    "trial_id",
+    "worker_id",
+    "name",
+    "value",
+    "values",
+    "distribution",
+    "distributions",
+    "key",
+    "step",
+    "state",
+    "datetime_start",
+    "datetime_complete",
+    "directions",
+    "params",
+    "user_attrs",
+    "system_attrs",
+    "intermediate_values",
+    "generation",
+]
+_KEY_INDICES = {key: i for i, key in enumerate(_KEYS)}
+
+_DOUBLE = struct.Struct("<d")
+
+
+class Codec(object, metaclass=abc.ABCMeta):
+    """Encoding of operation records.
+
+    A record is a flat ``[kind, data, kind, data, ...]`` sequence. Every codec is recognizable
+    from the first character of its records, so journals written with different codecs can be
+    replayed with :func:`decode`.
+    """
+
+    @abc.abstractmethod
+    def encode(self, kind: int, data: Any) -> str:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def concat(self, record: str, other: str) -> str:
+        raise NotImplementedError
+
+
+class JsonCodec(Codec):
+    def encode(self, kind: int, data: Any) -> str:
+        return json.dumps([kind, data])
+
+    def concat(self, record: str, other: str) -> str:
+        return "{},{}".format(record[:-1], other[1:])
+
+
+class BinaryCodec(Codec):
+    """Compact binary records with native doubles, one-byte op kinds and interned key names."""
+
+    def encode(self, kind: int, data: Any) -> str:
+        buf = bytearray([kind])
+        _encode_value(data, buf)
+        return _BINARY_PREFIX + base64.b64encode(buf).decode("ascii")
+
+    def concat(self, record: str, other: str) -> str:
+        payload = _b64decode(record) + _b64decode(other)
+        return _BINARY_PREFIX + base64.b64encode(payload).decode("ascii")
+
+
+_CODECS = {"json": JsonCodec(), "binary": BinaryCodec()}
+
+
+def get_codec(name: str) -> Codec:
+    if name not in _CODECS:
+        raise ValueError("Unknown codec: {!r} (available: {}).".format(name, sorted(_CODECS)))
+
+    return _CODECS[name]
+
+
+def compress(record: str, threshold: Optional[int]) -> str:
+    """Compress a record that is at least ``threshold`` characters long.
+
+    The record is returned as is if ``threshold`` is :obj:`None` or compressing doesn't make it
+    shorter.
+    """
+
+    if threshold is None or len(record) < threshold:
+        return record
+
+    compressed = _COMPRESSED_MARKER + base64.b64encode(
+        zlib.compress(record.encode("utf-8"))
+    ).decode("ascii")
+    return compressed if len(compressed) < len(record) else record
+
+
+def decode(record: str) -> List[Any]:
+    marker = record[:1]
+    if marker == _COMPRESSED_MARKER:
+        record = zlib.decompress(binascii.a2b_base64(record[1:])).decode("utf-8")
+        marker = record[:1]
+
+    if marker != _BINARY_MARKER:
+        return json.loads(record)
+
+    if record[1:2] != _BINARY_VERSION:
+        raise ValueError("Unsupported binary record version: {!r}.".format(record[1:2]))
+
+    payload = _b64decode(record)
+    items = []  # type: List[Any]
+    pos = 0
+    end = len(payload)
+    while pos < end:
+        items.append(payload[pos])
+        data, pos = _decode_value(payload, pos + 1)
+        items.append(data)
+
+    return items
+
+
+def _b64decode(record: str) -> bytes:
+    return binascii.a2b_base64(record[len(_BINARY_PREFIX) :])
+
+
+def _encode_varint(n: int, buf: bytearray) -> None:
+    while n >= 0x80:
+        buf.append((n & 0x7F) | 0x80)
+        n >>= 7
+    buf.append(n)
+
+
+def _encode_value(value: Any, buf: bytearray) -> None:
+    if value is None:
+        buf.append(_NONE)
+    elif value is True:
+        buf.append(_TRUE)
+    elif value is False:
+        buf.append(_FALSE)
+    elif isinstance(value, float):
+        buf.append(_FLOAT)
+        buf += _DOUBLE.pack(value)
+    elif isinstance(value, int):
+        if 0 <= value < 0x80:
+            buf.append(_SMALL_INT + value)
+        else:
+            buf.append(_INT)
+            # Zigzag encoding.
+            _encode_varint(value * 2 if value >= 0 else -value * 2 - 1, buf)
+    elif isinstance(value, str):
+        index = _KEY_INDICES.get(value)
+        if index is not None:
+            buf.append(_KEY)
+            buf.append(index)
+        else:
+            encoded = value.encode("utf-8")
+            buf.append(_STR)
+            _encode_varint(len(encoded), buf)
+            buf += encoded
+    elif isinstance(value, (list, tuple)):
+        buf.append(_LIST)
+        _encode_varint(len(value), buf)
+        for v in value:
+            _encode_value(v, buf)
+    elif isinstance(value, dict):
+        buf.append(_DICT)
+        _encode_varint(len(value), buf)
+        for k, v in value.items():
+            _encode_value(k, buf)
+            _encode_value(v, buf)
+    else:
+        raise TypeError("Object of type {} is not serializable.".format(type(value).__name__))
+
+
+def _decode_varint(payload: bytes, pos: int) -> Tuple[int, int]:
+    n = 0
+    shift = 0
+    while True:
+        b = payload[pos]
+        pos += 1
+        n |= (b & 0x7F) << shift
+        if b < 0x80:
+            return n, pos
+        shift += 7
+
+
+def _decode_value(payload: bytes, pos: int) -> Tuple[Any, int]:
+    # This is the hot path of replaying binary journals: the most frequent tags come first and
+    # single-byte lengths are decoded inline.
+    tag = payload[pos]
+    pos += 1
+    if tag >= _SMALL_INT:
+        return tag - _SMALL_INT, pos
+    elif tag == _KEY:
+        return _KEYS[payload[pos]], pos + 1
+    elif tag == _FLOAT:
+        return _DOUBLE.unpack_from(payload, pos)[0], pos + 8
+    elif tag == _DICT:
+        n = payload[pos]
+        if n < 0x80:
+            pos += 1
+        else:
+            n, pos = _decode_varint(payload, pos)
+        d = {}
+        for _ in range(n):
+            if payload[pos] == _KEY:
+                k = _KEYS[payload[pos + 1]]
+                pos += 2
+            else:
+                k, pos = _decode_value(payload, pos)
+            d[k], pos = _decode_value(payload, pos)
+        return d, pos
+    elif tag == _STR:
+        n = payload[pos]
+        if n < 0x80:
+            pos += 1
+        else:
+            n, pos = _decode_varint(payload, pos)
+        return payload[pos : pos + n].decode("utf-8"), pos + n
+    elif tag == _INT:
+        n, pos = _decode_varint(payload, pos)
+        return (n >> 1) if n & 1 == 0 else -((n + 1) >> 1), pos
+    elif tag == _LIST:
+        n, pos = _decode_varint(payload, pos)
+        values = []
+        for _ in range(n):
+            v, pos = _decode_value(payload, pos)
+            values.append(v)
+        return values, pos
+    elif tag == _NONE:
+        return None, pos
+    elif tag == _TRUE:
+        return True, pos
+    elif tag == _FALSE:
+        return False, pos
+    else:
+        raise ValueError("Unknown value tag: {}.".format(tag))
@@ -0,0 +1,105 @@
+from typing import List
+from typing import Sequence
+from typing import Tuple
+
+from optjournal import _codec
+from optjournal import _id
+from optjournal import _models
+from optjournal._operation import _Operation
+from optjournal._study import _make_template
+from optjournal._study import _Study
+
+_TRIAL_OPERATIONS = {
+    _Operation.SET_TRIAL_PARAM.value,
+    _Operation.SET_TRIAL_VALUES.value,
+    _Operation.SET_TRIAL_USER_ATTR.value,
+    _Operation.SET_TRIAL_SYSTEM_ATTR.value,
+    _Operation.SET_TRIAL_STATE.value,
+    _Operation.SET_TRIAL_INTERMEDIATE_VALUE.value,
+}
+
+
+def compact_operations(
+    study_id: int, ops: Sequence[_models.StoredOperation], codec: _codec.Codec
+) -> Tuple[int, List[str]]:
+    """Fold a journal prefix into as few records as possible.
+
+    Every finished trial becomes a single template-style ``CREATE_TRIAL`` item. Unfinished trials
+    keep their original items, so that ownership is resolved exactly as before. Each returned
+    record starts with a ``COMPACTION`` item carrying the new journal generation.
+    """
+
+    study = _Study(study_id)
+    study.execute_all(ops, "")
+
+    trial_items = []
+    for op in ops:
+        op_items = _codec.decode(op.data)
+        for i in range(0, len(op_items), 2):
+            kind, data = op_items[i], op_items[i + 1]
+            if kind == _Operation.CREATE_TRIAL.value:
+                trial_items.append([(kind, data)])
+            elif kind in _TRIAL_OPERATIONS:
+                trial_items[_id.get_trial_number(data["trial_id"])].append((kind, data))
+
+    generation = study.generation + 1
+    items = []  # type: List[str]
+    if study.directions:
+        items.append(
+            codec.encode(
+                _Operation.SET_STUDY_DIRECTIONS.value,
+                {"directions": [d.value for d in study.directions]},
+            )
+        )
+    for key, value in study.user_attrs.items():
+        items.append(
+            codec.encode(_Operation.SET_STUDY_USER_ATTR.value, {"key": key, "value": value})
+        )
+    for key, value in study.system_attrs.items():
+        items.append(
+            codec.encode(_Operation.SET_STUDY_SYSTEM_ATTR.value, {"key": key, "value": value})
+        )
+
+    marker = marker_record(generation, codec)
+    for trial, original_items in zip(study.trials, trial_items):
+        if trial.state.is_finished():
+            template = codec.encode(_Operation.CREATE_TRIAL.value, _make_template(trial))
+            if len(codec.concat(marker, template)) <= _models.MAX_DATA_LENGTH:
+                items.append(template)
+                continue
+
+        items.extend(codec.encode(kind, data) for kind, data in original_items)
+
+    return generation, _pack(items, marker, codec) or [marker]
+
+
+def marker_record(generation: int, codec: _codec.Codec) -> str:
+    return codec.encode(_Operation.COMPACTION.value, {"generation": generation})
+
+
+def parse_generation(record: str) -> int:
+    items = _codec.decode(record)
+    if items and items[0] == _Operation.COMPACTION.value:
+        return items[1]["generation"]
+
+    return 0
+
+
+def _pack(items: List[str], marker: str, codec: _codec.Codec) -> List[str]:
+    records = []
+    record = None
+    for item in items:
+        if record is not None:
+            merged = codec.concat(record, item)
+            if len(merged) <= _models.MAX_DATA_LENGTH:
+                record = merged
+                continue
+
+            records.append(record)
+
+        record = codec.concat(marker, item)
+
+    if record is not None:
+        records.append(record)
+
+    return records
@@ -1,6 +1,9 @@
 import abc
+from typing import Dict
+from typing import Iterator
 from typing import List
 from typing import Optional
+from typing import Tuple
 
 from optjournal import _models
 
@@ -28,14 +31,105 @@ class Database(object, metaclass=abc.ABCMeta):
 
     @abc.abstractmethod
     def append_operations(self, ops: List[_models.OperationModel]) -> None:
+        """Append operations, possibly of several studies.
+
+        Either all of them are written or none, since ``JournalStorage`` writes the flushes of
+        several studies in one call and writes them again if it fails.
+        """
+
         raise NotImplementedError
 
     @abc.abstractmethod
-    def read_operations(self, study_id: int, next_op_id: int) -> List[_models.OperationModel]:
+    def read_operations(self, study_id: int, next_op_id: int) -> List[_models.StoredOperation]:
+        """Read the operations of a study from ``next_op_id`` on.
+
+        Operations are models or, more cheaply, :class:`~optjournal._models.OperationRecord`
+        tuples. Records are returned as stored and decoded by the caller.
+        """
+
         raise NotImplementedError
 
+    def iter_operations(
+        self, study_id: int, next_op_id: int
+    ) -> Iterator[List[_models.StoredOperation]]:
+        """Read the operations of a study from ``next_op_id`` on in chunks.
+
+        Implementations that can read a journal piecewise bound the size of each chunk, so that
+        the whole journal is never held in memory at once.
+        """
+
+        ops = self.read_operations(study_id, next_op_id)
+        if len(ops) > 0:
+            yield ops
+
     def save_snapshot(self, snapshot: _models.SnapshotModel) -> None:
         return
 
     def load_snapshot(self, study_id: int, snapshot_name: str) -> Optional[_models.SnapshotModel]:
         return None
+
+    def save_study_summary(self, summary: _models.StudySummaryModel) -> None:
+        return
+
+    def load_study_summaries(
+        self,
+    ) -> List[Tuple[_models.StudyModel, Optional[_models.StudySummaryModel]]]:
+        """Load all studies together with their stored summaries.
+
+        A summary is only returned if it covers every operation of the journal of its study,
+        otherwise :obj:`None` is returned in its place.
+        """
+
+        return [(study, None) for study in self.get_all_studies()]
+
+    def compact(self, study_id: int, codec: str = "json") -> bool:
+        """Rewrite the committed journal prefix of a study into a compact form.
+
+        ``codec`` is the record format of the rewritten prefix. Returns :obj:`True` if the
+        journal was rewritten.
+        """
+
+        return False
+
+    def load_snapshot_and_operations(
+        self, study_id: int, snapshot_name: str, next_op_id: int
+    ) -> Tuple[Optional[_models.SnapshotModel], List[_models.StoredOperation]]:
+        """Load a snapshot together with the operations that follow it.
+
+        The operations start at ``snapshot.next_op_id`` if it is known, otherwise at
+        ``next_op_id``.
+        """
+
+        snapshot = self.load_snapshot(study_id, snapshot_name)
+        if snapshot is not None and snapshot.next_op_id is not None:
+            next_op_id = snapshot.next_op_id
+
+        return snapshot, self.read_operations(study_id, next_op_id)
+
+    def load_snapshot_and_iter_operations(
+        self, study_id: int, snapshot_name: str, next_op_id: int
+    ) -> Tuple[Optional[_models.SnapshotModel], Iterator[List[_models.StoredOperation]]]:
+        """Load a snapshot together with the chunks of operations that follow it.
+
+        This is the chunked counterpart of :meth:`load_snapshot_and_operations`, through which
+        it reads everything at once by default.
+        """
+
+        snapshot, ops = self.load_snapshot_and_operations(study_id, snapshot_name, next_op_id)
+        return snapshot, iter([ops] if len(ops) > 0 else [])
+
+    def load_snapshots_and_operations(
+        self, snapshot_name: str, next_op_ids: Dict[int, int]
+    ) -> Dict[int, Tuple[Optional[_models.SnapshotModel], List[_models.StoredOperation]]]:
+        """Load the snapshots of many studies together with the operations that follow them.
+
+        ``next_op_ids`` maps study ids to the positions to read the operations from when the
+        study has no snapshot (or its position is unknown). The result is the same as that of
+        :meth:`load_snapshot_and_operations` for each study, but implementations may read it with
+        a few queries for all studies.
+        """
+
+        return {
+            study_id: self.load_snapshot_and_operations(study_id, snapshot_name, next_op_id)
+            for study_id, next_op_id in next_op_ids.items()
+        }
@@ -1,15 +1,26 @@
+import base64
+import contextlib
+from datetime import datetime
 import fcntl
-import io
+import functools
+import itertools
 import json
 import os
 from pathlib import Path
 import random
 import shutil
+import socket
+import struct
+import threading
 import time
 from typing import Any
+from typing import BinaryIO
 from typing import Callable
+from typing import Dict
+from typing import IO
 from typing import List
 from typing import Optional
+from typing import Set
 from typing import Tuple
 import uuid
 
@@ -19,123 +30,261 @@ from sqlalchemy.engine import create_engine
 from sqlalchemy.engine import Engine
 from sqlalchemy import orm
 
+from optjournal import _codec
+from optjournal import _compaction
 from optjournal._database import Database
+from optjournal._metrics import MetricsSink
 from optjournal import _models
+from optjournal import _tracing
+from optjournal._tracing import Tracer
+
+# Snapshot files start with this magic followed by the snapshot's `next_op_id` (or -1 if unknown).
+_SNAPSHOT_MAGIC = b"OJSNAP1\n"
+_SNAPSHOT_HEADER = struct.Struct(">q")
+
+# Operation ids are `generation << _GENERATION_SHIFT | byte offset`, so that a position within a
+# journal file that has since been replaced by `compact` is recognized as such.
+_GENERATION_SHIFT = 40
+_OFFSET_MASK = (1 << _GENERATION_SHIFT) - 1
+
+# Links that haven't been renewed for this long are considered to be left behind by crashed
+# holders (see `LinkLock`).
+_LINK_LOCK_LEASE_SECONDS = 60.0
+_LINK_LOCK_TIMEOUT_SECONDS = 120.0
+# Waiters look for stale links at most this often, since it lists the lock directory.
+_LINK_LOCK_STALE_CHECK_INTERVAL_SECONDS = 1.0
+_LINK_LOCK_MIN_BACKOFF_SECONDS = 0.005
+_LINK_LOCK_MAX_BACKOFF_SECONDS = 1.0
+# Hyphens separate the parts of link names.
+_HOSTNAME = socket.gethostname().replace("-", "_")
+
+_logger = optuna.logging.get_logger(__name__)
 
 
 class FileSystemDatabase(Database):
-    def __init__(self, root_dir: str, avoid_flock: bool = False, fsync: bool = False) -> None:
+    def __init__(
+        self,
+        root_dir: str,
+        avoid_flock: bool = False,
+        fsync: bool = False,
+        compress_threshold: Optional[int] = None,
+        metrics: Optional[MetricsSink] = None,
+        tracer: Optional[Tracer] = None,
+    ) -> None:
         self._root_dir = Path(root_dir)
         self._root_dir.mkdir(parents=True, exist_ok=True)
+        self._fsync = fsync
+        # Lines of at least this many characters are written zlib-compressed.
+        self._compress_threshold = compress_threshold
+        self._file_lock: Callable[..., Any]
         if avoid_flock:
-            self._file_lock = LinkLockCreator(fsync=fsync)
+            self._file_lock = LinkLockCreator(fsync=fsync, metrics=metrics, tracer=tracer)
+        elif metrics is not None or tracer is not None:
+            self._file_lock = functools.partial(FcntlLock, metrics=metrics, tracer=tracer)
         else:
             self._file_lock = FcntlLock
 
-        if not self._index_path().exists():
-            with self._file_lock(open(self._index_path(), "w")) as f:
-                json.dump({"next_study_id": 0, "studies": {}}, f)
-
+        self._catalog = _Catalog(
+            self._root_dir.joinpath("catalog.log"),
+            self._root_dir.joinpath("index.json"),
+            self._file_lock,
+        )
         self._files = {}
+        self._generations = {}  # type: Dict[int, int]
+
+        if tracer is not None:
+            _tracing.trace_database(self, tracer)
 
     def create_study(self, study_name: str) -> _models.StudyModel:
-        with self._file_lock(open(self._index_path(), "r+")) as f:
-            index = json.load(f)
-            if study_name in index["studies"]:
+        def create(catalog: _Catalog) -> Tuple[List[Any], int]:
+            if study_name in catalog.names:
                 raise optuna.exceptions.DuplicatedStudyError()
 
-            study_id = index["next_study_id"]
-            index["next_study_id"] += 1
-            index["studies"][study_name] = study_id
-
-            f.seek(0)
-            json.dump(index, f)
-
+            study_id = catalog.next_study_id
             self._journal_path(study_id).parent.mkdir()
+            return ["create", study_id, study_name], study_id
 
-            return _models.StudyModel(id=study_id, name=study_name)
+        study_id = self._catalog.update(create)
+        return _models.StudyModel(id=study_id, name=study_name)
 
     def find_study(self, study_id: int) -> Optional[_models.StudyModel]:
-        with self._file_lock(open(self._index_path(), "r"), readonly=True) as f:
-            index = json.load(f)
-
-            for name, id in index["studies"].items():
-                if id == study_id:
-                    return _models.StudyModel(id=id, name=name)
-
+        name = self._catalog.get_name(study_id)
+        if name is None:
             return None
 
+        return _models.StudyModel(id=study_id, name=name)
+
     def find_study_by_name(self, study_name: str) -> Optional[_models.StudyModel]:
-        with self._file_lock(open(self._index_path(), "r"), readonly=True) as f:
-            index = json.load(f)
-            if study_name not in index["studies"]:
-                return None
+        study_id = self._catalog.get_id(study_name)
+        if study_id is None:
+            return None
 
-            study_id = index["studies"][study_name]
-            return _models.StudyModel(id=study_id, name=study_name)
+        return _models.StudyModel(id=study_id, name=study_name)
 
     def delete_study(self, study_id: int) -> Optional[_models.StudyModel]:
-        with self._file_lock(open(self._index_path(), "r+")) as f:
-            index = json.load(f)
+        def delete(catalog: _Catalog) -> Tuple[Optional[List[Any]], Optional[str]]:
+            study_name = catalog.ids.get(study_id)
+            if study_name is None:
+                return None, None
 
-            for study_name, id in index["studies"].items():
-                if id == study_id:
-                    del index["studies"][study_name]
+            return ["delete", study_id], study_name
 
-                    f.seek(0)
-                    json.dump(index, f)
-                    break
+        study_name = self._catalog.update(delete)
+        if study_name is None:
+            return None
 
-            shutil.rmtree(self._journal_path(study_id).parent)
+        shutil.rmtree(self._journal_path(study_id).parent)
 
-            if study_id in self._files:
-                self._files[study_id].close()
-                del self._files[study_id]
+        if study_id in self._files:
+            self._files[study_id].close()
+            del self._files[study_id]
+            del self._generations[study_id]
 
-            return _models.StudyModel(id=study_id, name=study_name)
+        return _models.StudyModel(id=study_id, name=study_name)
 
     def get_all_studies(self) -> List[_models.StudyModel]:
-        with self._file_lock(open(self._index_path(), "r"), readonly=True) as f:
-            index = json.load(f)
-            return [_models.StudyModel(id=id, name=name) for name, id in index["studies"].items()]
+        return [_models.StudyModel(id=id, name=name) for id, name in self._catalog.get_all()]
 
     def append_operations(self, ops: List[_models.OperationModel]) -> None:
-        study_ops = {}
+        study_ops: Dict[int, List[_models.OperationModel]] = {}
         for op in ops:
             if op.study_id not in study_ops:
                 study_ops[op.study_id] = []
 
             study_ops[op.study_id].append(op)
 
-        for study_id, ops in study_ops.items():
-            with self._file_lock(self._get_journal_file(study_id), close=False) as f:
-                f.seek(0, io.SEEK_END)
-                for op in ops:
-                    f.write(op.data)
-                    f.write("\n")
+        study_data = {
+            study_id: "".join(
+                _codec.compress(op.data, self._compress_threshold) + "\n" for op in ops
+            ).encode()
+            for study_id, ops in study_ops.items()
+        }
+        # The operations of all the studies are written or none, since callers that share a
+        # batch retry it as a whole. Journals are locked in the order of their study IDs, so that
+        # concurrent batches don't deadlock.
+        while True:
+            with contextlib.ExitStack() as stack:
+                try:
+                    files = []
+                    for study_id in sorted(study_data):
+                        f = stack.enter_context(
+                            self._file_lock(self._get_journal_file(study_id), close=False)
+                        )
+                        if not _is_same_file(f, self._journal_path(study_id)):
+                            raise _FileReplacedError(f.name)
+
+                        files.append((f, study_data[study_id]))
+                except _FileReplacedError:
+                    continue
+
+                sizes = []
+                try:
+                    for f, data in files:
+                        sizes.append((f, os.fstat(f.fileno()).st_size))
+                        _write(f, data)
+                except BaseException:
+                    for f, size in sizes:
+                        os.ftruncate(f.fileno(), size)
+                    raise
+                return
 
-    def read_operations(self, study_id: int, next_op_id: int) -> List[_models.OperationModel]:
+    def read_operations(self, study_id: int, next_op_id: int) -> List[_models.StoredOperation]:
         # Don't have to acquire lock here.
         f = self._get_journal_file(study_id)
+        generation = self._generations[study_id]
+        if next_op_id >> _GENERATION_SHIFT == generation:
+            offset = next_op_id & _OFFSET_MASK
+        else:
+            # The position belongs to a journal replaced by `compact`. Reading from the beginning
+            # lets the reader see the compaction markers and rebuild its state.
+            offset = 0
+
+        # The whole tail is fetched with a single read. Records are handed on as stored; decoding
+        # them is left to the consumer.
+        fd = f.fileno()
+        chunk = os.pread(fd, max(os.fstat(fd).st_size - offset, 0), offset)
+        end = chunk.rfind(b"\n") + 1
+        if end == 0:
+            return []
+
+        data = chunk[:end]
+        text = data.decode()
+        if len(text) == len(data):
+            # Both codecs write ASCII, for which character and byte offsets agree.
+            lines = text.split("\n")[:-1]
+            lengths = map(len, lines)
+        else:
+            raw_lines = data.split(b"\n")[:-1]
+            lines = [line.decode() for line in raw_lines]
+            lengths = map(len, raw_lines)
 
-        f.seek(next_op_id)
+        base = generation << _GENERATION_SHIFT
         ops = []
-        while True:
-            line = f.readline()
-            if line[-1:] != "\n":
-                break
-
-            data = json.loads(line)
-            ops.append(
-                _models.OperationModel(id=f.tell() - 1, study_id=study_id, data=json.dumps(data))
-            )
+        for line, length in zip(lines, lengths):
+            offset += length + 1
+            ops.append(_models.OperationRecord(base | (offset - 1), study_id, line))
 
         return ops
 
+    def compact(self, study_id: int, codec: str = "json") -> bool:
+        path = self._journal_path(study_id)
+        with open(path, "rb") as f:
+            data = f.read()
+            inode = os.fstat(f.fileno()).st_ino
+
+        end = data.rfind(b"\n") + 1
+        lines = [line.decode() for line in data[:end].split(b"\n")[:-1]]
+        if len(lines) == 0:
+            return False
+
+        generation = _compaction.parse_generation(lines[0])
+        ops = []
+        offset = 0
+        for line in lines:
+            offset += len(line.encode()) + 1
+            op_id = generation << _GENERATION_SHIFT | (offset - 1)
+            ops.append(_models.OperationRecord(op_id, study_id, line))
+
+        _, records = _compaction.compact_operations(
+            study_id, ops, _codec.get_codec(codec)
+        )
+        if len(records) >= len(ops):
+            return False
+
+        # Concurrent appenders are blocked only while the operations following the compacted
+        # prefix are copied.
+        tmp_path = path.with_name("{}.{}".format(path.name, uuid.uuid4()))
+        try:
+            with open(tmp_path, "wb") as tmp:
+                tmp.write(
+                    "".join(
+                        _codec.compress(record, self._compress_threshold) + "\n"
+                        for record in records
+                    ).encode()
+                )
+                with self._file_lock(open(path, "rb")) as f:
+                    if os.fstat(f.fileno()).st_ino != inode or not _is_same_file(f, path):
+                        return False
+
+                    f.seek(end)
+                    shutil.copyfileobj(f, tmp)
+                    tmp.flush()
+                    if self._fsync:
+                        os.fsync(tmp.fileno())
+                    os.replace(tmp_path, path)
+        finally:
+            if tmp_path.exists():
+                tmp_path.unlink()
+
+        return True
+
     def save_snapshot(self, snapshot: _models.SnapshotModel) -> None:
         path = self._snapshot_path(snapshot.study_id, snapshot.name)
         tmp_path = self._snapshot_path(snapshot.study_id, snapshot.name + "." + str(uuid.uuid4()))
+        next_op_id = snapshot.next_op_id if snapshot.next_op_id is not None else -1
         with open(tmp_path, 'wb') as f:
+            f.write(_SNAPSHOT_MAGIC)
+            f.write(_SNAPSHOT_HEADER.pack(next_op_id))
             f.write(snapshot.data)
         os.replace(tmp_path, path)
 
@@ -143,23 +292,120 @@ class FileSystemDatabase(Database):
         path = self._snapshot_path(study_id, snapshot_name)
         try:
             with open(path, 'rb') as f:
-                return _models.SnapshotModel(
-                    study_id=study_id,
-                    name=snapshot_name,
-                    data=f.read(),
-                )
+                data = f.read()
         except FileNotFoundError:
             return None
 
-    def _index_path(self):
-        return self._root_dir.joinpath("index.json")
+        next_op_id = None
+        if data.startswith(_SNAPSHOT_MAGIC):
+            offset = len(_SNAPSHOT_MAGIC)
+            (next_op_id,) = _SNAPSHOT_HEADER.unpack_from(data, offset)
+            data = data[offset + _SNAPSHOT_HEADER.size :]
+            if next_op_id < 0:
+                next_op_id = None
+
+        return _models.SnapshotModel(
+            study_id=study_id, name=snapshot_name, data=data, next_op_id=next_op_id
+        )
+
+    def save_study_summary(self, summary: _models.StudySummaryModel) -> None:
+        # The summary is bound to the journal file it was replayed from, which is only known if
+        # the positions of its operations belong to the journal opened by this process.
+        study_id = summary.study_id
+        if self._generations.get(study_id) != summary.next_op_id >> _GENERATION_SHIFT:
+            return
+
+        current = self._read_study_summary(study_id)
+        if current is not None and current["next_op_id"] >= summary.next_op_id:
+            return
+
+        datetime_start = summary.datetime_start
+        best_trial = summary.best_trial
+        data = {
+            "journal": os.fstat(self._files[study_id].fileno()).st_ino,
+            "next_op_id": summary.next_op_id,
+            "n_trials": summary.n_trials,
+            "datetime_start": None if datetime_start is None else datetime_start.isoformat(),
+            "directions": summary.directions,
+            "user_attrs": summary.user_attrs,
+            "system_attrs": summary.system_attrs,
+            "best_value": summary.best_value,
+            "best_trial": None if best_trial is None else base64.b64encode(best_trial).decode(),
+        }
+        path = self._summary_path(study_id)
+        tmp_path = path.with_name("{}.{}".format(path.name, uuid.uuid4()))
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    def load_study_summaries(
+        self,
+    ) -> List[Tuple[_models.StudyModel, Optional[_models.StudySummaryModel]]]:
+        result = []  # type: List[Tuple[_models.StudyModel, Optional[_models.StudySummaryModel]]]
+        for study in self.get_all_studies():
+            data = self._read_study_summary(study.id)
+            if data is not None:
+                try:
+                    stat = os.stat(self._journal_path(study.id))
+                except FileNotFoundError:
+                    data = None
+                else:
+                    # A compacted journal is a new file.
+                    offset = data["next_op_id"] & _OFFSET_MASK
+                    if stat.st_ino != data["journal"] or offset < stat.st_size:
+                        data = None
+
+            summary = None
+            if data is not None:
+                datetime_start = data["datetime_start"]
+                best_trial = data["best_trial"]
+                summary = _models.StudySummaryModel(
+                    study_id=study.id,
+                    next_op_id=data["next_op_id"],
+                    n_trials=data["n_trials"],
+                    datetime_start=(
+                        None if datetime_start is None else datetime.fromisoformat(datetime_start)
+                    ),
+                    directions=data["directions"],
+                    user_attrs=data["user_attrs"],
+                    system_attrs=data["system_attrs"],
+                    best_value=data["best_value"],
+                    best_trial=None if best_trial is None else base64.b64decode(best_trial),
+                )
+            result.append((study, summary))
+
+        return result
+
+    def _read_study_summary(self, study_id: int) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._summary_path(study_id)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
 
     def _journal_path(self, study_id: int):
         return self._root_dir.joinpath(str(study_id)).joinpath("journal.json")
 
+    def _summary_path(self, study_id: int) -> Path:
+        return self._root_dir.joinpath(str(study_id)).joinpath("summary.json")
+
     def _get_journal_file(self, study_id: int):
+        path = self._journal_path(study_id)
+        if study_id in self._files and not _is_same_file(self._files[study_id], path):
+            # Replaced by `compact`.
+            self._files[study_id].close()
+            del self._files[study_id]
+
         if study_id not in self._files:
-            self._files[study_id] = open(self._journal_path(study_id), "a+")
+            f = open(path, "ab+")
+            f.seek(0)
+            line = f.readline()
+            generation = 0
+            if line[-1:] == b"\n":
+                generation = _compaction.parse_generation(line.decode())
+
+            self._files[study_id] = f
+            self._generations[study_id] = generation
 
         return self._files[study_id]
 
@@ -167,17 +413,152 @@ class FileSystemDatabase(Database):
         return self._root_dir.joinpath(str(study_id)).joinpath(f"{snapshot_name}.snapshot")
 
 
+class _Catalog(object):
+    """The study catalog, cached in-process.
+
+    The catalog is an append-only log of JSON lines, ``["create", id, name]`` and
+    ``["delete", id]``. The cache only reads the part of the log it hasn't seen yet and is
+    dropped if the log file is replaced. Roots created with the former ``index.json`` catalog are
+    converted the first time they are opened.
+    """
+
+    def __init__(self, path: Path, legacy_index_path: Path, file_lock: Callable) -> None:
+        self._path = path
+        self._file_lock = file_lock
+        self._lock = threading.Lock()
+        self._file_key = None  # type: Optional[Tuple[int, int]]
+        self._offset = 0
+
+        self.names = {}  # type: Dict[str, int]
+        self.ids = {}  # type: Dict[int, str]
+        self.next_study_id = 0
+
+        if path.exists() and path.stat().st_size > 0:
+            return
+
+        with self._file_lock(open(path, "ab+")) as f:
+            if os.fstat(f.fileno()).st_size == 0 and legacy_index_path.exists():
+                with open(legacy_index_path) as index_file:
+                    index = json.load(index_file)
+
+                entries = [["create", id, name] for name, id in index["studies"].items()]
+                entries.append(["reserve", index["next_study_id"]])
+                f.write("".join(json.dumps(e) + "\n" for e in entries).encode())
+
+    def get_name(self, study_id: int) -> Optional[str]:
+        with self._lock:
+            self._refresh()
+            return self.ids.get(study_id)
+
+    def get_id(self, study_name: str) -> Optional[int]:
+        with self._lock:
+            self._refresh()
+            return self.names.get(study_name)
+
+    def get_all(self) -> List[Tuple[int, str]]:
+        with self._lock:
+            self._refresh()
+            return [(id, name) for name, id in self.names.items()]
+
+    def update(self, func: Callable[["_Catalog"], Tuple[Optional[List[Any]], Any]]) -> Any:
+        """Apply ``func`` to the up-to-date catalog and append the entry it returns."""
+
+        with self._file_lock(open(self._path, "ab+")) as f, self._lock:
+            self._read(f)
+            entry, result = func(self)
+            if entry is not None:
+                f.write((json.dumps(entry) + "\n").encode())
+                f.flush()
+                self._read(f)
+
+            return result
+
+    def _refresh(self) -> None:
+        # A single `stat` tells whether the cache is up to date.
+        stat = os.stat(self._path)
+        if (stat.st_dev, stat.st_ino) == self._file_key and stat.st_size == self._offset:
+            return
+
+        with open(self._path, "rb") as f:
+            self._read(f)
+
+    def _read(self, f: IO[bytes]) -> None:
+        fd = f.fileno()
+        stat = os.fstat(fd)
+        if (stat.st_dev, stat.st_ino) != self._file_key:
+            self._file_key = (stat.st_dev, stat.st_ino)
+            self._offset = 0
+            self.names = {}
+            self.ids = {}
+            self.next_study_id = 0
+
+        if stat.st_size <= self._offset:
+            return
+
+        data = os.pread(fd, stat.st_size - self._offset, self._offset)
+        end = data.rfind(b"\n") + 1
+        for line in data[:end].splitlines():
+            entry = json.loads(line)
+            if entry[0] == "create":
+                _, study_id, name = entry
+                self.names[name] = study_id
+                self.ids[study_id] = name
+                self.next_study_id = max(self.next_study_id, study_id + 1)
+            elif entry[0] == "delete":
+                name = self.ids.pop(entry[1])
+                del self.names[name]
+            elif entry[0] == "reserve":
+                self.next_study_id = max(self.next_study_id, entry[1])
+        self._offset += end
+
+
+class _FileReplacedError(Exception):
+    pass
+
+
+def _write(f: BinaryIO, data: bytes) -> None:
+    # Bypasses the buffer of `f`, so that nothing of a failed write is left to be flushed later.
+    f.flush()
+    view = memoryview(data)
+    while view:
+        view = view[os.write(f.fileno(), view) :]
+
+
+def _is_same_file(f: IO[bytes], path: Path) -> bool:
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return False
+
+    fstat = os.fstat(f.fileno())
+    return (stat.st_dev, stat.st_ino) == (fstat.st_dev, fstat.st_ino)
+
+
 class FcntlLock(object):
-    def __init__(self, file, readonly: bool = False, close: bool = True) -> None:
+    def __init__(
+        self,
+        file,
+        readonly: bool = False,
+        close: bool = True,
+        metrics: Optional[MetricsSink] = None,
+        tracer: Optional[Tracer] = None,
+    ) -> None:
         self._file = file
         self._readonly = readonly
         self._close = close
+        self._metrics = metrics
+        self._tracer = tracer
 
     def __enter__(self):
+        start = time.perf_counter()
         if self._readonly:
             fcntl.flock(self._file.fileno(), fcntl.LOCK_SH)
         else:
             fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+        if self._metrics is not None:
+            self._metrics.observe("file_lock.acquire_seconds", time.perf_counter() - start)
+        if self._tracer is not None:
+            self._tracer.record_span("file_lock", "lock", start, {"file": self._file.name})
 
         return self._file
 
@@ -190,40 +571,215 @@ class FcntlLock(object):
             self._file.close()
 
 
+class _HoldTimes(object):
+    """Moving average of how long the link locks of a process are held."""
+
+    def __init__(self) -> None:
+        self.average_seconds = _LINK_LOCK_MIN_BACKOFF_SECONDS
+
+    def observe(self, seconds: float) -> None:
+        self.average_seconds += 0.2 * (seconds - self.average_seconds)
+
+    def backoff_seconds(self, n_retries: int) -> float:
+        bound = max(self.average_seconds, _LINK_LOCK_MIN_BACKOFF_SECONDS) * 2 ** n_retries
+        return random.uniform(0, min(bound, _LINK_LOCK_MAX_BACKOFF_SECONDS))
+
+
+class _LeaseRenewer(object):
+    """Renews the held link locks of a ``LinkLockCreator`` periodically.
+
+    The thread is started by the first lock held and exits once none is held anymore (or in a
+    forked child, where it doesn't exist).
+    """
+
+    def __init__(self, interval_seconds: float) -> None:
+        self._interval_seconds = interval_seconds
+        self._lock = threading.Lock()
+        self._held: Set["LinkLock"] = set()
+        self._thread = None  # type: Optional[threading.Thread]
+
+    def add(self, lock: "LinkLock") -> None:
+        with self._lock:
+            self._held.add(lock)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name="optjournal-lease-renewer", daemon=True
+                )
+                self._thread.start()
+
+    def discard(self, lock: "LinkLock") -> None:
+        with self._lock:
+            self._held.discard(lock)
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self._interval_seconds)
+            with self._lock:
+                if not self._held:
+                    self._thread = None
+                    return
+                held = list(self._held)
+
+            for lock in held:
+                try:
+                    lock._renew()
+                except OSError as e:
+                    _logger.warning("Failed to renew a file lock: {!r}".format(e))
+
+
 class LinkLock(object):
+    """A file lock made of hard links, for file systems on which ``flock`` doesn't work.
+
+    The holder links the file into the ``lock/`` directory next to it, and holds the lock if its
+    link is the only one. Waiters back off for a random time up to a bound that starts at the
+    average hold time of the link locks of the process and doubles with every attempt, and give
+    up after ``timeout_seconds`` of the creator.
+
+    Link names are "<host>-<pid>-<creator id>-<serial>", and never reused. While the lock is
+    held, the holder renames its link every quarter of ``lease_seconds``. Waiters break a link
+    whose process has died (if it is of the same host), and one they have seen under the same
+    name, with the file unmodified, for ``lease_seconds`` of their own clock. Thus, clocks of
+    different hosts are never compared, and a holder is only broken if it has stopped renewing.
+    The latter also applies to links of older versions, which are named "<uuid>-<thread id>" and
+    not renewed.
+    """
+
     def __init__(
-        self,
-        file,
-        link_filename: str,
-        readonly: bool = False,
-        close: bool = True,
-        fsync: bool = False,
+        self, file, creator: "LinkLockCreator", readonly: bool = False, close: bool = True
     ) -> None:
-        self._link_filepath = os.path.join(os.path.dirname(file.name), "lock/", link_filename)
+        self._lock_dir = os.path.join(os.path.dirname(file.name), "lock")
         try:
-            os.mkdir(os.path.dirname(self._link_filepath))
+            os.mkdir(self._lock_dir)
         except FileExistsError:
             pass
 
         self._file = file
+        self._creator = creator
         self._close = close
         self._readonly = readonly
-        self._fsync = fsync
+        # Guards `_link_filepath` against renewals.
+        self._renew_lock = threading.Lock()
+        self._link_filepath = None  # type: Optional[str]
+        self._acquired_at = 0.0
+
+    def _new_link_filepath(self) -> str:
+        creator = self._creator
+        name = "{}-{}-{}-{}".format(_HOSTNAME, os.getpid(), creator._id, next(creator._serials))
+        return os.path.join(self._lock_dir, name)
 
     def _lock(self):
-        wait_ms = 10
-        for _ in range(30):
-            os.link(self._file.name, self._link_filepath)
-            if os.stat(self._file.fileno()).st_nlink == 2:
+        creator = self._creator
+        start = time.perf_counter()
+        checked_at = start
+        # Other links by name, with when they have been seen first and the file's mtime then.
+        seen = {}  # type: Dict[str, Tuple[float, int]]
+        n_retries = 0
+        while True:
+            link_filepath = self._new_link_filepath()
+            os.link(self._file.name, link_filepath)
+            stat = os.stat(link_filepath)
+            if stat.st_ino != os.fstat(self._file.fileno()).st_ino:
+                # The file has been replaced since it was opened.
+                os.unlink(link_filepath)
+                raise _FileReplacedError(self._file.name)
+            # The file itself and the link of this lock.
+            if stat.st_nlink == 2:
+                with self._renew_lock:
+                    self._link_filepath = link_filepath
+                creator._renewer.add(self)
+                self._acquired_at = time.perf_counter()
+                if creator._metrics is not None:
+                    creator._metrics.observe(
+                        "file_lock.acquire_seconds", self._acquired_at - start
+                    )
+                    creator._metrics.observe("file_lock.retries", n_retries)
+                if creator._tracer is not None:
+                    creator._tracer.record_span(
+                        "file_lock",
+                        "lock",
+                        start,
+                        {"file": self._file.name, "retries": n_retries},
+                    )
                 return
-            os.unlink(self._link_filepath)
-            time.sleep(random.uniform(0, wait_ms) / 1000)
-            wait_ms = min(wait_ms * 2, 10 * 1000)
 
-        raise RuntimeError("Cannot acquire file lock for {}".format(self._file.name))
+            os.unlink(link_filepath)
+            now = time.perf_counter()
+            if now - checked_at >= _LINK_LOCK_STALE_CHECK_INTERVAL_SECONDS:
+                checked_at = now
+                self._break_stale_links(seen, stat)
+            if now - start >= creator._timeout_seconds:
+                raise RuntimeError("Cannot acquire file lock for {}".format(self._file.name))
+
+            time.sleep(creator._hold_times.backoff_seconds(n_retries))
+            n_retries += 1
+
+    def _break_stale_links(self, seen: Dict[str, Tuple[float, int]], stat: os.stat_result) -> None:
+        now = time.perf_counter()
+        names = os.listdir(self._lock_dir)
+        for name in list(seen):
+            if name not in names:
+                del seen[name]
+
+        for name in names:
+            path = os.path.join(self._lock_dir, name)
+            try:
+                if os.stat(path).st_ino != stat.st_ino:
+                    # A link to another file of the directory.
+                    continue
+            except FileNotFoundError:
+                continue
+
+            parts = name.split("-")
+            dead = (
+                len(parts) == 4
+                and parts[0] == _HOSTNAME
+                and parts[1].isdigit()
+                and not _is_alive(int(parts[1]))
+            )
+            if not dead:
+                first_seen_at, mtime_ns = seen.setdefault(name, (now, stat.st_mtime_ns))
+                if mtime_ns != stat.st_mtime_ns:
+                    # The file has been written since, so the holder is alive.
+                    seen[name] = (now, stat.st_mtime_ns)
+                    continue
+                if now - first_seen_at < self._creator._lease_seconds:
+                    continue
+
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                # Released or renewed in the meantime.
+                continue
+            seen.pop(name, None)
+            _logger.warning("Broke the stale file lock {}.".format(path))
+
+    def _renew(self) -> None:
+        with self._renew_lock:
+            if self._link_filepath is None:
+                return
+
+            link_filepath = self._new_link_filepath()
+            try:
+                os.rename(self._link_filepath, link_filepath)
+            except FileNotFoundError:
+                _logger.warning("The file lock {} has been broken.".format(self._link_filepath))
+                self._link_filepath = None
+                return
+            self._link_filepath = link_filepath
 
     def _unlock(self):
-        os.unlink(self._link_filepath)
+        self._creator._renewer.discard(self)
+        self._creator._hold_times.observe(time.perf_counter() - self._acquired_at)
+        with self._renew_lock:
+            link_filepath = self._link_filepath
+            self._link_filepath = None
+        if link_filepath is None:
+            return
+
+        try:
+            os.unlink(link_filepath)
+        except FileNotFoundError:
+            _logger.warning("The file lock {} has been broken.".format(link_filepath))
 
     def __enter__(self):
         self._lock()
@@ -233,7 +789,7 @@ class LinkLock(object):
         try:
             if not self._readonly:
                 self._file.flush()
-                if self._fsync:
+                if self._creator._fsync:
                     os.fsync(self._file.fileno())
         finally:
             self._unlock()
@@ -242,10 +798,35 @@ class LinkLock(object):
             self._file.close()
 
 
+def _is_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
 class LinkLockCreator(object):
-    def __init__(self, fsync: bool = False):
-        self._id = str(uuid.uuid4())
+    def __init__(
+        self,
+        fsync: bool = False,
+        metrics: Optional[MetricsSink] = None,
+        tracer: Optional[Tracer] = None,
+        lease_seconds: float = _LINK_LOCK_LEASE_SECONDS,
+        timeout_seconds: float = _LINK_LOCK_TIMEOUT_SECONDS,
+    ):
+        self._id = uuid.uuid4().hex
         self._fsync = fsync
+        self._metrics = metrics
+        self._tracer = tracer
+        self._lease_seconds = lease_seconds
+        self._timeout_seconds = timeout_seconds
+        self._hold_times = _HoldTimes()
+        # Serial numbers of link names. Taking one is atomic.
+        self._serials = itertools.count()
+        self._renewer = _LeaseRenewer(lease_seconds / 4)
 
     def __call__(self, file, readonly: bool = False, close: bool = True) -> LinkLock:
-        return LinkLock(file, self._id, readonly, close, self._fsync)
+        return LinkLock(file, self, readonly, close)
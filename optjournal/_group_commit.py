@@ -0,0 +1,61 @@
+import threading
+from typing import Callable
+from typing import List
+from typing import Optional
+
+from optjournal import _models
+
+
+class _Request(object):
+    def __init__(self, ops: List[_models.OperationModel]) -> None:
+        self.ops = ops
+        self.done = False
+        self.error: Optional[BaseException] = None
+
+
+class _GroupCommit(object):
+    """Merges the writes of concurrent threads into a single ``append_operations`` call.
+
+    The first thread to commit becomes the leader and writes its operations. Threads that commit
+    in the meantime queue theirs and wait. Once the leader is done, one of the waiting threads
+    becomes the next leader and writes everything queued so far in one batch. ``append`` must
+    write a batch entirely or not at all, since its error is raised to every thread of it.
+    """
+
+    def __init__(self, append: Callable[[List[_models.OperationModel]], None]) -> None:
+        self._append = append
+        self._cond = threading.Condition()
+        self._pending = []  # type: List[_Request]
+        self._writing = False
+
+    def commit(self, ops: List[_models.OperationModel]) -> None:
+        request = _Request(ops)
+        with self._cond:
+            self._pending.append(request)
+            while not request.done and self._writing:
+                self._cond.wait()
+
+            if request.done:
+                if request.error is not None:
+                    raise request.error
+                return
+
+            batch = self._pending
+            self._pending = []
+            self._writing = True
+
+        error: Optional[BaseException] = None
+        try:
+            self._append([op for r in batch for op in r.ops])
+        except BaseException as e:
+            error = e
+        finally:
+            with self._cond:
+                for r in batch:
+                    r.done = True
+                    r.error = error
+                self._writing = False
+                self._cond.notify_all()
+
+        if error is not None:
+            raise error
@@ -1,21 +1,38 @@
 from datetime import datetime
+import json
+import pickle
 from typing import Any
 from typing import Dict
+from typing import Iterable
 from typing import List
+from typing import Optional
 import uuid
 
 import optuna
 
 from optjournal import _models
+from optjournal._study import _JournalCompactedError
+from optjournal._study import _Study
 from optjournal._study import _StudySummary
 
 
+_SNAPSHOT_NAME = "summary"
+
+
 class LazyStudySummary(object):
-    def __init__(self, study_id: int, study_name: str, storage: "JournalStorage") -> None:
+    def __init__(
+        self,
+        study_id: int,
+        study_name: str,
+        storage: "JournalStorage",
+        batch: Optional["_SummaryBatch"] = None,
+        summary: Optional[optuna.study.StudySummary] = None,
+    ) -> None:
         self.study_name = study_name
         self._study_id = study_id
         self._storage = storage
-        self._summary = None
+        self._batch = batch
+        self._summary = summary
 
     @property
     def direction(self) -> optuna.study.StudyDirection:
@@ -56,31 +73,109 @@ class LazyStudySummary(object):
         if self._summary is not None:
             return
 
-        snapshot = self._storage._db.load_snapshot(self._study_id, "summary")
+        if self._batch is not None:
+            self._batch.load()
+            return
+
+        snapshot, chunks = self._storage._db.load_snapshot_and_iter_operations(
+            self._study_id, _SNAPSHOT_NAME, 0
+        )
+        self._load(snapshot, chunks)
+
+    def _load(
+        self,
+        snapshot: Optional[_models.SnapshotModel],
+        chunks: Iterable[List[_models.StoredOperation]],
+    ) -> None:
         if snapshot is None:
             study = _StudySummary(self._study_id)
         else:
             study = _StudySummary.deserialize(snapshot.data)
 
         worker_id = str(uuid.uuid4())
-        ops = self._storage._db.read_operations(self._study_id, study.next_op_id)
-        for op in ops:
-            study.execute(op, worker_id)
-        if len(ops) > 0:
+        n_ops = 0
+        try:
+            for ops in chunks:
+                ops = [op for op in ops if op.id >= study.next_op_id]
+                study.execute_all(ops, worker_id)
+                n_ops += len(ops)
+        except _JournalCompactedError:
+            # The snapshot predates a compaction of the journal.
+            study = _StudySummary(self._study_id)
+            for ops in self._storage._db.iter_operations(self._study_id, 0):
+                study.execute_all(ops, worker_id)
+                n_ops += len(ops)
+        if n_ops > 0:
             self._storage._db.save_snapshot(_models.SnapshotModel(
                 study_id=self._study_id,
-                name="summary",
-                data=study.serialize()
+                name=_SNAPSHOT_NAME,
+                data=study.serialize(),
+                next_op_id=study.next_op_id,
             ))
 
-        self._summary = optuna.study.StudySummary(
-            study_name=self.study_name,
-            study_id=self._study_id,
-            direction=study.direction,
-            directions=study.directions,
-            best_trial=study.best_trial,
-            user_attrs=study.user_attrs,
-            system_attrs=study.system_attrs,
-            n_trials=study.n_trials,
-            datetime_start=study.datetime_start,
+        # The stored summary didn't cover the journal (or this wouldn't have been loaded).
+        model = make_summary_model(study)
+        self._storage._db.save_study_summary(model)
+        self._summary = to_study_summary(self.study_name, model)
+
+
+class _SummaryBatch(object):
+    """Loads the summaries of the studies returned by one ``get_all_study_summaries`` call.
+
+    The first summary that is accessed loads the snapshots and operations of all the summaries
+    that haven't been loaded yet with a single ``load_snapshots_and_operations`` call.
+    """
+
+    def __init__(self, storage: "JournalStorage") -> None:
+        self.summaries = []  # type: List[LazyStudySummary]
+        self._storage = storage
+
+    def load(self) -> None:
+        pending = {s._study_id: s for s in self.summaries if s._summary is None}
+        if len(pending) == 0:
+            return
+
+        results = self._storage._db.load_snapshots_and_operations(
+            _SNAPSHOT_NAME, {study_id: 0 for study_id in pending}
         )
+        for study_id, (snapshot, ops) in results.items():
+            pending[study_id]._load(snapshot, [ops])
+
+
+def make_summary_model(study: _Study) -> _models.StudySummaryModel:
+    if isinstance(study, _StudySummary):
+        n_trials = study.n_trials
+        datetime_start = study.datetime_start
+    else:
+        n_trials = len(study.trials)
+        datetime_start = study.trials[0].datetime_start if n_trials > 0 else None
+
+    best_trial = study.best_trial
+    return _models.StudySummaryModel(
+        study_id=study.study_id,
+        next_op_id=study.next_op_id,
+        n_trials=n_trials,
+        datetime_start=datetime_start,
+        directions=json.dumps([d.value for d in study.directions]),
+        user_attrs=json.dumps(study.user_attrs),
+        system_attrs=json.dumps(study.system_attrs),
+        best_value=None if best_trial is None else best_trial.value,
+        best_trial=None if best_trial is None else pickle.dumps(best_trial),
+    )
+
+
+def to_study_summary(
+    study_name: str, model: _models.StudySummaryModel
+) -> optuna.study.StudySummary:
+    directions = [optuna.study.StudyDirection(d) for d in json.loads(model.directions)]
+    return optuna.study.StudySummary(
+        study_name=study_name,
+        study_id=model.study_id,
+        direction=directions[0],
+        directions=directions,
+        best_trial=None if model.best_trial is None else pickle.loads(model.best_trial),
+        user_attrs=json.loads(model.user_attrs),
+        system_attrs=json.loads(model.system_attrs),
+        n_trials=model.n_trials,
+        datetime_start=model.datetime_start,
+    )
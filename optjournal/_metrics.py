@@ -0,0 +1,115 @@
+import abc
+import os
+from pathlib import Path
+import threading
+import time
+from typing import Callable
+from typing import Dict
+from typing import Tuple
+import uuid
+
+
+class MetricsSink(object, metaclass=abc.ABCMeta):
+    """Receives the measurements of storages and databases.
+
+    Storages and databases that are given a sink report the following values to it, with one
+    observation per event. Durations are in seconds.
+
+    JournalStorage:
+        ``sync.ops_flushed``, ``sync.bytes_flushed``: Buffered records written by a flush.
+        ``sync.ops_read``, ``sync.bytes_read``: Records read while catching up with the journal.
+        ``db.append_seconds``: Writing a flush, including the wait for a group commit.
+        ``db.read_seconds``: Reading a chunk of records.
+        ``study.decode_seconds``: Decoding the records of a chunk.
+        ``study.apply_seconds``: Applying a chunk of records to a study, including decoding.
+        ``storage.lock_wait_seconds``: Waiting for the lock of a study.
+        ``snapshot.load_seconds``, ``snapshot.save_seconds``: Loading (together with the first
+        records that follow) and saving a checkpoint, including (de)serialization.
+
+    FileSystemDatabase:
+        ``file_lock.acquire_seconds``: Acquiring a file lock.
+        ``file_lock.retries``: Failed attempts to acquire a link lock.
+
+    RDBDatabase:
+        ``db.retries``: Retried transactions.
+        ``db.retries_exhausted``: Transactions that failed after all retries.
+
+    Without a sink, nothing is measured.
+    """
+
+    @abc.abstractmethod
+    def observe(self, name: str, value: float) -> None:
+        raise NotImplementedError
+
+
+class CallbackSink(MetricsSink):
+    """Passes each observation to ``callback(name, value)``."""
+
+    def __init__(self, callback: Callable[[str, float], None]) -> None:
+        self._callback = callback
+
+    def observe(self, name: str, value: float) -> None:
+        self._callback(name, value)
+
+
+class InMemoryMetrics(MetricsSink):
+    """Aggregates the count, sum and maximum of the observations of each metric."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._metrics = {}  # type: Dict[str, Tuple[int, float, float]]
+
+    def observe(self, name: str, value: float) -> None:
+        with self._lock:
+            count, total, maximum = self._metrics.get(name, (0, 0.0, value))
+            self._metrics[name] = (count + 1, total + value, max(maximum, value))
+
+    def get(self, name: str) -> Tuple[int, float, float]:
+        """Return the ``(count, sum, max)`` of a metric."""
+
+        with self._lock:
+            return self._metrics.get(name, (0, 0.0, 0.0))
+
+    def snapshot(self) -> Dict[str, Tuple[int, float, float]]:
+        with self._lock:
+            return dict(self._metrics)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._metrics = {}
+
+
+class PrometheusTextfileSink(InMemoryMetrics):
+    """Writes the aggregated metrics for the textfile collector of the Prometheus node exporter.
+
+    Every metric is written as a summary named ``optjournal_<name>`` (with dots replaced by
+    underscores), at most every ``interval_seconds`` while observations come in and on
+    :meth:`write`. The file is replaced atomically.
+    """
+
+    def __init__(self, path: str, interval_seconds: float = 15.0) -> None:
+        super().__init__()
+        self._path = Path(path)
+        self._interval_seconds = interval_seconds
+        self._written_at = time.time()
+
+    def observe(self, name: str, value: float) -> None:
+        super().observe(name, value)
+        if time.time() - self._written_at >= self._interval_seconds:
+            self.write()
+
+    def write(self) -> None:
+        self._written_at = time.time()
+        lines = []
+        for name, (count, total, maximum) in sorted(self.snapshot().items()):
+            metric = "optjournal_" + name.replace(".", "_")
+            lines.append("# TYPE {} summary".format(metric))
+            lines.append("{}_count {}".format(metric, count))
+            lines.append("{}_sum {!r}".format(metric, total))
+            lines.append("# TYPE {}_max gauge".format(metric))
+            lines.append("{}_max {!r}".format(metric, maximum))
+
+        tmp_path = self._path.with_name("{}.{}".format(self._path.name, uuid.uuid4()))
+        with open(tmp_path, "w") as f:
+            f.write("".join(line + "\n" for line in lines))
+        os.replace(tmp_path, self._path)
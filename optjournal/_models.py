@@ -1,21 +1,30 @@
 from datetime import datetime
 from typing import Any
+from typing import NamedTuple
+from typing import Union
 
 from sqlalchemy import Column
 from sqlalchemy import DateTime
+from sqlalchemy.dialects import mysql
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy import Enum
 from sqlalchemy import Float
 from sqlalchemy import ForeignKey
+from sqlalchemy import Index
 from sqlalchemy import Integer
 from sqlalchemy import LargeBinary
 from sqlalchemy import String
+from sqlalchemy import Text
 from sqlalchemy import UniqueConstraint
 
 from optjournal._operation import _Operation
 
 _BaseModel = declarative_base()  # type: Any
 
+MAX_DATA_LENGTH = 4096
+
+_LongText = Text().with_variant(mysql.LONGTEXT(), "mysql")
+
 
 class StudyModel(_BaseModel):
     __tablename__ = "optjournal_studies"
@@ -26,9 +35,24 @@ class StudyModel(_BaseModel):
 
 class OperationModel(_BaseModel):
     __tablename__ = "optjournal_operations"
+    __table_args__ = (
+        Index("ix_optjournal_operations_study_id_seq", "study_id", "seq", unique=True),
+    )
     id = Column(Integer, primary_key=True)
     study_id = Column(Integer, ForeignKey("optjournal_studies.id"), index=True, nullable=False)
-    data = Column(String(4096), nullable=False)
+    data = Column(String(MAX_DATA_LENGTH), nullable=False)
+    # Holds the record instead of `data` (which is empty then) if it exceeds `MAX_DATA_LENGTH`.
+    large_data = Column(_LongText)
+    # Position of the operation within its study. NULL for operations written before it existed.
+    seq = Column(Integer)
+
+
+# A read-only operation. Databases may return these from `read_operations` instead of
+# `OperationModel`s, which are considerably more expensive to instantiate.
+OperationRecord = NamedTuple("OperationRecord", [("id", int), ("study_id", int), ("data", str)])
+
+# An operation as read from a database.
+StoredOperation = Union[OperationModel, OperationRecord]
 
 
 class SnapshotModel(_BaseModel):
@@ -38,3 +62,25 @@ class SnapshotModel(_BaseModel):
     study_id = Column(Integer, ForeignKey("optjournal_studies.id"), index=True, nullable=False)
     name = Column(String(256), index=True, nullable=False)
     data = Column(LargeBinary, nullable=False)
+    next_op_id = Column(Integer)
+
+
+class StudySummaryModel(_BaseModel):
+    """The summary of a study as of the operations before ``next_op_id``.
+
+    ``JournalStorage`` rewrites it after replaying trial state changes and study attribute updates
+    of its own. It is only used while no operation follows ``next_op_id``.
+    """
+
+    __tablename__ = "optjournal_study_summaries"
+    study_id = Column(Integer, ForeignKey("optjournal_studies.id"), primary_key=True)
+    next_op_id = Column(Integer, nullable=False)
+    n_trials = Column(Integer, nullable=False)
+    datetime_start = Column(DateTime)
+    # JSON lists and objects.
+    directions = Column(String(MAX_DATA_LENGTH), nullable=False)
+    user_attrs = Column(_LongText, nullable=False)
+    system_attrs = Column(_LongText, nullable=False)
+    best_value = Column(Float)
+    # Pickled.
+    best_trial = Column(LargeBinary)
@@ -0,0 +1,165 @@
+import random
+import threading
+from typing import Any
+from typing import Optional
+from typing import Tuple
+
+from sqlalchemy.exc import DBAPIError
+
+
+# SQLSTATEs of serialization failures, deadlocks and lock timeouts. Those of class 08 (connection
+# exceptions) are retried as well.
+_RETRYABLE_SQLSTATES = ("40001", "40P01", "55P03")
+# MySQL error codes of lock wait timeouts, deadlocks and lost connections.
+_RETRYABLE_MYSQL_ERRORS = (1205, 1213, 2006, 2013)
+# SQLite reports busy and locked databases only by message.
+_RETRYABLE_SQLITE_MESSAGES = ("database is locked", "database table is locked")
+
+
+class CheckpointPolicy(object):
+    """Decides when ``JournalStorage`` writes a full-state checkpoint of a study.
+
+    A checkpoint is taken after a sync once any of the configured thresholds has been reached
+    since the last checkpoint was loaded or saved by this process.
+
+    Args:
+        every_n_ops:
+            Number of applied operation records.
+        every_n_bytes:
+            Total size of the applied operation records.
+        every_n_seconds:
+            Elapsed wall-clock time.
+    """
+
+    def __init__(
+        self,
+        every_n_ops: Optional[int] = None,
+        every_n_bytes: Optional[int] = None,
+        every_n_seconds: Optional[float] = None,
+    ) -> None:
+        if every_n_ops is None and every_n_bytes is None and every_n_seconds is None:
+            raise ValueError("At least one checkpoint threshold must be specified.")
+
+        self.every_n_ops = every_n_ops
+        self.every_n_bytes = every_n_bytes
+        self.every_n_seconds = every_n_seconds
+
+    def should_checkpoint(self, n_ops: int, n_bytes: int, elapsed_seconds: float) -> bool:
+        if n_ops == 0:
+            return False
+
+        return (
+            (self.every_n_ops is not None and n_ops >= self.every_n_ops)
+            or (self.every_n_bytes is not None and n_bytes >= self.every_n_bytes)
+            or (self.every_n_seconds is not None and elapsed_seconds >= self.every_n_seconds)
+        )
+
+
+class SyncPolicy(object):
+    """Decides when ``JournalStorage`` syncs after writes that don't need an immediate sync.
+
+    Reporting intermediate values and setting trial or study attributes are applied to the local
+    state right away, and the buffered operations are only written to the database once any of
+    the configured thresholds has been reached. Without thresholds, such writes are synced with
+    the next trial creation, trial state change or explicit read from the remote storage.
+
+    Args:
+        interval_ms:
+            Maximum time since the last sync of the study, in milliseconds.
+        max_buffer_bytes:
+            Maximum size of the operations buffered for the study.
+    """
+
+    def __init__(
+        self, interval_ms: Optional[float] = None, max_buffer_bytes: Optional[int] = None
+    ) -> None:
+        self.interval_ms = interval_ms
+        self.max_buffer_bytes = max_buffer_bytes
+
+    def should_sync(self, n_bytes: int, elapsed_seconds: float) -> bool:
+        return (self.max_buffer_bytes is not None and n_bytes >= self.max_buffer_bytes) or (
+            self.interval_ms is not None and elapsed_seconds * 1000 >= self.interval_ms
+        )
+
+
+class RetryPolicy(object):
+    """Decides whether and when ``RDBDatabase`` retries a failed transaction.
+
+    Lock timeouts, deadlocks, serialization failures and lost connections are retried after an
+    exponentially growing delay. Each delay is drawn uniformly from zero up to its bound, so that
+    workers that failed together don't retry in lockstep. Other errors are raised right away.
+
+    The policy also counts the retries of all the databases that use it.
+
+    Args:
+        max_retries:
+            Maximum number of retries of a transaction.
+        base_delay_ms:
+            Upper bound of the delay before the first retry. It doubles with every retry.
+        max_delay_ms:
+            Upper bound of any delay.
+        deadline_ms:
+            Time since the first attempt of a transaction after which it is no longer retried.
+
+    Attributes:
+        n_retries:
+            Number of retries.
+        n_exhausted:
+            Number of transactions that failed with a retryable error after all their retries.
+        contention_seconds:
+            Time spent in failed attempts and in waiting between them.
+    """
+
+    def __init__(
+        self,
+        max_retries: int = 10,
+        base_delay_ms: float = 10,
+        max_delay_ms: float = 1000,
+        deadline_ms: Optional[float] = 60000,
+    ) -> None:
+        self.max_retries = max_retries
+        self.base_delay_ms = base_delay_ms
+        self.max_delay_ms = max_delay_ms
+        self.deadline_ms = deadline_ms
+
+        self.n_retries = 0
+        self.n_exhausted = 0
+        self.contention_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def is_retryable(self, error: BaseException) -> bool:
+        if not isinstance(error, DBAPIError):
+            return False
+        if error.connection_invalidated:
+            return True
+
+        orig = error.orig
+        sqlstate = getattr(orig, "pgcode", None) or getattr(orig, "sqlstate", None)
+        if sqlstate is not None:
+            return sqlstate in _RETRYABLE_SQLSTATES or sqlstate.startswith("08")
+
+        args: Tuple[Any, ...] = getattr(orig, "args", ())
+        if len(args) > 0 and isinstance(args[0], int):
+            return args[0] in _RETRYABLE_MYSQL_ERRORS
+
+        message = str(orig)
+        return any(m in message for m in _RETRYABLE_SQLITE_MESSAGES)
+
+    def delay_seconds(self, n_retries: int) -> float:
+        bound_ms = min(self.base_delay_ms * 2 ** n_retries, self.max_delay_ms)
+        return random.uniform(0, bound_ms) / 1000
+
+    def can_retry(self, n_retries: int, elapsed_seconds: float) -> bool:
+        return n_retries < self.max_retries and (
+            self.deadline_ms is None or elapsed_seconds * 1000 < self.deadline_ms
+        )
+
+    def _record_retry(self, seconds: float) -> None:
+        with self._lock:
+            self.n_retries += 1
+            self.contention_seconds += seconds
+
+    def _record_exhausted(self, seconds: float) -> None:
+        with self._lock:
+            self.n_exhausted += 1
+            self.contention_seconds += seconds
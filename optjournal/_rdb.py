@@ -1,27 +1,119 @@
+import time
 from typing import Any
 from typing import Callable
+from typing import Dict
+from typing import Iterator
 from typing import List
 from typing import Optional
 from typing import Tuple
 
 import optuna
+from sqlalchemy import and_
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy import asc
+from sqlalchemy import bindparam
 from sqlalchemy.engine import create_engine
 from sqlalchemy.engine import Engine
+from sqlalchemy.engine.url import make_url
+from sqlalchemy import func
+from sqlalchemy import inspect
+from sqlalchemy import Integer
+from sqlalchemy import literal
+from sqlalchemy import literal_column
+from sqlalchemy import null
 from sqlalchemy import orm
+from sqlalchemy import select
+from sqlalchemy import String
+from sqlalchemy import Text
+from sqlalchemy import union_all
 
+from optjournal import _codec
+from optjournal import _compaction
 from optjournal._database import Database
+from optjournal._metrics import MetricsSink
 from optjournal import _models
 from optjournal._models import _BaseModel
+from optjournal._policy import RetryPolicy
+from optjournal import _sqlite
+from optjournal._sqlite import SQLiteOptions
+from optjournal import _tracing
+from optjournal._tracing import Tracer
 
-MAX_RETRY_COUNT = 2
+
+_APPEND_MODES = ("lock", "optimistic")
+
+_DELETE_CHUNK_SIZE = 500
+# Number of studies loaded by a single query of `load_snapshots_and_operations`.
+_STUDY_BATCH_SIZE = 500
+_READ_CHUNK_SIZE = 1000
 
 
 class RDBDatabase(Database):
-    def __init__(self, database_url: str) -> None:
-        self._engine = create_engine(database_url)
+    """A database on top of SQLAlchemy.
+
+    Args:
+        database_url:
+            SQLAlchemy database URL.
+        append_mode:
+            How concurrent appends to a study are ordered. ``"lock"`` locks the first operation
+            row of the study. ``"optimistic"`` takes no lock: it inserts with the next sequence
+            number of the study and retries if another writer has taken that number meanwhile.
+            Both modes can be used against the same database.
+        retry_policy:
+            Retry policy of failed transactions. Conflicts between optimistic appends are always
+            retried under it.
+        sqlite_options:
+            Connection settings for a SQLite database (see
+            :class:`~optjournal.SQLiteOptions`). By default, SQLAlchemy's defaults are used.
+        compress_threshold:
+            If given, records of at least this many characters are written zlib-compressed.
+        metrics:
+            Sink of retry counts (see :class:`~optjournal.MetricsSink`).
+        tracer:
+            Tracer of the calls to the database (see :class:`~optjournal.Tracer`).
+
+    Records longer than ``MAX_DATA_LENGTH`` characters are stored in a separate text column.
+    """
+
+    def __init__(
+        self,
+        database_url: str,
+        append_mode: str = "lock",
+        retry_policy: Optional[RetryPolicy] = None,
+        sqlite_options: Optional[SQLiteOptions] = None,
+        compress_threshold: Optional[int] = None,
+        metrics: Optional[MetricsSink] = None,
+        tracer: Optional[Tracer] = None,
+    ) -> None:
+        if append_mode not in _APPEND_MODES:
+            raise ValueError(
+                "Unknown append mode: {!r} (available: {}).".format(append_mode, _APPEND_MODES)
+            )
+
+        self._append_mode = append_mode
+        self._retry_policy = retry_policy or RetryPolicy()
+        self._compress_threshold = compress_threshold
+        self._metrics = metrics
+        if sqlite_options is None:
+            self._engine = create_engine(database_url)
+        else:
+            url = make_url(database_url)
+            if url.get_backend_name() != "sqlite":
+                raise ValueError("SQLite options are given for {!r}.".format(database_url))
+            self._engine = _sqlite.create_sqlite_engine(url, sqlite_options)
         self._scoped_session = orm.scoped_session(orm.sessionmaker(bind=self._engine))
         _BaseModel.metadata.create_all(self._engine)
+        _migrate(self._engine)
+
+        self._wal_checkpointer = None  # type: Optional[_sqlite._WalCheckpointer]
+        if sqlite_options is not None and sqlite_options.checkpoint_interval_ms is not None:
+            self._wal_checkpointer = _sqlite._WalCheckpointer(
+                self, sqlite_options.checkpoint_interval_ms / 1000
+            )
+            self._wal_checkpointer.start()
+
+        if tracer is not None:
+            _tracing.trace_database(self, tracer)
 
     def create_study(self, study_name: str) -> _models.StudyModel:
         return self._retry(lambda: self._create_study(study_name))
@@ -39,11 +131,112 @@ class RDBDatabase(Database):
         return self._retry(lambda: self._get_all_studies())
 
     def append_operations(self, ops: List[_models.OperationModel]) -> None:
-        self._retry(lambda: self._append_operations(ops))
+        if self._append_mode == "optimistic":
+            append = self._append_operations_optimistically
+        else:
+            append = self._append_operations
+        self._retry(lambda: append(ops), retry_on_conflict=True)
 
-    def read_operations(self, study_id: int, next_op_id: int) -> List[_models.OperationModel]:
+    def read_operations(self, study_id: int, next_op_id: int) -> List[_models.StoredOperation]:
         return self._retry(lambda: self._read_operations(study_id, next_op_id))
 
+    def iter_operations(
+        self, study_id: int, next_op_id: int
+    ) -> Iterator[List[_models.StoredOperation]]:
+        # Chunks are read by keyset pagination rather than through a server-side cursor, so that
+        # no read transaction stays open (and, with SQLite, blocks writers) while the caller
+        # applies a chunk.
+        while True:
+            ops = self._retry(
+                lambda: self._read_operations(study_id, next_op_id, _READ_CHUNK_SIZE)
+            )
+            if len(ops) > 0:
+                yield ops
+            if len(ops) < _READ_CHUNK_SIZE:
+                return
+
+            next_op_id = ops[-1].id + 1
+
+    def compact(self, study_id: int, codec: str = "json") -> bool:
+        ops = self.read_operations(study_id, 0)
+        if len(ops) == 0:
+            return False
+
+        generation, records = _compaction.compact_operations(
+            study_id, ops, _codec.get_codec(codec)
+        )
+        if len(records) + 1 >= len(ops):
+            return False
+
+        op_ids = [op.id for op in ops]
+        return self._retry(
+            lambda: self._replace_operations(study_id, op_ids, generation, records, codec)
+        )
+
+    def save_snapshot(self, snapshot: _models.SnapshotModel) -> None:
+        # Concurrent first saves of a snapshot conflict on its unique key, and the retry updates
+        # the row inserted by the other writer.
+        self._retry(lambda: self._save_snapshot(snapshot), retry_on_conflict=True)
+
+    def load_snapshot(self, study_id: int, snapshot_name: str) -> Optional[_models.SnapshotModel]:
+        return self._retry(lambda: self._load_snapshot(study_id, snapshot_name))
+
+    def save_study_summary(self, summary: _models.StudySummaryModel) -> None:
+        # Like snapshots, concurrent first saves conflict on the primary key.
+        self._retry(lambda: self._save_study_summary(summary), retry_on_conflict=True)
+
+    def load_study_summaries(
+        self,
+    ) -> List[Tuple[_models.StudyModel, Optional[_models.StudySummaryModel]]]:
+        return self._retry(lambda: self._load_study_summaries())
+
+    def load_snapshot_and_operations(
+        self, study_id: int, snapshot_name: str, next_op_id: int
+    ) -> Tuple[Optional[_models.SnapshotModel], List[_models.StoredOperation]]:
+        return self._retry(
+            lambda: self._load_snapshot_and_operations(study_id, snapshot_name, next_op_id)
+        )
+
+    def load_snapshot_and_iter_operations(
+        self, study_id: int, snapshot_name: str, next_op_id: int
+    ) -> Tuple[Optional[_models.SnapshotModel], Iterator[List[_models.StoredOperation]]]:
+        snapshot, ops = self._retry(
+            lambda: self._load_snapshot_and_operations(
+                study_id, snapshot_name, next_op_id, _READ_CHUNK_SIZE
+            )
+        )
+        return snapshot, self._iter_operations_from(study_id, ops)
+
+    def load_snapshots_and_operations(
+        self, snapshot_name: str, next_op_ids: Dict[int, int]
+    ) -> Dict[int, Tuple[Optional[_models.SnapshotModel], List[_models.StoredOperation]]]:
+        study_ids = list(next_op_ids)
+        results = {}
+        for i in range(0, len(study_ids), _STUDY_BATCH_SIZE):
+            batch = {
+                study_id: next_op_ids[study_id]
+                for study_id in study_ids[i : i + _STUDY_BATCH_SIZE]
+            }
+            results.update(
+                self._retry(lambda: self._load_snapshots_and_operations(snapshot_name, batch))
+            )
+
+        return results
+
+    def _iter_operations_from(
+        self, study_id: int, ops: List[_models.StoredOperation]
+    ) -> Iterator[List[_models.StoredOperation]]:
+        if len(ops) > 0:
+            yield ops
+        if len(ops) >= _READ_CHUNK_SIZE:
+            yield from self.iter_operations(study_id, ops[-1].id + 1)
+
+    def _checkpoint_wal(self) -> None:
+        # A passive checkpoint copies as much of the WAL as it can without waiting for readers or
+        # the writer.
+        with self._engine.connect() as conn:
+            conn.execute("PRAGMA wal_checkpoint(PASSIVE)")
+
     def _create_study(self, study_name: str) -> _models.StudyModel:
         model = _models.StudyModel(name=study_name)
         session = self._scoped_session()
@@ -63,17 +256,23 @@ class RDBDatabase(Database):
         session = self._scoped_session()
         model = (
             session.query(_models.StudyModel)
-            .filter(_models.Studymodel.id == study_id)
+            .filter(_models.StudyModel.id == study_id)
             .one_or_none()
         )
         if model is None:
             session.commit()
             return None
 
-        session.delete(model)
         session.query(_models.OperationModel).filter(
             _models.OperationModel.study_id == study_id
         ).delete()
+        session.query(_models.SnapshotModel).filter(
+            _models.SnapshotModel.study_id == study_id
+        ).delete()
+        session.query(_models.StudySummaryModel).filter(
+            _models.StudySummaryModel.study_id == study_id
+        ).delete()
+        session.delete(model)
         session.commit()
 
         return model
@@ -81,9 +280,11 @@ class RDBDatabase(Database):
     def _get_all_studies(self) -> List[_models.StudyModel]:
         session = self._scoped_session()
         cls = _models.StudyModel
-        models = session.query(cls).all()
+        # Models of the session expire on commit, and reading their attributes afterwards would
+        # query each study again.
+        rows = session.query(cls.id, cls.name).all()
         session.commit()
-        return models
+        return [cls(id=id, name=name) for id, name in rows]
 
     def _append_operations(self, ops: List[_models.OperationModel]) -> None:
         if len(ops) == 0:
@@ -91,42 +292,430 @@ class RDBDatabase(Database):
 
         session = self._scoped_session()
 
-        study_id = ops[0].study_id
+        # A batch may contain operations of several studies. Their locks are taken in the order
+        # of study ids to avoid deadlocks between concurrent batches.
         cls = _models.OperationModel
+        study_ids = sorted(set(op.study_id for op in ops))
+        for study_id in study_ids:
+            (
+                session.query(cls)
+                .filter(cls.study_id == study_id)
+                .order_by(asc(cls.id))
+                .with_for_update()
+                .first()
+            )
 
-        model = (
+        session.execute(_INSERT_OPERATION, self._insert_parameters(ops))
+        session.commit()
+
+    def _append_operations_optimistically(self, ops: List[_models.OperationModel]) -> None:
+        if len(ops) == 0:
+            return
+
+        with self._engine.begin() as conn:
+            conn.execute(_INSERT_OPERATION, self._insert_parameters(ops))
+
+    def _insert_parameters(self, ops: List[_models.OperationModel]) -> List[Dict[str, Any]]:
+        return [
+            dict(
+                study_id=op.study_id,
+                **_data_values(_codec.compress(op.data, self._compress_threshold))
+            )
+            for op in ops
+        ]
+
+    def _read_operations(
+        self, study_id: int, next_op_id: int, limit: Optional[int] = None
+    ) -> List[_models.StoredOperation]:
+        session = self._scoped_session()
+
+        # Only the needed columns are selected. Instantiating models would cost far more than
+        # the query itself.
+        ops = _models.OperationModel.__table__
+        query = (
+            select([ops.c.id, ops.c.data, ops.c.large_data])
+            .where(and_(ops.c.study_id == study_id, ops.c.id >= next_op_id))
+            .order_by(ops.c.id)
+            .limit(limit)
+        )
+        rows = session.execute(query).fetchall()
+        session.commit()
+
+        return [
+            _models.OperationRecord(id, study_id, data if large_data is None else large_data)
+            for id, data, large_data in rows
+        ]
+
+    def _replace_operations(
+        self, study_id: int, op_ids: List[int], generation: int, records: List[str], codec: str
+    ) -> bool:
+        session = self._scoped_session()
+
+        # Block appenders of this study in the same way as `_append_operations` does.
+        cls = _models.OperationModel
+        (
             session.query(cls)
             .filter(cls.study_id == study_id)
             .order_by(asc(cls.id))
             .with_for_update()
             .first()
         )
-        session.add_all(ops)
+
+        current_op_ids = [
+            op_id
+            for (op_id,) in session.query(cls.id)
+            .filter(cls.study_id == study_id, cls.id <= op_ids[-1])
+            .order_by(asc(cls.id))
+        ]
+        if current_op_ids != op_ids:
+            # Compacted by someone else in the meantime.
+            session.commit()
+            return False
+
+        # The first row (the append lock anchor) only holds a marker, and the compacted records
+        # take the highest ids of the prefix. Thus, a reader whose position lies within the old
+        # prefix always encounters a marker and notices the compaction.
+        updates = [(op_ids[0], _compaction.marker_record(generation, _codec.get_codec(codec)))]
+        updates.extend(
+            zip(
+                op_ids[-len(records) :],
+                [_codec.compress(record, self._compress_threshold) for record in records],
+            )
+        )
+        for op_id, data in updates:
+            session.query(cls).filter(cls.id == op_id).update(
+                _data_values(data), synchronize_session=False
+            )
+
+        deleted = op_ids[1 : -len(records)]
+        for i in range(0, len(deleted), _DELETE_CHUNK_SIZE):
+            session.query(cls).filter(cls.id.in_(deleted[i : i + _DELETE_CHUNK_SIZE])).delete(
+                synchronize_session=False
+            )
+
         session.commit()
+        return True
 
-    def _read_operations(self, study_id: int, next_op_id: int) -> List[_models.OperationModel]:
+    def _save_snapshot(self, snapshot: _models.SnapshotModel) -> None:
         session = self._scoped_session()
 
-        cls = _models.OperationModel
-        models = (
-            session.query(cls)
-            .filter(cls.study_id == study_id, cls.id >= next_op_id)
-            .order_by(asc(cls.id))
-            .all()
+        cls = _models.SnapshotModel
+        current = (
+            session.query(cls.id, cls.next_op_id)
+            .filter(cls.study_id == snapshot.study_id, cls.name == snapshot.name)
+            .one_or_none()
+        )
+        if current is None:
+            session.add(
+                cls(
+                    study_id=snapshot.study_id,
+                    name=snapshot.name,
+                    data=snapshot.data,
+                    next_op_id=snapshot.next_op_id,
+                )
+            )
+        elif (
+            current.next_op_id is None
+            or snapshot.next_op_id is None
+            or current.next_op_id < snapshot.next_op_id
+        ):
+            session.query(cls).filter(cls.id == current.id).update(
+                {cls.data: snapshot.data, cls.next_op_id: snapshot.next_op_id},
+                synchronize_session=False,
+            )
+        else:
+            # The stored snapshot already covers the same (or a longer) journal prefix.
+            pass
+
+        session.commit()
+
+    def _save_study_summary(self, summary: _models.StudySummaryModel) -> None:
+        session = self._scoped_session()
+
+        cls = _models.StudySummaryModel
+        values = {
+            column.name: getattr(summary, column.name) for column in cls.__table__.columns
+        }
+        # The row is left as it is if it already covers the same (or a longer) journal prefix.
+        updated = session.execute(
+            cls.__table__.update()
+            .where(and_(cls.study_id == summary.study_id, cls.next_op_id < summary.next_op_id))
+            .values(**values)
+        )
+        if updated.rowcount == 0:
+            exists = session.query(cls.study_id).filter(cls.study_id == summary.study_id).first()
+            if exists is None:
+                session.execute(cls.__table__.insert().values(**values))
+
+        session.commit()
+
+    def _load_study_summaries(
+        self,
+    ) -> List[Tuple[_models.StudyModel, Optional[_models.StudySummaryModel]]]:
+        studies = _models.StudyModel.__table__
+        summaries = _models.StudySummaryModel.__table__
+        ops = _models.OperationModel.__table__
+
+        last_op_id = (
+            select([func.max(ops.c.id)])
+            .where(ops.c.study_id == studies.c.id)
+            .as_scalar()
+            .label("last_op_id")
+        )
+        query = (
+            select([studies.c.id, studies.c.name, last_op_id] + list(summaries.c))
+            .select_from(
+                studies.outerjoin(summaries, summaries.c.study_id == studies.c.id)
+            )
+            .order_by(studies.c.id)
+        )
+
+        session = self._scoped_session()
+        rows = session.execute(query).fetchall()
+        session.commit()
+
+        result = []  # type: List[Tuple[_models.StudyModel, Optional[_models.StudySummaryModel]]]
+        for row in rows:
+            study = _models.StudyModel(id=row[studies.c.id], name=row[studies.c.name])
+            summary = None
+            next_op_id = row[summaries.c.next_op_id]
+            if next_op_id is not None and (
+                row["last_op_id"] is None or row["last_op_id"] < next_op_id
+            ):
+                summary = _models.StudySummaryModel(
+                    **{column.name: row[column] for column in summaries.c}
+                )
+            result.append((study, summary))
+
+        return result
+
+    def _load_snapshot(self, study_id: int, snapshot_name: str) -> Optional[_models.SnapshotModel]:
+        session = self._scoped_session()
+
+        cls = _models.SnapshotModel
+        model = (
+            session.query(cls).filter(cls.study_id == study_id, cls.name == snapshot_name)
+        ).one_or_none()
+        session.commit()
+
+        return model
+
+    def _load_snapshot_and_operations(
+        self, study_id: int, snapshot_name: str, next_op_id: int, limit: Optional[int] = None
+    ) -> Tuple[Optional[_models.SnapshotModel], List[_models.StoredOperation]]:
+        session = self._scoped_session()
+
+        # A single `UNION ALL` statement returns the snapshot row (kind=0) followed by the
+        # operations after it (kind=1), so both are read from the same database state.
+        snapshots = _models.SnapshotModel.__table__
+        ops = _models.OperationModel.__table__
+        is_target_snapshot = and_(
+            snapshots.c.study_id == study_id, snapshots.c.name == snapshot_name
+        )
+        start = select([snapshots.c.next_op_id]).where(is_target_snapshot).as_scalar()
+        query = union_all(
+            select(
+                [
+                    literal(1).label("kind"),
+                    ops.c.id.label("id"),
+                    ops.c.data.label("data"),
+                    ops.c.large_data.label("large_data"),
+                    null().label("blob"),
+                ]
+            ).where(
+                and_(ops.c.study_id == study_id, ops.c.id >= func.coalesce(start, next_op_id))
+            ),
+            select(
+                [
+                    literal(0),
+                    snapshots.c.next_op_id,
+                    null().label("no_data"),
+                    null().label("no_large_data"),
+                    snapshots.c.data.label("blob"),
+                ]
+            ).where(is_target_snapshot),
+        ).order_by(literal_column("kind"), literal_column("id"))
+        if limit is not None:
+            # One more row for the snapshot, if any.
+            query = query.limit(limit + 1)
+        rows = session.execute(query).fetchall()
+        session.commit()
+
+        snapshot = None
+        models = []
+        for kind, id, data, large_data, blob in rows:
+            if kind == 0:
+                snapshot = _models.SnapshotModel(
+                    study_id=study_id, name=snapshot_name, data=blob, next_op_id=id
+                )
+            else:
+                if large_data is not None:
+                    data = large_data
+                models.append(_models.OperationRecord(id, study_id, data))
+
+        return snapshot, models[:limit]
+
+    def _load_snapshots_and_operations(
+        self, snapshot_name: str, next_op_ids: Dict[int, int]
+    ) -> Dict[int, Tuple[Optional[_models.SnapshotModel], List[_models.StoredOperation]]]:
+        session = self._scoped_session()
+
+        # Like `_load_snapshot_and_operations`, but for many studies. The operations are read
+        # from the snapshot of their study (a correlated subquery) or, if there is none, from the
+        # smallest of the given positions and filtered further below.
+        snapshots = _models.SnapshotModel.__table__
+        ops = _models.OperationModel.__table__
+        study_ids = list(next_op_ids)
+        start = (
+            select([snapshots.c.next_op_id])
+            .where(and_(snapshots.c.study_id == ops.c.study_id, snapshots.c.name == snapshot_name))
+            .as_scalar()
         )
+        query = union_all(
+            select(
+                [
+                    literal(1).label("kind"),
+                    ops.c.study_id.label("study_id"),
+                    ops.c.id.label("id"),
+                    ops.c.data.label("data"),
+                    ops.c.large_data.label("large_data"),
+                    null().label("blob"),
+                ]
+            ).where(
+                and_(
+                    ops.c.study_id.in_(study_ids),
+                    ops.c.id >= func.coalesce(start, min(next_op_ids.values())),
+                )
+            ),
+            select(
+                [
+                    literal(0),
+                    snapshots.c.study_id,
+                    snapshots.c.next_op_id,
+                    null().label("no_data"),
+                    null().label("no_large_data"),
+                    snapshots.c.data.label("blob"),
+                ]
+            ).where(and_(snapshots.c.study_id.in_(study_ids), snapshots.c.name == snapshot_name)),
+        ).order_by(literal_column("kind"), literal_column("id"))
+        rows = session.execute(query).fetchall()
         session.commit()
 
-        return models
+        loaded_snapshots = {}  # type: Dict[int, _models.SnapshotModel]
+        models = {study_id: [] for study_id in study_ids}  # type: Dict[int, List[Any]]
+        for kind, study_id, id, data, large_data, blob in rows:
+            if kind == 0:
+                loaded_snapshots[study_id] = _models.SnapshotModel(
+                    study_id=study_id, name=snapshot_name, data=blob, next_op_id=id
+                )
+                continue
+
+            snapshot = loaded_snapshots.get(study_id)
+            if (snapshot is None or snapshot.next_op_id is None) and id < next_op_ids[study_id]:
+                continue
+            if large_data is not None:
+                data = large_data
+            models[study_id].append(_models.OperationRecord(id, study_id, data))
+
+        return {
+            study_id: (loaded_snapshots.get(study_id), models[study_id]) for study_id in study_ids
+        }
+
+    def _retry(self, func: Callable[[], Any], retry_on_conflict: bool = False) -> Any:
+        # With `retry_on_conflict`, a unique key violation is a conflict: another writer has taken
+        # the same sequence number of an operation (e.g., under snapshot isolation, both have
+        # computed it from the same `max(seq)`), or has inserted the same snapshot or summary
+        # first. Those are the only unique keys the retried calls can violate. Other integrity
+        # errors, such as appending to a deleted study, are raised right away.
+        policy = self._retry_policy
+        start = time.perf_counter()
+        n_retries = 0
+        while True:
+            attempt_start = time.perf_counter()
+            try:
+                return func()
+            except Exception as e:
+                self._scoped_session().rollback()
+
+                conflict = retry_on_conflict and _is_unique_violation(e)
+                if not (conflict or policy.is_retryable(e)):
+                    raise
 
-    def _retry(self, func: Callable[[], Any], retry_count: int = 0) -> Any:
-        try:
-            return func()
-        except:
-            session = self._scoped_session()
-            session.rollback()
+                if not policy.can_retry(n_retries, time.perf_counter() - start):
+                    policy._record_exhausted(time.perf_counter() - attempt_start)
+                    if self._metrics is not None:
+                        self._metrics.observe("db.retries_exhausted", 1)
+                    raise
 
-            if retry_count >= MAX_RETRY_COUNT:
-                raise
+                time.sleep(policy.delay_seconds(n_retries))
+                policy._record_retry(time.perf_counter() - attempt_start)
+                if self._metrics is not None:
+                    self._metrics.observe("db.retries", 1)
+                n_retries += 1
 
-            retry_count += 1
-            self._retry(func, retry_count)
+
+def _make_insert_operation() -> Any:
+    # The sequence number is computed by the inserting statement itself, so that databases that
+    # take their write lock on the first write (e.g., SQLite) never see a conflict.
+    table = _models.OperationModel.__table__
+    study_id = bindparam("study_id", type_=Integer)
+    next_seq = func.coalesce(func.max(table.c.seq) + 1, 0)
+    return table.insert().from_select(
+        ["study_id", "data", "large_data", "seq"],
+        select(
+            [
+                study_id,
+                bindparam("data", type_=String),
+                bindparam("large_data", type_=Text),
+                next_seq,
+            ]
+        ).where(table.c.study_id == study_id),
+    )
+
+
+_INSERT_OPERATION = _make_insert_operation()
+
+
+def _is_unique_violation(error: BaseException) -> bool:
+    if not isinstance(error, IntegrityError):
+        return False
+
+    orig = error.orig
+    sqlstate = getattr(orig, "pgcode", None) or getattr(orig, "sqlstate", None)
+    if sqlstate is not None:
+        return sqlstate == "23505"
+
+    # MySQL reports duplicate entries with error code 1062, and SQLite only by message.
+    args: Tuple[Any, ...] = getattr(orig, "args", ())
+    if len(args) > 0 and isinstance(args[0], int):
+        return args[0] == 1062
+    return str(orig).startswith("UNIQUE constraint failed")
+
+
+def _data_values(record: str) -> Dict[str, Optional[str]]:
+    if len(record) > _models.MAX_DATA_LENGTH:
+        return {"data": "", "large_data": record}
+
+    return {"data": record, "large_data": None}
+
+
+def _migrate(engine: Engine) -> None:
+    # Add columns introduced after a table was first created.
+    inspector = inspect(engine)
+    table = _models.SnapshotModel.__table__
+    columns = {c["name"] for c in inspector.get_columns(table.name)}
+    if "next_op_id" not in columns:
+        engine.execute("ALTER TABLE {} ADD COLUMN next_op_id INTEGER".format(table.name))
+
+    table = _models.OperationModel.__table__
+    columns = {c["name"] for c in inspector.get_columns(table.name)}
+    if "seq" not in columns:
+        engine.execute("ALTER TABLE {} ADD COLUMN seq INTEGER".format(table.name))
+        for index in table.indexes:
+            if "seq" in index.columns:
+                index.create(engine)
+    if "large_data" not in columns:
+        column_type = table.c.large_data.type.compile(dialect=engine.dialect)
+        engine.execute(
+            "ALTER TABLE {} ADD COLUMN large_data {}".format(table.name, column_type)
+        )
@@ -0,0 +1,128 @@
+import threading
+from typing import Any
+from typing import List
+from typing import Optional
+import weakref
+
+import optuna
+from sqlalchemy.engine import create_engine
+from sqlalchemy.engine import Engine
+from sqlalchemy.engine.url import URL
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool
+
+
+_logger = optuna.logging.get_logger(__name__)
+
+
+class SQLiteOptions(object):
+    """Connection settings of ``RDBDatabase`` for SQLite databases.
+
+    The defaults put the database into WAL mode, in which readers and the writer don't block each
+    other, and only sync the WAL at checkpoints instead of on every commit. A crash of the
+    machine (but not of the process) may lose the most recent commits in this mode.
+
+    Args:
+        journal_mode:
+            Value of ``PRAGMA journal_mode``.
+        synchronous:
+            Value of ``PRAGMA synchronous``.
+        busy_timeout_ms:
+            How long to wait for the lock of another connection before failing.
+        mmap_size:
+            Number of bytes of the database file that are memory-mapped.
+        cache_size_kib:
+            Size of the page cache of each connection.
+        checkpoint_interval_ms:
+            If given, the WAL is checkpointed by a background thread at this interval, and
+            commits no longer trigger checkpoints by themselves.
+        pool_size:
+            Number of connections kept open by the pool.
+    """
+
+    def __init__(
+        self,
+        journal_mode: str = "wal",
+        synchronous: str = "normal",
+        busy_timeout_ms: int = 5000,
+        mmap_size: int = 256 * 1024 * 1024,
+        cache_size_kib: int = 64 * 1024,
+        checkpoint_interval_ms: Optional[float] = None,
+        pool_size: int = 5,
+    ) -> None:
+        self.journal_mode = journal_mode
+        self.synchronous = synchronous
+        self.busy_timeout_ms = busy_timeout_ms
+        self.mmap_size = mmap_size
+        self.cache_size_kib = cache_size_kib
+        self.checkpoint_interval_ms = checkpoint_interval_ms
+        self.pool_size = pool_size
+
+    def _pragmas(self) -> List[str]:
+        pragmas = [
+            "PRAGMA journal_mode = {}".format(self.journal_mode),
+            "PRAGMA synchronous = {}".format(self.synchronous),
+            "PRAGMA busy_timeout = {:d}".format(self.busy_timeout_ms),
+            "PRAGMA mmap_size = {:d}".format(self.mmap_size),
+            # A negative size is in KiB rather than in pages.
+            "PRAGMA cache_size = {:d}".format(-self.cache_size_kib),
+        ]
+        if self.checkpoint_interval_ms is not None:
+            pragmas.append("PRAGMA wal_autocheckpoint = 0")
+        return pragmas
+
+
+def create_sqlite_engine(url: URL, options: SQLiteOptions) -> Engine:
+    if url.database in (None, "", ":memory:"):
+        # Every connection to an in-memory database opens a database of its own, so the default
+        # pool (a connection per thread) is kept.
+        engine = create_engine(url)
+    else:
+        # The default pool opens a connection (and runs the pragmas) for every transaction.
+        engine = create_engine(
+            url,
+            poolclass=QueuePool,
+            pool_size=options.pool_size,
+            connect_args={"check_same_thread": False},
+        )
+
+    pragmas = options._pragmas()
+
+    @event.listens_for(engine, "connect")
+    def connect(dbapi_connection: Any, connection_record: Any) -> None:
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+
+    return engine
+
+
+class _WalCheckpointer(threading.Thread):
+    """Checkpoints the WAL of the SQLite database of an ``RDBDatabase`` periodically.
+
+    Like ``_Tailer``, the thread only holds a weak reference to the database and exits once it
+    has been garbage-collected.
+    """
+
+    def __init__(self, database: Any, interval_seconds: float) -> None:
+        super().__init__(name="optjournal-wal-checkpointer", daemon=True)
+        self._database = weakref.ref(database)
+        self._interval_seconds = interval_seconds
+        self._stopped = threading.Event()
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+    def run(self) -> None:
+        while not self._stopped.wait(self._interval_seconds):
+            database = self._database()
+            if database is None:
+                return
+
+            try:
+                database._checkpoint_wal()
+            except Exception as e:
+                _logger.warning("Failed to checkpoint the WAL: {!r}".format(e))
+            finally:
+                del database
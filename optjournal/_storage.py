@@ -1,13 +1,14 @@
-import copy
 from datetime import datetime
-import json
 import threading
+import time
 from typing import Any
-from typing import Callable
 from typing import Dict
+from typing import Iterable
+from typing import Iterator
 from typing import List
 from typing import Optional
 from typing import Sequence
+from typing import Set
 from typing import Tuple
 from typing import Union
 import uuid
@@ -18,26 +19,127 @@ from optuna.storages import BaseStorage
 from optuna.trial import TrialState
 from sqlalchemy.exc import IntegrityError
 
+from optjournal import _codec
 from optjournal._database import Database
+from optjournal._group_commit import _GroupCommit
 from optjournal import _id
+from optjournal._lazy_study_summary import _SummaryBatch
 from optjournal._lazy_study_summary import LazyStudySummary
+from optjournal._lazy_study_summary import make_summary_model
+from optjournal._lazy_study_summary import to_study_summary
+from optjournal._metrics import MetricsSink
 from optjournal._operation import _Operation
 from optjournal import _models
+from optjournal._policy import CheckpointPolicy
+from optjournal._policy import SyncPolicy
 from optjournal._rdb import RDBDatabase
+from optjournal._study import _JournalCompactedError
+from optjournal._study import _make_template
 from optjournal._study import _Study
+from optjournal._tailer import _Tailer
+from optjournal import _tracing
+from optjournal._tracing import Tracer
+
+
+_CHECKPOINT_NAME = "study"
+
+# Operations after which the stored summary of a study is rewritten. Creating a trial also changes
+# the summary, but the trial is usually finished shortly afterwards and the summary is rewritten
+# then (until which it is replayed from the journal).
+_SUMMARY_OPERATIONS = frozenset(
+    [
+        _Operation.SET_TRIAL_STATE,
+        _Operation.SET_STUDY_DIRECTIONS,
+        _Operation.SET_STUDY_USER_ATTR,
+        _Operation.SET_STUDY_SYSTEM_ATTR,
+    ]
+)
+
+
+# Storage methods traced with a tracer, by their first argument.
+_STUDY_METHODS = (
+    "delete_study",
+    "set_study_user_attr",
+    "set_study_system_attr",
+    "set_study_directions",
+    "get_study_name_from_id",
+    "get_study_directions",
+    "get_n_trials",
+    "get_study_user_attrs",
+    "get_study_system_attrs",
+    "create_new_trial",
+    "get_all_trials",
+    "get_best_trial",
+    "read_trials_from_remote_storage",
+)
+_TRIAL_METHODS = (
+    "set_trial_state",
+    "set_trial_param",
+    "get_trial_param",
+    "set_trial_values",
+    "set_trial_intermediate_value",
+    "set_trial_user_attr",
+    "set_trial_system_attr",
+    "get_trial",
+)
+_OTHER_METHODS = ("create_new_study", "get_study_id_from_name", "get_all_study_summaries")
 
 
 class JournalStorage(BaseStorage):
-    def __init__(self, database: Union[str, Database]) -> None:
+    def __init__(
+        self,
+        database: Union[str, Database],
+        checkpoint_policy: Optional[CheckpointPolicy] = None,
+        codec: str = "json",
+        sync_policy: Optional[SyncPolicy] = None,
+        tail_interval_ms: Optional[float] = None,
+        metrics: Optional[MetricsSink] = None,
+        tracer: Optional[Tracer] = None,
+    ) -> None:
         if isinstance(database, str):
-            self._db = RDBDatabase(database)
+            self._db = RDBDatabase(database, metrics=metrics, tracer=tracer)
         else:
             self._db = database
 
+        self._codec = _codec.get_codec(codec)
+        # A database that is passed in reports to the sink and tracer it has been created with,
+        # if any.
+        self._metrics = metrics
+        self._tracer = tracer
+
+        self._checkpoint_policy = checkpoint_policy
+        self._checkpoint_progress = {}  # type: Dict[int, Tuple[int, int, float]]
+        self._sync_policy = sync_policy
+        self._last_flushed_at = {}  # type: Dict[int, float]
         self._studies = {}  # type: Dict[int, _Study]
-        self._buffered_ops = []  # type: List[_models.OperationModel]
+        self._buffered_ops = {}  # type: Dict[int, List[_models.OperationModel]]
         self._worker_ids = {}  # type: Dict[int, str]
+
+        # Studies whose stored summary is outdated by operations of this storage, that are either
+        # buffered (`_summary_changes`) or written but not replayed yet (`_unsaved_summaries`).
+        self._summary_changes: Set[int] = set()
+        self._unsaved_summaries: Set[int] = set()
+
+        # `_lock` only guards `_study_locks`. Each study is synchronized under its own lock, and
+        # `_buffer_lock` guards `_buffered_ops` and `_summary_changes`.
         self._lock = threading.Lock()
+        self._study_locks = {}  # type: Dict[int, threading.Lock]
+        self._buffer_lock = threading.Lock()
+
+        # Concurrent flushes, also of different studies, are written in one batch.
+        self._group_commit = _GroupCommit(self._db.append_operations)
+
+        # With a tailer, loaded studies are kept up to date in the background, so that
+        # `read_trials_from_remote_storage` only has to write the buffered operations.
+        self._tailer = None  # type: Optional[_Tailer]
+        if tail_interval_ms is not None:
+            self._tailer = _Tailer(self, tail_interval_ms / 1000)
+            self._tailer.start()
+
+        if tracer is not None:
+            _tracing.trace_methods(self, tracer, "storage", _STUDY_METHODS, self._study_args)
+            _tracing.trace_methods(self, tracer, "storage", _TRIAL_METHODS, self._trial_args)
+            _tracing.trace_methods(self, tracer, "storage", _OTHER_METHODS, self._other_args)
 
     def create_new_study(self, study_name: Optional[str] = None) -> int:
         if study_name is None:
@@ -55,16 +157,28 @@ class JournalStorage(BaseStorage):
         if study is None:
             raise KeyError("No such study: id={}.".format(study_id))
 
-        if study_id in self._studies:
-            del self._studies[study_id]
+        with self._study_lock(study_id):
+            if study_id in self._studies:
+                del self._studies[study_id]
+                del self._checkpoint_progress[study_id]
+                self._last_flushed_at.pop(study_id, None)
+            self._unsaved_summaries.discard(study_id)
+
+        with self._buffer_lock:
+            self._buffered_ops.pop(study_id, None)
+            self._summary_changes.discard(study_id)
 
     def set_study_user_attr(self, study_id: int, key: str, value: Any) -> None:
         self._enqueue_op(study_id, _Operation.SET_STUDY_USER_ATTR, {"key": key, "value": value})
-        self._sync(study_id)
+        if not self._sync_if_due(study_id):
+            with self._study_lock(study_id):
+                self._studies[study_id].user_attrs[key] = value
 
     def set_study_system_attr(self, study_id: int, key: str, value: Any) -> None:
         self._enqueue_op(study_id, _Operation.SET_STUDY_SYSTEM_ATTR, {"key": key, "value": value})
-        self._sync(study_id)
+        if not self._sync_if_due(study_id):
+            with self._study_lock(study_id):
+                self._studies[study_id].system_attrs[key] = value
 
     def set_study_directions(self, study_id: int, directions: List[study.StudyDirection]) -> None:
         self._enqueue_op(study_id, _Operation.SET_STUDY_DIRECTIONS, {"directions": [d.value for d in directions]})
@@ -102,8 +216,17 @@ class JournalStorage(BaseStorage):
         self._sync(study_id)
         return self._studies[study_id].directions
 
-    def get_n_trials(self, study_id: int) -> int:
-        return len(self.get_all_trials(study_id, deepcopy=False))
+    def get_n_trials(
+        self, study_id: int, state: Optional[Union[Tuple[TrialState, ...], TrialState]] = None
+    ) -> int:
+        if study_id not in self._studies:
+            self._sync(study_id)
+
+        if isinstance(state, TrialState):
+            state = (state,)
+
+        with self._study_lock(study_id):
+            return self._studies[study_id].get_n_trials(state)
 
     def get_study_user_attrs(self, study_id: int) -> Dict[str, Any]:
         self._sync(study_id)
@@ -114,9 +237,18 @@ class JournalStorage(BaseStorage):
         return self._studies[study_id].system_attrs
 
     def get_all_study_summaries(self) -> List["LazyStudySummary"]:
-        return [
-            LazyStudySummary(model.id, model.name, self) for model in self._db.get_all_studies()
-        ]
+        # Up-to-date stored summaries are used as they are. The others are loaded together once
+        # one of them is accessed.
+        batch = _SummaryBatch(self)
+        summaries = []
+        for model, summary_model in self._db.load_study_summaries():
+            if summary_model is not None:
+                summary = to_study_summary(model.name, summary_model)
+                summaries.append(LazyStudySummary(model.id, model.name, self, summary=summary))
+            else:
+                summaries.append(LazyStudySummary(model.id, model.name, self, batch))
+                batch.summaries.append(summaries[-1])
+        return summaries
 
     def create_new_trial(
         self, study_id: int, template_trial: Optional["FrozenTrial"] = None
@@ -124,23 +256,7 @@ class JournalStorage(BaseStorage):
         data = {"datetime_start": datetime.now().timestamp(), "worker_id": self._worker_id()}
 
         if template_trial is not None:
-            data["state"] = template_trial.state.value
-            if template_trial.value is not None:
-                data["values"] = template_trial.values
-            if template_trial.datetime_start is not None:
-                data["datetime_start"] = template_trial.datetime_start.timestamp()
-            if template_trial.datetime_complete is not None:
-                data["datetime_complete"] = template_trial.datetime_complete.timestamp()
-            if template_trial.params:
-                data["params"] = template_trial.params
-            if template_trial.distributions:
-                data["distributions"] = template_trial.distributions
-            if template_trial.user_attrs:
-                data["user_attrs"] = template_trial.user_attrs
-            if template_trial.system_attrs:
-                data["system_attrs"] = template_trial.system_attrs
-            if template_trial.intermediate_values:
-                data["intermediate_values"] = template_trial.intermediate_values
+            data.update(_make_template(template_trial))
 
         self._enqueue_op(study_id, _Operation.CREATE_TRIAL, data)
         self._sync(study_id)
@@ -180,9 +296,6 @@ class JournalStorage(BaseStorage):
 
         study_id = _id.get_study_id(trial_id)
         param_value = distribution.to_external_repr(param_value_internal)
-        trial.params[param_name] = param_value
-        trial.distributions[param_name] = distribution
-
         data = {
             "trial_id": trial_id,
             "name": param_name,
@@ -190,6 +303,11 @@ class JournalStorage(BaseStorage):
             "distribution": optuna.distributions.distribution_to_json(distribution),
         }
         self._enqueue_op(study_id, _Operation.SET_TRIAL_PARAM, data)
+        with self._study_lock(study_id):
+            trial = self.get_trial(trial_id)
+            trial.params[param_name] = param_value
+            trial.distributions[param_name] = distribution
+
         return True
 
     def get_trial_number_from_id(self, trial_id: int) -> int:
@@ -223,7 +341,9 @@ class JournalStorage(BaseStorage):
         study_id = _id.get_study_id(trial_id)
         data = {"trial_id": trial_id, "value": intermediate_value, "step": step}
         self._enqueue_op(study_id, _Operation.SET_TRIAL_INTERMEDIATE_VALUE, data)
-        self._sync(study_id)
+        if not self._sync_if_due(study_id):
+            with self._study_lock(study_id):
+                self.get_trial(trial_id).intermediate_values[step] = intermediate_value
 
         return True
 
@@ -237,7 +357,9 @@ class JournalStorage(BaseStorage):
         study_id = _id.get_study_id(trial_id)
         data = {"trial_id": trial_id, "key": key, "value": value}
         self._enqueue_op(study_id, _Operation.SET_TRIAL_USER_ATTR, data)
-        self._sync(study_id)
+        if not self._sync_if_due(study_id):
+            with self._study_lock(study_id):
+                self.get_trial(trial_id).user_attrs[key] = value
 
     def set_trial_system_attr(self, trial_id: int, key: str, value: Any) -> None:
         trial = self.get_trial(trial_id)
@@ -249,7 +371,9 @@ class JournalStorage(BaseStorage):
         study_id = _id.get_study_id(trial_id)
         data = {"trial_id": trial_id, "key": key, "value": value}
         self._enqueue_op(study_id, _Operation.SET_TRIAL_SYSTEM_ATTR, data)
-        self._sync(study_id)
+        if not self._sync_if_due(study_id):
+            with self._study_lock(study_id):
+                self.get_trial(trial_id).system_attrs[key] = value
 
     def get_trial(self, trial_id: int) -> "FrozenTrial":
         study_id = _id.get_study_id(trial_id)
@@ -264,53 +388,253 @@ class JournalStorage(BaseStorage):
         if study_id not in self._studies:
             self._sync(study_id)
 
-        with self._lock:
+        with self._study_lock(study_id):
+            study = self._studies[study_id]
             if deepcopy:
-                trials = copy.deepcopy(self._studies[study_id].trials)
+                return study.copy_trials(states)
+            elif states is None:
+                return study.trials[:]
             else:
-                trials = self._studies[study_id].trials[:]
-
-        if states is None:
-            return trials
-        else:
-            return [t for t in trials if t.state in states]
+                return study.get_trials(states)
 
     def get_best_trial(self, study_id: int) -> "FrozenTrial":
         return self._studies[study_id].best_trial
 
     def read_trials_from_remote_storage(self, study_id: int) -> None:
-        self._sync(study_id)
+        if self._tailer is None or study_id not in self._studies:
+            self._sync(study_id)
+            return
+
+        with self._study_lock(study_id):
+            self._flush(study_id)
+
+    def stop_tailing(self) -> None:
+        """Stop the background thread started by ``tail_interval_ms``."""
+
+        if self._tailer is not None:
+            self._tailer.stop()
+            self._tailer = None
 
     def _sync(self, study_id) -> None:
-        with self._lock:
+        start = time.perf_counter()
+        with self._study_lock(study_id):
+            if self._metrics is not None:
+                self._metrics.observe("storage.lock_wait_seconds", time.perf_counter() - start)
+            if self._tracer is not None:
+                self._tracer.record_span(
+                    "study_lock", "lock", start, self._study_args([study_id])
+                )
+
             if study_id not in self._studies:
                 if self._db.find_study(study_id) is None:
                     raise KeyError("No such study: id={}.".format(study_id))
 
-                self._studies[study_id] = _Study(study_id)
+                self._load_checkpoint(study_id)
+
+            self._flush(study_id)
+            self._catch_up(study_id)
+
+    def _tail(self) -> None:
+        # Operations are applied under the worker id of the tailer thread, which never issues any.
+        # Thus, the ownership checks meant for the thread that has issued an operation (which its
+        # own sync runs) neither raise here nor stop the rest of the batch from being applied.
+        for study_id in list(self._studies):
+            with self._study_lock(study_id):
+                if study_id in self._studies:
+                    self._catch_up(study_id)
+
+    def _flush(self, study_id: int) -> None:
+        with self._buffer_lock:
+            ops = self._buffered_ops.pop(study_id, [])
+            summary_changed = study_id in self._summary_changes
+            self._summary_changes.discard(study_id)
+        if ops:
+            start = time.perf_counter()
+            try:
+                self._group_commit.commit(ops)
+            except BaseException:
+                # The operations have already been applied to the local state, so they are put
+                # back in front of those buffered meanwhile, to be written by the next flush.
+                with self._buffer_lock:
+                    self._buffered_ops[study_id] = ops + self._buffered_ops.get(study_id, [])
+                    if summary_changed:
+                        self._summary_changes.add(study_id)
+                raise
+            if self._metrics is not None:
+                self._metrics.observe("db.append_seconds", time.perf_counter() - start)
+                self._metrics.observe("sync.ops_flushed", len(ops))
+                self._metrics.observe("sync.bytes_flushed", sum(len(op.data) for op in ops))
+        if summary_changed:
+            self._unsaved_summaries.add(study_id)
+        self._last_flushed_at[study_id] = time.time()
+
+    def _catch_up(self, study_id: int) -> None:
+        next_op_id = self._studies[study_id].next_op_id
+        self._apply_operations(study_id, self._db.iter_operations(study_id, next_op_id))
+
+        # Only the writers of operations that change the summary update it, so the stored summary
+        # of a study that is still running may lag behind (and not be used) in the meantime.
+        if study_id in self._unsaved_summaries and not self._has_buffered_ops(study_id):
+            self._unsaved_summaries.discard(study_id)
+            self._db.save_study_summary(make_summary_model(self._studies[study_id]))
+
+    def _sync_if_due(self, study_id: int) -> bool:
+        # Returns whether the study has been synced. If not, the caller applies its write to the
+        # local state instead, under the study lock (a tailer may be applying operations to it).
+        # Writes are buffered before they are applied, so that the local state is never ahead of
+        # the journal without buffered operations (see `_has_buffered_ops`).
+        if self._sync_policy is None or study_id not in self._studies:
+            self._sync(study_id)
+            return True
 
-            # Write operations.
-            self._db.append_operations(self._buffered_ops)
-            self._buffered_ops = []
+        with self._buffer_lock:
+            n_bytes = sum(len(op.data) for op in self._buffered_ops.get(study_id, []))
+        elapsed_seconds = time.time() - self._last_flushed_at.get(study_id, 0.0)
+        if self._sync_policy.should_sync(n_bytes, elapsed_seconds):
+            self._sync(study_id)
+            return True
 
-            # Read operations.
-            ops = self._db.read_operations(study_id, self._studies[study_id].next_op_id)
-            for op in ops:
-                self._studies[study_id].execute(op, self._worker_id())
+        return False
+
+    def _load_checkpoint(self, study_id: int) -> None:
+        start = time.perf_counter()
+        snapshot, chunks = self._db.load_snapshot_and_iter_operations(
+            study_id, _CHECKPOINT_NAME, 0
+        )
+        if snapshot is None:
+            study = _Study(study_id)
+        else:
+            study = _Study.deserialize(snapshot.data)
+        if self._metrics is not None:
+            self._metrics.observe("snapshot.load_seconds", time.perf_counter() - start)
+
+        self._studies[study_id] = study
+        self._checkpoint_progress[study_id] = (0, 0, time.time())
+        self._apply_operations(study_id, chunks)
+
+    def _apply_operations(
+        self, study_id: int, chunks: Iterable[List[_models.StoredOperation]]
+    ) -> None:
+        n_ops, n_bytes, since = self._checkpoint_progress[study_id]
+        if self._metrics is not None:
+            chunks = self._measure_reads(chunks, self._metrics)
+        for ops in chunks:
+            study = self._studies[study_id]
+            if len(ops) > 0 and ops[0].id < study.next_op_id:
+                # Chunks that follow a replay from scratch (see below) may overlap with it.
+                ops = [op for op in ops if op.id >= study.next_op_id]
+
+            try:
+                self._execute(study, ops)
+            except _JournalCompactedError:
+                # Replay the compacted journal from scratch.
+                study = _Study(study_id)
+                self._studies[study_id] = study
+                ops = []
+                chunks = self._db.iter_operations(study_id, 0)
+                if self._metrics is not None:
+                    chunks = self._measure_reads(chunks, self._metrics)
+                for chunk in chunks:
+                    self._execute(study, chunk)
+                    n_ops += len(chunk)
+                    n_bytes += sum(len(op.data) for op in chunk)
+
+            n_ops += len(ops)
+            n_bytes += sum(len(op.data) for op in ops)
+
+        if self._checkpoint_policy is None:
+            return
+
+        study = self._studies[study_id]
+        if self._checkpoint_policy.should_checkpoint(
+            n_ops, n_bytes, time.time() - since
+        ) and not self._has_buffered_ops(study_id):
+            start = time.perf_counter()
+            self._db.save_snapshot(
+                _models.SnapshotModel(
+                    study_id=study_id,
+                    name=_CHECKPOINT_NAME,
+                    data=study.serialize(),
+                    next_op_id=study.next_op_id,
+                )
+            )
+            if self._metrics is not None:
+                self._metrics.observe("snapshot.save_seconds", time.perf_counter() - start)
+            n_ops, n_bytes, since = 0, 0, time.time()
+
+        self._checkpoint_progress[study_id] = (n_ops, n_bytes, since)
+
+    def _has_buffered_ops(self, study_id: int) -> bool:
+        # Whether the local state of the study may have writes that aren't in the journal yet, in
+        # which case it is neither checkpointed nor summarized. Those of the tailer are deferred to
+        # the next sync, which flushes the buffer first.
+        with self._buffer_lock:
+            return len(self._buffered_ops.get(study_id, [])) > 0
+
+    def _execute(self, study: _Study, ops: List[_models.StoredOperation]) -> None:
+        if self._metrics is None and self._tracer is None:
+            study.execute_all(ops, self._worker_id())
+            return
+
+        stats = {"decode_seconds": 0.0}
+        start = time.perf_counter()
+        study.execute_all(ops, self._worker_id(), stats)
+        if self._metrics is not None:
+            self._metrics.observe("study.apply_seconds", time.perf_counter() - start)
+            self._metrics.observe("study.decode_seconds", stats["decode_seconds"])
+        if self._tracer is not None:
+            args = self._study_args([study.study_id])
+            args["n_ops"] = len(ops)
+            args["decode_seconds"] = stats["decode_seconds"]
+            self._tracer.record_span("apply", "replay", start, args)
+
+    def _measure_reads(
+        self, chunks: Iterable[List[_models.StoredOperation]], metrics: MetricsSink
+    ) -> Iterator[List[_models.StoredOperation]]:
+        chunks = iter(chunks)
+        while True:
+            start = time.perf_counter()
+            ops = next(chunks, None)
+            if ops is None:
+                return
+
+            metrics.observe("db.read_seconds", time.perf_counter() - start)
+            metrics.observe("sync.ops_read", len(ops))
+            metrics.observe("sync.bytes_read", sum(len(op.data) for op in ops))
+            yield ops
 
     def _enqueue_op(self, study_id: int, kind: _Operation, data: Dict[str, Any]) -> None:
-        data = json.dumps([kind.value, data])
-        with self._lock:
-            last_op = self._buffered_ops[-1] if self._buffered_ops else None
-            if (
-                last_op is not None
-                and last_op.study_id == study_id
-                and len(last_op.data) + len(data) < 4096
-            ):
-                last_op.data = "{},{}".format(last_op.data[:-1], data[1:])
+        data = self._codec.encode(kind.value, data)
+        with self._buffer_lock:
+            if kind in _SUMMARY_OPERATIONS:
+                self._summary_changes.add(study_id)
+            buffered_ops = self._buffered_ops.setdefault(study_id, [])
+            last_op = buffered_ops[-1] if buffered_ops else None
+            if last_op is not None and len(last_op.data) + len(data) < _models.MAX_DATA_LENGTH:
+                last_op.data = self._codec.concat(last_op.data, data)
             else:
                 model = _models.OperationModel(study_id=study_id, data=data)
-                self._buffered_ops.append(model)
+                buffered_ops.append(model)
+
+    def _study_lock(self, study_id: int) -> threading.Lock:
+        with self._lock:
+            if study_id not in self._study_locks:
+                self._study_locks[study_id] = threading.Lock()
+
+            return self._study_locks[study_id]
+
+    def _study_args(self, args: Sequence[Any]) -> Dict[str, Any]:
+        return {"study_id": args[0], "worker_id": self._worker_id()}
+
+    def _trial_args(self, args: Sequence[Any]) -> Dict[str, Any]:
+        return {
+            "study_id": _id.get_study_id(args[0]),
+            "trial_id": args[0],
+            "worker_id": self._worker_id(),
+        }
+
+    def _other_args(self, args: Sequence[Any]) -> Dict[str, Any]:
+        return {"worker_id": self._worker_id()}
 
     # Lock-free internal methods.
     def _worker_id(self) -> str:
@@ -1,21 +1,53 @@
+import copy
 from datetime import datetime
-import json
+import functools
 import pickle
+import time
 from typing import Any
+from typing import cast
 from typing import Dict
 from typing import List
 from typing import Optional
+from typing import Sequence
+from typing import Tuple
 
 import optuna
 from optuna import distributions
 from optuna.trial import TrialState
 
+from optjournal import _codec
 from optjournal import _id
 from optjournal import _models
 from optjournal._operation import _Operation
 
 
+class _FrozenDict(dict):
+    def _read_only(self, *args: Any, **kwargs: Any) -> None:
+        raise TypeError("Finished trials are read-only.")
+
+    __setitem__ = __delitem__ = __ior__ = _read_only  # type: ignore
+    clear = pop = popitem = setdefault = update = _read_only  # type: ignore
+
+    def __reduce__(self) -> Any:
+        return (_FrozenDict, (dict(self),))
+
+
+class _FrozenList(list):
+    def _read_only(self, *args: Any, **kwargs: Any) -> None:
+        raise TypeError("Finished trials are read-only.")
+
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _read_only  # type: ignore
+    append = extend = insert = pop = remove = clear = sort = reverse = _read_only  # type: ignore
+
+    def __reduce__(self) -> Any:
+        return (_FrozenList, (list(self),))
+
+
 class _Trial(optuna.trial.FrozenTrial):
+    # Finished trials are frozen once replayed: they are shared instead of copied, and have to be
+    # thawed into a new object to be modified.
+    _frozen = False
+
     def __init__(
         self,
         number,  # type: int
@@ -52,93 +84,314 @@ class _Trial(optuna.trial.FrozenTrial):
     def study_id(self) -> int:
         return _id.get_study_id(self._trial_id)
 
+    def __setattr__(self, name: str, value: Any) -> None:
+        if self._frozen:
+            raise AttributeError("Finished trials are read-only.")
+
+        super().__setattr__(name, value)
+
+    def __deepcopy__(self, memo: Dict[int, Any]) -> "_Trial":
+        if self._frozen:
+            return self
+
+        copied = self.__class__.__new__(self.__class__)
+        memo[id(self)] = copied
+        copied.__dict__.update(copy.deepcopy(self.__dict__, memo))
+        return copied
+
+    def _freeze(self) -> None:
+        if self._frozen:
+            return
+
+        d = self.__dict__
+        for name in _TRIAL_CONTAINERS:
+            d[name] = _FrozenDict(d[name])
+        if d["_values"] is not None:
+            d["_values"] = _FrozenList(d["_values"])
+        d["_frozen"] = True
+
+    def _thaw(self) -> "_Trial":
+        thawed = self.__class__.__new__(self.__class__)
+        d = thawed.__dict__
+        d.update(self.__dict__)
+        for name in _TRIAL_CONTAINERS:
+            d[name] = dict(d[name])
+        if d["_values"] is not None:
+            d["_values"] = list(d["_values"])
+        del d["_frozen"]
+        return thawed
+
+
+_TRIAL_CONTAINERS = (
+    "_params",
+    "_distributions",
+    "_user_attrs",
+    "_system_attrs",
+    "intermediate_values",
+)
+
+
+class _JournalCompactedError(Exception):
+    """Raised when a journal was compacted past the position a study has been replayed to."""
+
+
+def _make_trial(trial_id: int, number: int, data: Dict[str, Any]) -> _Trial:
+    # Datetimes are kept as timestamps and distributions as JSON until `_materialize_trial`.
+    state = TrialState(data.get("state", TrialState.RUNNING.value))
+
+    owner = None
+    if state == TrialState.RUNNING:
+        owner = data["worker_id"]
+
+    # Intermediate values go through JSON, which turns their steps into strings.
+    return _Trial(
+        trial_id=trial_id,
+        number=number,
+        state=state,
+        values=data.get("values"),
+        datetime_start=data["datetime_start"],
+        datetime_complete=data.get("datetime_complete"),
+        params=data.get("params", {}),
+        distributions=data.get("distributions", {}),
+        user_attrs=data.get("user_attrs", {}),
+        system_attrs=data.get("system_attrs", {}),
+        intermediate_values={
+            int(step): value for step, value in data.get("intermediate_values", {}).items()
+        },
+        owner=owner,
+    )
+
+
+# Most studies use a handful of distinct distributions, so decoded ones are shared between trials.
+_json_to_distribution = functools.lru_cache(maxsize=1024)(distributions.json_to_distribution)
+
+
+def _materialize_trial(trial: _Trial) -> None:
+    if isinstance(trial._datetime_start, (int, float)):
+        trial._datetime_start = datetime.fromtimestamp(trial._datetime_start)
+    if isinstance(trial.datetime_complete, (int, float)):
+        trial.datetime_complete = datetime.fromtimestamp(trial.datetime_complete)
+
+    d = trial._distributions
+    for name, distribution in d.items():
+        if isinstance(distribution, str):
+            d[name] = _json_to_distribution(distribution)
+
+
+def _make_template(trial: optuna.trial.FrozenTrial) -> Dict[str, Any]:
+    data = {"state": trial.state.value}  # type: Dict[str, Any]
+    if trial.values is not None:
+        data["values"] = trial.values
+    if trial.datetime_start is not None:
+        data["datetime_start"] = trial.datetime_start.timestamp()
+    if trial.datetime_complete is not None:
+        data["datetime_complete"] = trial.datetime_complete.timestamp()
+    if trial.params:
+        data["params"] = trial.params
+    if trial.distributions:
+        data["distributions"] = {
+            name: distributions.distribution_to_json(d) for name, d in trial.distributions.items()
+        }
+    if trial.user_attrs:
+        data["user_attrs"] = trial.user_attrs
+    if trial.system_attrs:
+        data["system_attrs"] = trial.system_attrs
+    if trial.intermediate_values:
+        data["intermediate_values"] = trial.intermediate_values
+    return data
+
 
 class _Study(object):
+    # Default for snapshots taken before compaction existed.
+    generation = 0
+    version = 0
+
     def __init__(self, study_id: int) -> None:
         self.study_id = study_id
         self.next_op_id = 0
+        self.generation = 0
+        # Bumped whenever operations are applied.
+        self.version = 0
         self.trials = []
         self.directions = []  # type: List[optuna.study.StudyDirection]
         self.user_attrs = {}  # type: Dict[str,Any]
         self.system_attrs = {}  # type: Dict[str,Any]
         self.best_trial = None  # type: Optional[optuna.trial.FrozenTrial]
         self.last_created_trial_ids = {}  # type: Dict[str,int]
+        self._unfrozen_numbers: Optional[Tuple[int, List[int]]] = None
+
+        # Trial numbers per state. The values are unused: dicts serve as ordered sets.
+        self.trial_numbers_by_state = {
+            state: {} for state in TrialState
+        }  # type: Dict[TrialState, Dict[int, None]]
 
     @property
     def direction(self) -> optuna.study.StudyDirection:
         return self.directions[0]
 
-    def execute(self, op: _models.OperationModel, worker_id: str) -> None:
-        self.next_op_id = op.id + 1
-
-        items = json.loads(op.data)
-        n = len(items)
-        for i in range(n // 2):
-            kind, data = items[i * 2], items[i * 2 + 1]
-            kind = _Operation(kind)
-
-            if kind == _Operation.SET_STUDY_DIRECTIONS:
-                self._set_study_directions(data, worker_id)
-            elif kind == _Operation.CREATE_TRIAL:
-                self._create_trial(data, worker_id)
-            elif kind == _Operation.SET_TRIAL_PARAM:
-                self._set_trial_param(data, worker_id)
-            elif kind == _Operation.SET_TRIAL_VALUES:
-                self._set_trial_values(data, worker_id)
-            elif kind == _Operation.SET_TRIAL_STATE:
-                self._set_trial_state(data, worker_id)
-            elif kind == _Operation.SET_TRIAL_SYSTEM_ATTR:
-                self._set_trial_system_attr(data, worker_id)
-            elif kind == _Operation.SET_TRIAL_USER_ATTR:
-                self._set_trial_system_attr(data, worker_id)
-            elif kind == _Operation.SET_TRIAL_INTERMEDIATE_VALUE:
-                self._set_trial_intermediate_value(data, worker_id)
-            elif kind == _Operation.SET_STUDY_USER_ATTR:
-                self._set_study_user_attr(data, worker_id)
-            elif kind == _Operation.SET_STUDY_SYSTEM_ATTR:
-                self._set_study_system_attr(data, worker_id)
-            else:
-                raise NotImplementedError("kind={}, data={}".format(kind, data))
+    def __getstate__(self) -> Dict[str, Any]:
+        # `last_created_trial_ids` is only meaningful for the process that issued the operations.
+        state = self.__dict__.copy()
+        state["last_created_trial_ids"] = {}
+        state["_unfrozen_numbers"] = None
+        return state
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__dict__.update(state)
+        self._unfrozen_numbers = None
+
+        # Snapshots taken before trials were frozen and indexed by state.
+        trials = list(self.trials.values() if isinstance(self.trials, dict) else self.trials)
+        for trial in trials + [self.best_trial]:
+            if trial is not None and trial.state.is_finished():
+                trial._freeze()
+
+        if "trial_numbers_by_state" not in state:
+            self.trial_numbers_by_state = {s: {} for s in TrialState}
+            for trial in trials:
+                self._index_trial(trial.number, None, trial.state)
+
+    def get_n_trials(self, states: Optional[Sequence[TrialState]] = None) -> int:
+        if states is None:
+            return len(self.trials)
+
+        return sum(len(self.trial_numbers_by_state[state]) for state in set(states))
+
+    def get_trials(self, states: Sequence[TrialState]) -> List[_Trial]:
+        numbers = []  # type: List[int]
+        for state in set(states):
+            numbers.extend(self.trial_numbers_by_state[state])
+        numbers.sort()
+        return [self.trials[number] for number in numbers]
+
+    def copy_trials(self, states: Optional[Sequence[TrialState]] = None) -> List[_Trial]:
+        """Return a deep copy of ``trials``, in which frozen trials are shared."""
+
+        if states is not None:
+            states_memo = {}  # type: Dict[int, Any]
+            return [copy.deepcopy(trial, states_memo) for trial in self.get_trials(states)]
+
+        if self._unfrozen_numbers is None or self._unfrozen_numbers[0] != self.version:
+            numbers = [t.number for t in self.trials if not t._frozen]
+            self._unfrozen_numbers = (self.version, numbers)
+
+        trials = self.trials[:]
+        memo = {}  # type: Dict[int, Any]
+        for number in self._unfrozen_numbers[1]:
+            trials[number] = copy.deepcopy(trials[number], memo)
+        return trials
 
-    def _set_study_directions(self, data: Dict[str, Any], worker_id: str) -> None:
-        self.directions = [optuna.study.StudyDirection(d) for d in data["directions"]]
+    def serialize(self) -> bytes:
+        # FIXME: Don't use pickle
+        return pickle.dumps(self)
 
-    def _create_trial(self, data: Dict[str, Any], worker_id: str) -> None:
-        number = len(self.trials)
-        trial_id = _id.make_trial_id(self.study_id, number)
+    @staticmethod
+    def deserialize(data: bytes) -> "_Study":
+        # FIXME: Don't use pickle
+        return pickle.loads(data)
 
-        if "datetime_complete" in data:
-            data["datetime_complete"] = datetime.fromtimestamp(data["datetime_complete"])
+    def execute(self, op: _models.OperationModel, worker_id: str) -> None:
+        self.execute_all([op], worker_id)
 
-        state = TrialState(data.get("state", TrialState.RUNNING.value))
+    def execute_all(
+        self,
+        ops: Sequence[_models.StoredOperation],
+        worker_id: str,
+        stats: Optional[Dict[str, float]] = None,
+    ) -> None:
+        # If `stats` is given, the time spent on decoding records is added to its
+        # "decode_seconds".
+        handlers = [getattr(self, name) if name else None for name in _HANDLER_NAMES]
+
+        # Consecutive operations mostly target the same trial, which is looked up only once.
+        # Datetimes and distributions of the touched trials are materialized after the batch.
+        current_trial_id = None  # type: Optional[int]
+        current_trial = None  # type: Optional[_Trial]
+        touched = []  # type: List[_Trial]
+        try:
+            for op in ops:
+                if stats is None:
+                    items = _codec.decode(op.data)
+                else:
+                    start = time.perf_counter()
+                    items = _codec.decode(op.data)
+                    stats["decode_seconds"] += time.perf_counter() - start
+                if items and items[0] == _COMPACTION:
+                    self._check_generation(items[1]["generation"])
+
+                self.next_op_id = op.id + 1
+
+                for i in range(0, len(items), 2):
+                    kind, data = items[i], items[i + 1]
+                    handler = handlers[kind] if 0 <= kind < len(handlers) else None
+                    if handler is None:
+                        if kind == _COMPACTION:
+                            continue
+                        raise NotImplementedError("kind={}, data={}".format(kind, data))
+
+                    if kind in _TRIAL_OPERATIONS:
+                        trial_id = data["trial_id"]
+                        if trial_id != current_trial_id:
+                            current_trial = self.trials[_id.get_trial_number(trial_id)]
+                            if current_trial._frozen:
+                                current_trial = self._thaw_trial(current_trial)
+                            current_trial_id = trial_id
+                            touched.append(current_trial)
+                        handler(current_trial, data, worker_id)
+                    elif kind == _CREATE_TRIAL:
+                        touched.append(handler(data, worker_id))
+                    else:
+                        handler(data, worker_id)
+        finally:
+            for trial in touched:
+                _materialize_trial(trial)
+                if trial.state.is_finished():
+                    trial._freeze()
+
+            if ops:
+                self.version += 1
+
+    def _thaw_trial(self, trial: _Trial) -> _Trial:
+        thawed = trial._thaw()
+        self.trials[trial.number] = thawed
+        if self.best_trial is trial:
+            self.best_trial = thawed
+        return thawed
+
+    def _check_generation(self, generation: int) -> None:
+        if generation == self.generation:
+            return
+
+        if self.next_op_id != 0:
+            raise _JournalCompactedError(
+                "The journal of study {} has been compacted (generation {} -> {}).".format(
+                    self.study_id, self.generation, generation
+                )
+            )
 
-        owner = None
-        if state == TrialState.RUNNING:
-            owner = data["worker_id"]
+        self.generation = generation
 
-        trial = _Trial(
-            trial_id=trial_id,
-            number=number,
-            state=state,
-            values=data.get("values"),
-            datetime_start=datetime.fromtimestamp(data["datetime_start"]),
-            datetime_complete=data.get("datetime_complete"),
-            params=data.get("params", {}),
-            distributions=data.get("distributions", {}),
-            user_attrs=data.get("user_attrs", {}),
-            system_attrs=data.get("system_attrs", {}),
-            intermediate_values=data.get("intermediate_values", {}),
-            owner=owner,
-        )
+    def _set_study_directions(self, data: Dict[str, Any], worker_id: str) -> None:
+        self.directions = [optuna.study.StudyDirection(d) for d in data["directions"]]
+
+    def _create_trial(self, data: Dict[str, Any], worker_id: str) -> _Trial:
+        number = len(self.trials)
+        trial = _make_trial(_id.make_trial_id(self.study_id, number), number, data)
         self.trials.append(trial)
 
-        if data["worker_id"] == worker_id:
-            self.last_created_trial_ids[worker_id] = trial_id
+        # Recorded for every worker, as the operation may be applied by another thread of the
+        # process that issued it.
+        if "worker_id" in data:
+            self.last_created_trial_ids[data["worker_id"]] = trial._trial_id
 
-    def _set_trial_state(self, data: Dict[str, Any], worker_id: str) -> None:
-        number = _id.get_trial_number(data["trial_id"])
-        trial = self.trials[number]
+        self._index_trial(number, None, trial.state)
+        if trial.state == TrialState.COMPLETE:
+            self._update_best_trial(trial)
 
+        return trial
+
+    def _set_trial_state(self, trial: _Trial, data: Dict[str, Any], worker_id: str) -> None:
+        number = trial.number
         state = TrialState(data["state"])
         if state == TrialState.RUNNING:
             if trial.owner != data["worker_id"]:
@@ -149,7 +402,7 @@ class _Study(object):
                 else:
                     return
 
-            if self.trials[number].state != TrialState.WAITING:
+            if trial.state != TrialState.WAITING:
                 return
 
         if trial.state.is_finished():
@@ -158,52 +411,56 @@ class _Study(object):
             else:
                 return
 
+        self._index_trial(number, trial.state, state)
         trial.state = state
         if state.is_finished():
-            trial.datetime_complete = datetime.fromtimestamp(data["datetime_complete"])
+            trial.datetime_complete = data["datetime_complete"]
             trial.owner = None
 
         if state == TrialState.RUNNING:
-            self.trials[number].owner = data["worker_id"]
+            trial.owner = data["worker_id"]
 
         if state == TrialState.COMPLETE:
-            if (
-                self.best_trial is None
-                or (
-                    self.direction == optuna.study.StudyDirection.MINIMIZE
-                    and trial.value < self.best_trial.value
-                )
-                or (
-                    self.direction == optuna.study.StudyDirection.MAXIMIZE
-                    and trial.value > self.best_trial.value
-                )
-            ):
-                self.best_trial = trial
+            self._update_best_trial(trial)
 
-    def _set_trial_param(self, data: Dict[str, Any], worker_id: str) -> None:
-        number = _id.get_trial_number(data["trial_id"])
+    def _index_trial(
+        self, number: int, old_state: Optional[TrialState], new_state: TrialState
+    ) -> None:
+        if old_state is not None:
+            del self.trial_numbers_by_state[old_state][number]
+        self.trial_numbers_by_state[new_state][number] = None
+
+    def _update_best_trial(self, trial: _Trial) -> None:
+        if self.best_trial is None:
+            self.best_trial = trial
+            return
+
+        # Only complete trials, which have values, are compared.
+        value = cast(float, trial.value)
+        best_value = cast(float, self.best_trial.value)
+        if (self.direction == optuna.study.StudyDirection.MINIMIZE and value < best_value) or (
+            self.direction == optuna.study.StudyDirection.MAXIMIZE and value > best_value
+        ):
+            self.best_trial = trial
+
+    def _set_trial_param(self, trial: _Trial, data: Dict[str, Any], worker_id: str) -> None:
         name = data["name"]
+        trial.params[name] = data["value"]
+        trial.distributions[name] = data["distribution"]
 
-        self.trials[number].params[name] = data["value"]
-        self.trials[number].distributions[name] = distributions.json_to_distribution(
-            data["distribution"]
-        )
-
-    def _set_trial_values(self, data: Dict[str, Any], worker_id: str) -> None:
-        number = _id.get_trial_number(data["trial_id"])
-        self.trials[number].values = data["values"]
+    def _set_trial_values(self, trial: _Trial, data: Dict[str, Any], worker_id: str) -> None:
+        trial.values = data["values"]
 
-    def _set_trial_intermediate_value(self, data: Dict[str, Any], worker_id: str) -> None:
-        number = _id.get_trial_number(data["trial_id"])
-        self.trials[number].intermediate_values[data["step"]] = data["value"]
+    def _set_trial_intermediate_value(
+        self, trial: _Trial, data: Dict[str, Any], worker_id: str
+    ) -> None:
+        trial.intermediate_values[data["step"]] = data["value"]
 
-    def _set_trial_system_attr(self, data: Dict[str, Any], worker_id: str) -> None:
-        number = _id.get_trial_number(data["trial_id"])
-        self.trials[number].system_attrs[data["key"]] = data["value"]
+    def _set_trial_system_attr(self, trial: _Trial, data: Dict[str, Any], worker_id: str) -> None:
+        trial.system_attrs[data["key"]] = data["value"]
 
-    def _set_trial_user_attr(self, data: Dict[str, Any], worker_id: str) -> None:
-        number = _id.get_trial_number(data["trial_id"])
-        self.trials[number].user_attrs[data["key"]] = data["value"]
+    def _set_trial_user_attr(self, trial: _Trial, data: Dict[str, Any], worker_id: str) -> None:
+        trial.user_attrs[data["key"]] = data["value"]
 
     def _set_study_user_attr(self, data: Dict[str, Any], worker_id: str) -> None:
         self.user_attrs[data["key"]] = data["value"]
@@ -219,50 +476,56 @@ class _StudySummary(_Study):
         self.datetime_start = None  # type: Optuna[datetime.Datetime]
         self.trials = {}
 
-    def _create_trial(self, data: Dict[str, Any], worker_id: str) -> None:
+    def _create_trial(self, data: Dict[str, Any], worker_id: str) -> _Trial:
         number = self.n_trials
-        trial_id = _id.make_trial_id(self.study_id, number)
-
-        if "datetime_complete" in data:
-            data["datetime_complete"] = datetime.fromtimestamp(data["datetime_complete"])
+        trial = _make_trial(_id.make_trial_id(self.study_id, number), number, data)
 
         if self.datetime_start is None:
             self.datetime_start = datetime.fromtimestamp(data["datetime_start"])
 
-        state = TrialState(data.get("state", TrialState.RUNNING.value))
-
-        owner = None
-        if state == TrialState.RUNNING:
-            owner = data["worker_id"]
-
-        trial = _Trial(
-            trial_id=trial_id,
-            number=number,
-            state=state,
-            values=data.get("values"),
-            datetime_start=datetime.fromtimestamp(data["datetime_start"]),
-            datetime_complete=data.get("datetime_complete"),
-            params=data.get("params", {}),
-            distributions=data.get("distributions", {}),
-            user_attrs=data.get("user_attrs", {}),
-            system_attrs=data.get("system_attrs", {}),
-            intermediate_values=data.get("intermediate_values", {}),
-            owner=owner,
-        )
-        self.trials[number] = trial
+        if trial.state == TrialState.COMPLETE:
+            self._update_best_trial(trial)
+        if not trial.state.is_finished():
+            self.trials[number] = trial
         self.n_trials += 1
 
-    def _set_trial_state(self, data: Dict[str, Any], worker_id: str) -> None:
-        super()._set_trial_state(data, worker_id)
-        state = TrialState(data["state"])
-        if state.is_finished():
-            number = _id.get_trial_number(data["trial_id"])
-            del self.trials[number]
+        return trial
 
-    def serialize(self) -> bytes:
-        # FIXME: Don't use pickle
-        return pickle.dumps(self)
+    def _set_trial_state(self, trial: _Trial, data: Dict[str, Any], worker_id: str) -> None:
+        super()._set_trial_state(trial, data, worker_id)
+        if trial.state.is_finished():
+            self.trials.pop(trial.number, None)
 
-    def deserialize(data: bytes) -> '_StudySummary':
-        # FIXME: Don't use pickle
-        return pickle.loads(data)
+    def _index_trial(
+        self, number: int, old_state: Optional[TrialState], new_state: TrialState
+    ) -> None:
+        # Summaries don't keep finished trials.
+        pass
+
+
+_COMPACTION = _Operation.COMPACTION.value
+_CREATE_TRIAL = _Operation.CREATE_TRIAL.value
+
+# Handlers of operations that modify an existing trial take the trial as their first argument.
+_TRIAL_OPERATIONS = frozenset(
+    [
+        _Operation.SET_TRIAL_PARAM.value,
+        _Operation.SET_TRIAL_VALUES.value,
+        _Operation.SET_TRIAL_STATE.value,
+        _Operation.SET_TRIAL_SYSTEM_ATTR.value,
+        _Operation.SET_TRIAL_USER_ATTR.value,
+        _Operation.SET_TRIAL_INTERMEDIATE_VALUE.value,
+    ]
+)
+
+_HANDLER_NAMES = [None] * (max(op.value for op in _Operation) + 1)  # type: List[Optional[str]]
+_HANDLER_NAMES[_Operation.CREATE_TRIAL.value] = "_create_trial"
+_HANDLER_NAMES[_Operation.SET_STUDY_USER_ATTR.value] = "_set_study_user_attr"
+_HANDLER_NAMES[_Operation.SET_STUDY_SYSTEM_ATTR.value] = "_set_study_system_attr"
+_HANDLER_NAMES[_Operation.SET_STUDY_DIRECTIONS.value] = "_set_study_directions"
+_HANDLER_NAMES[_Operation.SET_TRIAL_PARAM.value] = "_set_trial_param"
+_HANDLER_NAMES[_Operation.SET_TRIAL_VALUES.value] = "_set_trial_values"
+_HANDLER_NAMES[_Operation.SET_TRIAL_USER_ATTR.value] = "_set_trial_user_attr"
+_HANDLER_NAMES[_Operation.SET_TRIAL_SYSTEM_ATTR.value] = "_set_trial_system_attr"
+_HANDLER_NAMES[_Operation.SET_TRIAL_STATE.value] = "_set_trial_state"
+_HANDLER_NAMES[_Operation.SET_TRIAL_INTERMEDIATE_VALUE.value] = "_set_trial_intermediate_value"
@@ -0,0 +1,38 @@
+import threading
+from typing import Any
+import weakref
+
+import optuna
+
+
+_logger = optuna.logging.get_logger(__name__)
+
+
+class _Tailer(threading.Thread):
+    """Applies the operations of other workers to the loaded studies of a storage periodically.
+
+    The thread only holds a weak reference to the storage and exits once the storage has been
+    garbage-collected or ``stop`` has been called.
+    """
+
+    def __init__(self, storage: Any, interval_seconds: float) -> None:
+        super().__init__(name="optjournal-tailer", daemon=True)
+        self._storage = weakref.ref(storage)
+        self._interval_seconds = interval_seconds
+        self._stopped = threading.Event()
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+    def run(self) -> None:
+        while not self._stopped.wait(self._interval_seconds):
+            storage = self._storage()
+            if storage is None:
+                return
+
+            try:
+                storage._tail()
+            except Exception as e:
+                _logger.warning("Failed to read remote operations: {!r}".format(e))
+            finally:
+                del storage
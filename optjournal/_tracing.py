@@ -0,0 +1,216 @@
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import Sequence
+
+
+class Tracer(object):
+    """Records spans of storage calls, database round trips, lock waits and replays.
+
+    Storages and databases that are given a tracer record a span for each of their API calls,
+    tagged with the ``study_id``, ``trial_id`` and ``worker_id`` the call is about, if any. The
+    spans of a process are written with :meth:`dump` in the Chrome trace event format, which
+    Perfetto and ``chrome://tracing`` open. The dumps of several processes can be combined with
+    :func:`merge_traces`, since their timestamps are based on the wall clock.
+
+    Args:
+        max_events:
+            Spans recorded after this many are dropped (and counted in ``n_dropped``).
+    """
+
+    def __init__(self, max_events: int = 1000000) -> None:
+        self.n_dropped = 0
+        self._max_events = max_events
+        self._events = []  # type: List[Dict[str, Any]]
+        self._pid = os.getpid()
+        # Timestamps are measured with `perf_counter` and converted to microseconds since the
+        # epoch.
+        self._origin_us = time.time() * 1e6 - time.perf_counter() * 1e6
+
+    def span(self, name: str, category: str, args: Optional[Dict[str, Any]] = None) -> "_Span":
+        """Return a context manager that records a span while it is entered.
+
+        Its ``args`` can be updated before the span ends.
+        """
+
+        return _Span(self, name, category, args if args is not None else {})
+
+    def record_span(
+        self, name: str, category: str, start: float, args: Dict[str, Any]
+    ) -> None:
+        """Record a span from ``start``, a :func:`time.perf_counter` value, until now."""
+
+        end = time.perf_counter()
+        event = {
+            "name": name,
+            "cat": category,
+            "ph": "X",
+            "ts": self._origin_us + start * 1e6,
+            "dur": (end - start) * 1e6,
+            "pid": self._pid,
+            "tid": threading.get_ident(),
+            "args": args,
+        }
+        # Appending to a list is atomic, so threads don't need a lock here.
+        if len(self._events) < self._max_events:
+            self._events.append(event)
+        else:
+            self.n_dropped += 1
+
+    @property
+    def events(self) -> List[Dict[str, Any]]:
+        return list(self._events)
+
+    def dump(self, path: str) -> None:
+        names = {t.ident: t.name for t in threading.enumerate()}
+        metadata = [
+            {
+                "name": "process_name",
+                "ph": "M",
+                "pid": self._pid,
+                "args": {"name": "optjournal-{}".format(self._pid)},
+            }
+        ]
+        for tid in sorted({e["tid"] for e in self._events}):
+            metadata.append(
+                {
+                    "name": "thread_name",
+                    "ph": "M",
+                    "pid": self._pid,
+                    "tid": tid,
+                    "args": {"name": names.get(tid, str(tid))},
+                }
+            )
+
+        with open(path, "w") as f:
+            json.dump({"traceEvents": metadata + self.events, "displayTimeUnit": "ms"}, f)
+
+    def _wrap(
+        self,
+        func: Callable[..., Any],
+        name: str,
+        category: str,
+        get_args: Callable[[Sequence[Any]], Dict[str, Any]],
+    ) -> Callable[..., Any]:
+        # Chunks of generators are traced one by one, as they are read.
+        is_generator = inspect.isgeneratorfunction(func)
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        def traced(*args: Any, **kwargs: Any) -> Any:
+            # `get_args` receives the arguments in the order of the parameters, also if they are
+            # passed by keyword.
+            try:
+                bound = list(signature.bind(*args, **kwargs).arguments.values())
+            except TypeError:
+                # Leave invalid calls to fail as they would without a tracer.
+                return func(*args, **kwargs)
+
+            if is_generator:
+                return self._trace_chunks(func(*args, **kwargs), name, category, get_args(bound))
+
+            with self.span(name, category, get_args(bound)):
+                return func(*args, **kwargs)
+
+        return traced
+
+    def _trace_chunks(
+        self, chunks: Iterator[Any], name: str, category: str, args: Dict[str, Any]
+    ) -> Iterator[Any]:
+        while True:
+            with self.span(name, category, dict(args)) as span:
+                chunk = next(chunks, None)
+                if chunk is None:
+                    return
+                span.args["n_ops"] = len(chunk)
+            yield chunk
+
+
+class _Span(object):
+    def __init__(self, tracer: Tracer, name: str, category: str, args: Dict[str, Any]) -> None:
+        self.args = args
+        self._tracer = tracer
+        self._name = name
+        self._category = category
+        self._start = 0.0
+
+    def __enter__(self) -> "_Span":
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, ex_type: Any, ex_value: Any, trace: Any) -> None:
+        if ex_type is not None:
+            self.args["error"] = ex_type.__name__
+        self._tracer.record_span(self._name, self._category, self._start, self.args)
+
+
+def merge_traces(paths: Sequence[str], output_path: str) -> None:
+    """Merge the dumps of several tracers (of different processes) into one trace file."""
+
+    events = []  # type: List[Dict[str, Any]]
+    for path in paths:
+        with open(path) as f:
+            events.extend(json.load(f)["traceEvents"])
+
+    with open(output_path, "w") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+
+_DATABASE_METHODS = (
+    "create_study",
+    "find_study",
+    "find_study_by_name",
+    "delete_study",
+    "get_all_studies",
+    "append_operations",
+    "read_operations",
+    "iter_operations",
+    "save_snapshot",
+    "load_snapshot",
+    "compact",
+    "load_snapshot_and_operations",
+    "load_snapshot_and_iter_operations",
+    "load_snapshots_and_operations",
+    "save_study_summary",
+    "load_study_summaries",
+)
+
+
+def trace_database(db: Any, tracer: Tracer) -> None:
+    trace_methods(db, tracer, "db", _DATABASE_METHODS, _database_args)
+
+
+def _database_args(args: Sequence[Any]) -> Dict[str, Any]:
+    if len(args) == 0:
+        return {}
+
+    first = args[0]
+    if isinstance(first, int):
+        return {"study_id": first}
+    if isinstance(first, list):
+        return {"n_ops": len(first)}
+    # Snapshots and summaries.
+    study_id = getattr(first, "study_id", None)
+    return {} if study_id is None else {"study_id": study_id}
+
+
+def trace_methods(
+    obj: Any,
+    tracer: Tracer,
+    category: str,
+    names: Sequence[str],
+    get_args: Callable[[Sequence[Any]], Dict[str, Any]],
+) -> None:
+    """Replace methods of ``obj`` with traced ones. Untraced objects are left untouched."""
+
+    for name in names:
+        setattr(obj, name, tracer._wrap(getattr(obj, name), name, category, get_args))
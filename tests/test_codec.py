@@ -0,0 +1,136 @@
+import json
+import math
+
+import optuna
+import pytest
+
+import optjournal
+from optjournal import _codec
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        None,
+        True,
+        False,
+        0,
+        127,
+        128,
+        -1,
+        -(2 ** 70),
+        2 ** 70,
+        0.1,
+        -1e300,
+        "",
+        "foo",
+        "trial_id",
+        "あ",
+        [1, [2.5, "x"], {}],
+        {"trial_id": 1000003, "name": "x", "value": 0.25, "key": {"nested": [None]}},
+    ],
+)
+def test_binary_roundtrip(data):
+    codec = _codec.get_codec("binary")
+    record = codec.concat(codec.encode(5, data), codec.encode(7, {"value": data}))
+    assert _codec.decode(record) == [5, data, 7, {"value": data}]
+
+
+def test_binary_special_floats():
+    codec = _codec.get_codec("binary")
+    kind, values = _codec.decode(codec.encode(6, [math.inf, -math.inf, math.nan]))
+    assert values[:2] == [math.inf, -math.inf]
+    assert math.isnan(values[2])
+
+
+def test_binary_is_smaller_than_json():
+    data = {"trial_id": 1000003, "values": [0.12345678901234567, 1.2345678901234567e-5]}
+    binary = _codec.get_codec("binary").encode(6, data)
+    assert len(binary) < len(_codec.get_codec("json").encode(6, data))
+
+
+def test_decode_json():
+    assert _codec.decode(json.dumps([1, {"a": 1}, 2, {}])) == [1, {"a": 1}, 2, {}]
+
+
+def test_unknown_codec():
+    with pytest.raises(ValueError):
+        _codec.get_codec("foo")
+
+
+@pytest.mark.parametrize("backend", ["rdb", "fs"])
+def test_mixed_codecs(backend, tmp_path):
+    def database():
+        if backend == "rdb":
+            return optjournal.RDBDatabase("sqlite:///{}".format(tmp_path / "db.sqlite3"))
+        else:
+            return optjournal.FileSystemDatabase(str(tmp_path))
+
+    storage = optjournal.JournalStorage(database())
+    study = optuna.create_study(study_name="foo", storage=storage)
+    study.optimize(lambda t: t.suggest_float("x", 0, 1), n_trials=3)
+
+    storage = optjournal.JournalStorage(database(), codec="binary")
+    study = optuna.load_study(study_name="foo", storage=storage)
+    study.optimize(lambda t: t.suggest_float("x", 0, 1), n_trials=3)
+    assert any(op.data.startswith("~") for op in database().read_operations(study._study_id, 0))
+
+    study2 = optuna.load_study(study_name="foo", storage=optjournal.JournalStorage(database()))
+    assert study2.trials == study.trials
+
+    assert database().compact(study._study_id, codec="binary")
+    study2 = optuna.load_study(study_name="foo", storage=optjournal.JournalStorage(database()))
+    assert study2.trials == study.trials
+
+
+@pytest.mark.parametrize("codec", ["json", "binary"])
+def test_compress(codec):
+    codec = _codec.get_codec(codec)
+    record = codec.encode(5, {"value": "x" * 1000})
+    assert _codec.compress(record, None) == record
+    assert _codec.compress(record, len(record) + 1) == record
+
+    compressed = _codec.compress(record, len(record))
+    assert compressed.startswith("z") and len(compressed) < len(record)
+    assert _codec.decode(compressed) == _codec.decode(record)
+
+    # Records that don't get shorter are kept as they are.
+    record = codec.encode(5, 1)
+    assert _codec.compress(record, 0) == record
+
+
+@pytest.mark.parametrize("backend", ["rdb", "fs"])
+@pytest.mark.parametrize("compress_threshold", [None, 1024])
+def test_large_operations(backend, compress_threshold, tmp_path):
+    def database():
+        if backend == "rdb":
+            return optjournal.RDBDatabase(
+                "sqlite:///{}".format(tmp_path / "db.sqlite3"),
+                compress_threshold=compress_threshold,
+            )
+        else:
+            return optjournal.FileSystemDatabase(
+                str(tmp_path), compress_threshold=compress_threshold
+            )
+
+    def objective(trial):
+        trial.set_user_attr("large", "".join(str(i) for i in range(10000)))
+        for step in range(100):
+            trial.report(step / 100, step)
+        return trial.suggest_float("x", 0, 1)
+
+    storage = optjournal.JournalStorage(database())
+    study = optuna.create_study(study_name="foo", storage=storage)
+    study.optimize(objective, n_trials=3)
+
+    ops = database().read_operations(study._study_id, 0)
+    assert max(len(op.data) for op in ops) > 4096 or compress_threshold is not None
+    if compress_threshold is not None:
+        assert any(op.data.startswith("z") for op in ops)
+
+    study2 = optuna.load_study(study_name="foo", storage=optjournal.JournalStorage(database()))
+    assert study2.trials == study.trials
+
+    assert database().compact(study._study_id)
+    study2 = optuna.load_study(study_name="foo", storage=optjournal.JournalStorage(database()))
+    assert study2.trials == study.trials
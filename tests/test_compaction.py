@@ -0,0 +1,98 @@
+import optuna
+import pytest
+
+import optjournal
+
+
+@pytest.fixture(params=["rdb", "fs", "fs-link"])
+def database_factory(request, tmp_path):
+    if request.param == "rdb":
+        url = "sqlite:///{}".format(tmp_path / "db.sqlite3")
+        return lambda: optjournal.RDBDatabase(url)
+    else:
+        avoid_flock = request.param == "fs-link"
+        return lambda: optjournal.FileSystemDatabase(str(tmp_path), avoid_flock=avoid_flock)
+
+
+def objective(trial):
+    x = trial.suggest_float("x", 0, 1)
+    trial.suggest_int("y", 0, 10)
+    trial.set_user_attr("foo", x)
+    for step in range(3):
+        trial.report(x * step, step)
+    return x
+
+
+def test_compact(database_factory):
+    storage = optjournal.JournalStorage(database_factory())
+    study = optuna.create_study(study_name="foo", storage=storage)
+    study.set_user_attr("bar", 1)
+    study.optimize(objective, n_trials=5)
+    running_trial_id = storage.create_new_trial(study._study_id)
+
+    # A reader that has replayed a part of the journal before the compaction.
+    reader = optjournal.JournalStorage(database_factory())
+    reader.read_trials_from_remote_storage(study._study_id)
+
+    study.optimize(objective, n_trials=5)
+    expected = study.trials
+
+    db = database_factory()
+    n_ops = len(db.read_operations(study._study_id, 0))
+    assert db.compact(study._study_id)
+    assert len(db.read_operations(study._study_id, 0)) < n_ops
+
+    storage2 = optjournal.JournalStorage(database_factory())
+    study2 = optuna.load_study(study_name="foo", storage=storage2)
+    assert study2.trials == expected
+    assert study2.user_attrs == {"bar": 1}
+    assert study2.best_trial == study.best_trial
+
+    reader.read_trials_from_remote_storage(study._study_id)
+    assert reader.get_all_trials(study._study_id) == expected
+
+    # The owner can still finish its running trial, and new trials follow the compacted ones.
+    storage.set_trial_values(running_trial_id, [0.5])
+    assert storage.set_trial_state(running_trial_id, optuna.trial.TrialState.COMPLETE)
+    study.optimize(objective, n_trials=2)
+    assert [t.number for t in study.trials] == list(range(13))
+
+    study2 = optuna.load_study(
+        study_name="foo", storage=optjournal.JournalStorage(database_factory())
+    )
+    assert study2.trials == study.trials
+
+    summary = optuna.get_all_study_summaries(optjournal.JournalStorage(database_factory()))[0]
+    assert summary.n_trials == 13
+
+
+def test_compact_twice(database_factory):
+    storage = optjournal.JournalStorage(database_factory())
+    study = optuna.create_study(study_name="foo", storage=storage)
+    study.optimize(objective, n_trials=3)
+    assert database_factory().compact(study._study_id)
+    study.optimize(objective, n_trials=3)
+    assert database_factory().compact(study._study_id)
+    study.optimize(objective, n_trials=3)
+
+    study2 = optuna.load_study(
+        study_name="foo", storage=optjournal.JournalStorage(database_factory())
+    )
+    assert study2.trials == study.trials
+
+
+def test_compact_with_stale_checkpoint(database_factory):
+    policy = optjournal.CheckpointPolicy(every_n_ops=1)
+    storage = optjournal.JournalStorage(database_factory(), checkpoint_policy=policy)
+    study = optuna.create_study(study_name="foo", storage=storage)
+    study.optimize(objective, n_trials=3)
+
+    storage = optjournal.JournalStorage(database_factory())
+    study = optuna.load_study(study_name="foo", storage=storage)
+    study.optimize(objective, n_trials=3)
+    assert database_factory().compact(study._study_id)
+
+    study2 = optuna.load_study(
+        study_name="foo", storage=optjournal.JournalStorage(database_factory())
+    )
+    assert study2.trials == study.trials
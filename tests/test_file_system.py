@@ -0,0 +1,151 @@
+import json
+import os
+import subprocess
+import sys
+import time
+import uuid
+
+import optuna
+import pytest
+
+import optjournal
+from optjournal import _file_system
+from optjournal import _models
+
+
+def test_read_operations(tmp_path):
+    db = optjournal.FileSystemDatabase(str(tmp_path))
+    study_id = db.create_study("foo").id
+
+    records = ['[2, {"key": "a", "value": "あ"}]', '[2, {"key": "b", "value": 1}]']
+    db.append_operations(
+        [_models.OperationModel(study_id=study_id, data=data) for data in records]
+    )
+
+    ops = db.read_operations(study_id, 0)
+    assert [op.data for op in ops] == records
+
+    # Ids are byte offsets, so reading from an id returns the operations that follow it.
+    tail = db.read_operations(study_id, ops[0].id + 1)
+    assert [op.data for op in tail] == records[1:]
+    assert tail[0].id == ops[1].id
+    assert db.read_operations(study_id, ops[1].id + 1) == []
+
+    # A partially written record is left for a later read.
+    with open(tmp_path / str(study_id) / "journal.json", "a") as f:
+        f.write('[2, {"key"')
+    assert db.read_operations(study_id, ops[1].id + 1) == []
+
+
+def test_catalog(tmp_path):
+    db = optjournal.FileSystemDatabase(str(tmp_path))
+    other = optjournal.FileSystemDatabase(str(tmp_path))
+    assert db.get_all_studies() == []
+
+    foo = db.create_study("foo")
+    with pytest.raises(optuna.exceptions.DuplicatedStudyError):
+        other.create_study("foo")
+
+    # Studies created by another instance are picked up.
+    bar = other.create_study("bar")
+    assert db.find_study(bar.id).name == "bar"
+    assert db.find_study_by_name("bar").id == bar.id
+
+    assert db.delete_study(foo.id).name == "foo"
+    assert db.delete_study(foo.id) is None
+    assert other.find_study(foo.id) is None
+    assert other.find_study_by_name("foo") is None
+
+    # Study ids are never reused.
+    assert other.create_study("foo").id not in (foo.id, bar.id)
+    assert sorted(s.name for s in db.get_all_studies()) == ["bar", "foo"]
+
+
+def test_append_operations_all_or_nothing(tmp_path, monkeypatch):
+    db = optjournal.FileSystemDatabase(str(tmp_path))
+    study_ids = [db.create_study(name).id for name in ["foo", "bar"]]
+    db.append_operations([_models.OperationModel(study_id=study_ids[0], data="[0, {}]")])
+
+    write = os.write
+    failing_fd = db._get_journal_file(study_ids[1]).fileno()
+
+    def fail_bar(fd, data):
+        if fd == failing_fd:
+            raise OSError("write failed")
+        return write(fd, data)
+
+    monkeypatch.setattr(os, "write", fail_bar)
+    ops = [_models.OperationModel(study_id=i, data="[1, {}]") for i in study_ids]
+    with pytest.raises(OSError):
+        db.append_operations(ops)
+    monkeypatch.setattr(os, "write", write)
+
+    assert [r.data for r in db.read_operations(study_ids[0], 0)] == ["[0, {}]"]
+    assert db.read_operations(study_ids[1], 0) == []
+    db.append_operations(ops)
+    assert [r.data for r in db.read_operations(study_ids[0], 0)] == ["[0, {}]", "[1, {}]"]
+    assert [r.data for r in db.read_operations(study_ids[1], 0)] == ["[1, {}]"]
+
+
+def test_legacy_index(tmp_path):
+    with open(tmp_path / "index.json", "w") as f:
+        json.dump({"next_study_id": 3, "studies": {"foo": 0, "bar": 2}}, f)
+
+    db = optjournal.FileSystemDatabase(str(tmp_path))
+    assert db.find_study(2).name == "bar"
+    assert db.find_study_by_name("foo").id == 0
+    assert db.create_study("baz").id == 3
+
+
+def test_link_lock_breaks_stale_links(tmp_path):
+    path = tmp_path / "journal"
+    path.touch()
+    creator = _file_system.LinkLockCreator(timeout_seconds=5.0, lease_seconds=0.2)
+    with creator(open(path, "ab")):
+        pass
+
+    # A holder of this host that died, one of another host, and one of an older version.
+    pid = subprocess.Popen([sys.executable, "-c", ""]).pid
+    os.waitpid(pid, 0)
+    dead = "{}-{}-x-1".format(_file_system._HOSTNAME, pid)
+    remote = "otherhost-1-x-1"
+    legacy = "{}-1".format(uuid.uuid4())
+    for name in [dead, remote, legacy]:
+        os.link(str(path), str(tmp_path / "lock" / name))
+
+    with creator(open(path, "ab")):
+        pass
+    assert os.listdir(str(tmp_path / "lock")) == []
+
+
+def test_link_lock_renews_lease(tmp_path):
+    path = tmp_path / "journal"
+    path.touch()
+    holder = _file_system.LinkLockCreator(lease_seconds=0.3)
+    waiter = _file_system.LinkLockCreator(lease_seconds=0.3, timeout_seconds=1.0)
+
+    with holder(open(path, "ab")):
+        start = time.perf_counter()
+        with pytest.raises(RuntimeError):
+            with waiter(open(path, "ab")):
+                pass
+        assert time.perf_counter() - start >= 1.0
+
+    with waiter(open(path, "ab")):
+        pass
+    assert os.listdir(str(tmp_path / "lock")) == []
+
+
+def test_link_lock_broken_while_held(tmp_path):
+    path = tmp_path / "journal"
+    path.touch()
+    creator = _file_system.LinkLockCreator()
+
+    with creator(open(path, "ab")) as f:
+        for name in os.listdir(str(tmp_path / "lock")):
+            os.unlink(str(tmp_path / "lock" / name))
+        f.write(b"x")
+
+    with creator(open(path, "ab")):
+        pass
+    assert os.listdir(str(tmp_path / "lock")) == []
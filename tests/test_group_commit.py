@@ -0,0 +1,64 @@
+import threading
+import time
+
+import pytest
+
+from optjournal._group_commit import _GroupCommit
+
+
+def test_group_commit():
+    batches = []
+
+    def append(ops):
+        time.sleep(0.01)
+        batches.append(ops)
+
+    group_commit = _GroupCommit(append)
+    threads = [threading.Thread(target=group_commit.commit, args=([i],)) for i in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(batches) < 20
+    assert sorted(op for batch in batches for op in batch) == list(range(20))
+
+
+def test_group_commit_error():
+    started = threading.Event()
+    release = threading.Event()
+
+    def append(ops):
+        if ops == [0]:
+            started.set()
+            release.wait()
+            return
+        raise RuntimeError(ops)
+
+    group_commit = _GroupCommit(append)
+    leader = threading.Thread(target=group_commit.commit, args=([0],))
+    leader.start()
+    started.wait()
+
+    # Both followers are written in the same failing batch, which is written not at all.
+    errors = []
+
+    def follow(op):
+        try:
+            group_commit.commit([op])
+        except RuntimeError as e:
+            errors.append(e)
+
+    followers = [threading.Thread(target=follow, args=(op,)) for op in (1, 2)]
+    for thread in followers:
+        thread.start()
+    while len(group_commit._pending) < 2:
+        time.sleep(0.001)
+    release.set()
+    for thread in [leader] + followers:
+        thread.join()
+
+    assert len(errors) == 2
+    assert errors[0] is errors[1]
+    with pytest.raises(RuntimeError):
+        group_commit.commit([3])
@@ -0,0 +1,62 @@
+import optuna
+import pytest
+
+import optjournal
+
+
+@pytest.mark.parametrize("avoid_flock", [False, True])
+def test_file_system_metrics(tmp_path, avoid_flock):
+    metrics = optjournal.InMemoryMetrics()
+    db = optjournal.FileSystemDatabase(str(tmp_path), avoid_flock=avoid_flock, metrics=metrics)
+    policy = optjournal.CheckpointPolicy(every_n_ops=1)
+    storage = optjournal.JournalStorage(db, checkpoint_policy=policy, metrics=metrics)
+    study = optuna.create_study(storage=storage)
+    study.optimize(lambda t: t.suggest_float("x", 0, 1), n_trials=3)
+
+    for name in [
+        "sync.ops_flushed",
+        "sync.bytes_flushed",
+        "sync.ops_read",
+        "sync.bytes_read",
+        "db.append_seconds",
+        "db.read_seconds",
+        "study.apply_seconds",
+        "study.decode_seconds",
+        "storage.lock_wait_seconds",
+        "snapshot.load_seconds",
+        "snapshot.save_seconds",
+        "file_lock.acquire_seconds",
+    ]:
+        assert metrics.get(name)[0] > 0, name
+
+    # Every flushed record is read back.
+    assert metrics.get("sync.ops_read")[1] == metrics.get("sync.ops_flushed")[1]
+    assert metrics.get("study.decode_seconds")[1] <= metrics.get("study.apply_seconds")[1]
+    if avoid_flock:
+        assert metrics.get("file_lock.retries")[0] > 0
+
+
+def test_callback_sink():
+    observations = []
+    sink = optjournal.CallbackSink(lambda name, value: observations.append((name, value)))
+    storage = optjournal.JournalStorage("sqlite:///:memory:", metrics=sink)
+    study = optuna.create_study(storage=storage)
+    study.optimize(lambda t: t.suggest_float("x", 0, 1), n_trials=1)
+
+    names = {name for name, _ in observations}
+    assert {"sync.ops_flushed", "db.append_seconds", "study.apply_seconds"} <= names
+
+
+def test_prometheus_textfile_sink(tmp_path):
+    path = tmp_path / "optjournal.prom"
+    sink = optjournal.PrometheusTextfileSink(str(path), interval_seconds=3600)
+    sink.observe("db.read_seconds", 0.5)
+    sink.observe("db.read_seconds", 1.5)
+    assert not path.exists()
+
+    sink.write()
+    lines = path.read_text().splitlines()
+    assert "optjournal_db_read_seconds_count 2" in lines
+    assert "optjournal_db_read_seconds_sum 2.0" in lines
+    assert "optjournal_db_read_seconds_max 1.5" in lines
+    assert [p.name for p in tmp_path.iterdir()] == ["optjournal.prom"]
@@ -0,0 +1,440 @@
+import optuna
+import pytest
+from sqlalchemy import event
+from sqlalchemy.engine import create_engine
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.exc import OperationalError
+
+import optjournal
+from optjournal import _models
+from optjournal import _rdb
+
+
+def test_snapshot():
+    db = optjournal.RDBDatabase("sqlite:///:memory:")
+    study_id = db.create_study("foo").id
+    assert db.load_snapshot(study_id, "summary") is None
+
+    db.save_snapshot(
+        _models.SnapshotModel(study_id=study_id, name="summary", data=b"foo", next_op_id=3)
+    )
+    snapshot = db.load_snapshot(study_id, "summary")
+    assert (snapshot.data, snapshot.next_op_id) == (b"foo", 3)
+
+    # Upsert.
+    db.save_snapshot(
+        _models.SnapshotModel(study_id=study_id, name="summary", data=b"bar", next_op_id=5)
+    )
+    snapshot = db.load_snapshot(study_id, "summary")
+    assert (snapshot.data, snapshot.next_op_id) == (b"bar", 5)
+
+    # A snapshot that doesn't cover a longer journal prefix is not written.
+    db.save_snapshot(
+        _models.SnapshotModel(study_id=study_id, name="summary", data=b"baz", next_op_id=5)
+    )
+    assert db.load_snapshot(study_id, "summary").data == b"bar"
+
+
+def test_concurrent_first_snapshot_saves(tmp_path):
+    url = "sqlite:///{}".format(tmp_path / "db.sqlite3")
+    db = optjournal.RDBDatabase(url)
+    other = optjournal.RDBDatabase(url)
+    study_id = db.create_study("foo").id
+
+    # The other writer inserts the snapshot after `db` has found none, but before it inserts.
+    def insert_first(conn, cursor, statement, *args):
+        if statement.startswith("INSERT INTO optjornal_snapshot") and not inserted:
+            inserted.append(True)
+            other.save_snapshot(
+                _models.SnapshotModel(study_id=study_id, name="study", data=b"foo", next_op_id=3)
+            )
+
+    inserted = []
+    event.listen(db._engine, "before_cursor_execute", insert_first)
+    db.save_snapshot(
+        _models.SnapshotModel(study_id=study_id, name="study", data=b"bar", next_op_id=5)
+    )
+    assert inserted
+    snapshot = db.load_snapshot(study_id, "study")
+    assert (snapshot.data, snapshot.next_op_id) == (b"bar", 5)
+
+
+def test_load_snapshot_and_operations():
+    db = optjournal.RDBDatabase("sqlite:///:memory:")
+    study_id = db.create_study("foo").id
+    db.append_operations(
+        [_models.OperationModel(study_id=study_id, data="[{}]".format(i)) for i in range(5)]
+    )
+    op_ids = [op.id for op in db.read_operations(study_id, 0)]
+
+    snapshot, ops = db.load_snapshot_and_operations(study_id, "summary", 0)
+    assert snapshot is None
+    assert [op.id for op in ops] == op_ids
+
+    db.save_snapshot(
+        _models.SnapshotModel(
+            study_id=study_id, name="summary", data=b"foo", next_op_id=op_ids[3]
+        )
+    )
+    snapshot, ops = db.load_snapshot_and_operations(study_id, "summary", 0)
+    assert snapshot.data == b"foo"
+    assert [op.id for op in ops] == op_ids[3:]
+    assert [op.data for op in ops] == ["[3]", "[4]"]
+
+
+def test_iter_operations(tmp_path, monkeypatch):
+    monkeypatch.setattr(_rdb, "_READ_CHUNK_SIZE", 2)
+
+    db = optjournal.RDBDatabase("sqlite:///{}".format(tmp_path / "db.sqlite3"))
+    study_id = db.create_study("foo").id
+    db.append_operations(
+        [_models.OperationModel(study_id=study_id, data="[{}]".format(i)) for i in range(5)]
+    )
+    op_ids = [op.id for op in db.read_operations(study_id, 0)]
+
+    chunks = list(db.iter_operations(study_id, op_ids[1]))
+    assert [[op.data for op in ops] for ops in chunks] == [["[1]", "[2]"], ["[3]", "[4]"]]
+
+    snapshot, chunks = db.load_snapshot_and_iter_operations(study_id, "summary", 0)
+    assert snapshot is None
+    assert [len(ops) for ops in chunks] == [2, 2, 1]
+
+    db.save_snapshot(
+        _models.SnapshotModel(
+            study_id=study_id, name="summary", data=b"foo", next_op_id=op_ids[2]
+        )
+    )
+    snapshot, chunks = db.load_snapshot_and_iter_operations(study_id, "summary", 0)
+    assert snapshot.data == b"foo"
+    assert [[op.id for op in ops] for ops in chunks] == [op_ids[2:4], op_ids[4:]]
+
+
+def test_load_study_in_chunks(tmp_path, monkeypatch):
+    url = "sqlite:///{}".format(tmp_path / "db.sqlite3")
+    study = optuna.create_study(study_name="foo", storage=optjournal.JournalStorage(url))
+    study.optimize(lambda t: t.suggest_float("x", 0, 1), n_trials=10)
+
+    monkeypatch.setattr(_rdb, "_READ_CHUNK_SIZE", 3)
+    storage = optjournal.JournalStorage(
+        url, checkpoint_policy=optjournal.CheckpointPolicy(every_n_ops=1)
+    )
+    loaded = optuna.load_study(study_name="foo", storage=storage)
+    assert [t.params for t in loaded.trials] == [t.params for t in study.trials]
+    assert loaded.best_value == study.best_value
+
+
+def test_get_all_study_summaries_uses_snapshot():
+    storage = optjournal.JournalStorage("sqlite:///:memory:")
+    study = optuna.create_study(study_name="foo", storage=storage)
+    study.optimize(lambda t: t.suggest_float("x", 0, 1), n_trials=3)
+
+    # Without a stored summary, the summary is replayed from the journal.
+    storage._db._engine.execute(_models.StudySummaryModel.__table__.delete())
+    assert storage.get_all_study_summaries()[0].n_trials == 3
+    assert storage._db.load_snapshot(study._study_id, "summary") is not None
+
+    study.optimize(lambda t: t.suggest_float("x", 0, 1), n_trials=2)
+    assert storage.get_all_study_summaries()[0].n_trials == 5
+
+
+def test_load_snapshots_and_operations():
+    db = optjournal.RDBDatabase("sqlite:///:memory:")
+    study_ids = [db.create_study(name).id for name in ["foo", "bar", "baz"]]
+    db.append_operations(
+        [
+            _models.OperationModel(study_id=study_id, data="[{}]".format(i))
+            for i in range(3)
+            for study_id in study_ids
+        ]
+    )
+    op_ids = {
+        study_id: [op.id for op in db.read_operations(study_id, 0)] for study_id in study_ids
+    }
+    db.save_snapshot(
+        _models.SnapshotModel(
+            study_id=study_ids[0], name="summary", data=b"foo", next_op_id=op_ids[study_ids[0]][2]
+        )
+    )
+
+    next_op_ids = {study_ids[0]: 0, study_ids[1]: op_ids[study_ids[1]][1], study_ids[2]: 0}
+    results = db.load_snapshots_and_operations("summary", next_op_ids)
+    for study_id, next_op_id in next_op_ids.items():
+        snapshot, ops = db.load_snapshot_and_operations(study_id, "summary", next_op_id)
+        loaded_snapshot, loaded_ops = results[study_id]
+        assert (loaded_snapshot is None) == (snapshot is None)
+        assert loaded_ops == ops
+    assert results[study_ids[0]][0].data == b"foo"
+
+
+def test_get_all_study_summaries_in_batch():
+    storage = optjournal.JournalStorage("sqlite:///:memory:")
+    for i in range(5):
+        study = optuna.create_study(study_name="study-{}".format(i), storage=storage)
+        study.optimize(lambda t: t.suggest_float("x", 0, 1), n_trials=i)
+    assert [s.n_trials for s in storage.get_all_study_summaries()] == list(range(5))
+
+    # Without stored summaries, the studies are replayed (and their snapshots saved) once.
+    summary_table = _models.StudySummaryModel.__table__
+    storage._db._engine.execute(summary_table.delete())
+    assert [s.n_trials for s in storage.get_all_study_summaries()] == list(range(5))
+
+    storage._db._engine.execute(summary_table.delete())
+    statements = []
+    event.listen(
+        storage._db._engine,
+        "before_cursor_execute",
+        lambda conn, cursor, statement, *args: statements.append(statement.split()[0]),
+    )
+    summaries = storage.get_all_study_summaries()
+    assert [s.n_trials for s in summaries] == list(range(5))
+    assert [s.study_name for s in summaries] == ["study-{}".format(i) for i in range(5)]
+    # The stored summaries, then the snapshots and operations of all studies. Afterwards, the
+    # summary of each study is stored again (an update, and an insert as there is no row).
+    assert statements == ["SELECT", "SELECT"] + ["UPDATE", "SELECT", "INSERT"] * 5
+    assert len(storage._db.load_study_summaries()) == 5
+
+
+def test_delete_study():
+    storage = optjournal.JournalStorage("sqlite:///:memory:")
+    study = optuna.create_study(study_name="foo", storage=storage)
+    study.optimize(lambda t: t.suggest_float("x", 0, 1), n_trials=3)
+    storage.get_all_study_summaries()[0].n_trials
+
+    optuna.delete_study("foo", storage)
+    assert storage.get_all_study_summaries() == []
+    assert storage._db.load_snapshot(study._study_id, "summary") is None
+
+
+def test_migrate_snapshot_table(tmp_path):
+    url = "sqlite:///{}".format(tmp_path / "db.sqlite3")
+    engine = create_engine(url)
+    engine.execute(
+        "CREATE TABLE optjornal_snapshot "
+        "(id INTEGER PRIMARY KEY, study_id INTEGER NOT NULL, "
+        "name VARCHAR(256) NOT NULL, data BLOB NOT NULL)"
+    )
+
+    db = optjournal.RDBDatabase(url)
+    study_id = db.create_study("foo").id
+    db.save_snapshot(
+        _models.SnapshotModel(study_id=study_id, name="summary", data=b"foo", next_op_id=1)
+    )
+    assert db.load_snapshot(study_id, "summary").next_op_id == 1
+
+
+def test_optimistic_append(tmp_path):
+    url = "sqlite:///{}".format(tmp_path / "db.sqlite3")
+    locking = optjournal.JournalStorage(optjournal.RDBDatabase(url))
+    optimistic = optjournal.JournalStorage(optjournal.RDBDatabase(url, append_mode="optimistic"))
+
+    study = optuna.create_study(study_name="foo", storage=locking)
+    study.optimize(lambda t: t.suggest_float("x", 0, 1), n_trials=3)
+    study = optuna.load_study(study_name="foo", storage=optimistic)
+    study.optimize(lambda t: t.suggest_float("x", 0, 1), n_trials=3, n_jobs=3)
+    study = optuna.load_study(study_name="foo", storage=locking)
+    study.optimize(lambda t: t.suggest_float("x", 0, 1), n_trials=3)
+
+    trials = optuna.load_study(study_name="foo", storage=optjournal.JournalStorage(url)).trials
+    assert [t.number for t in trials] == list(range(9))
+
+    engine = create_engine(url)
+    seqs = [row[0] for row in engine.execute("SELECT seq FROM optjournal_operations ORDER BY id")]
+    assert seqs == list(range(len(seqs)))
+
+
+def test_optimistic_append_conflict(tmp_path, monkeypatch):
+    db = optjournal.RDBDatabase("sqlite:///{}".format(tmp_path / "db.sqlite3"), "optimistic")
+    study_id = db.create_study("foo").id
+    db.append_operations([_models.OperationModel(study_id=study_id, data="[2, {}]")])
+
+    # The first attempt fails on the unique sequence number, as it does after losing a race.
+    append = db._append_operations_optimistically
+    calls = []
+
+    def racing_append(ops):
+        calls.append(ops)
+        if len(calls) == 1:
+            with db._engine.begin() as conn:
+                conn.execute(
+                    "INSERT INTO optjournal_operations (study_id, data, seq) VALUES (?, '', 0)",
+                    study_id,
+                )
+        return append(ops)
+
+    monkeypatch.setattr(db, "_append_operations_optimistically", racing_append)
+    db.append_operations([_models.OperationModel(study_id=study_id, data="[3, {}]")])
+    assert len(calls) == 2
+    assert [op.data for op in db.read_operations(study_id, 0)] == ["[2, {}]", "[3, {}]"]
+
+
+def test_migrate_operation_table(tmp_path):
+    url = "sqlite:///{}".format(tmp_path / "db.sqlite3")
+    engine = create_engine(url)
+    engine.execute(
+        "CREATE TABLE optjournal_operations "
+        "(id INTEGER PRIMARY KEY, study_id INTEGER NOT NULL, data VARCHAR(4096) NOT NULL)"
+    )
+    engine.execute("INSERT INTO optjournal_operations (study_id, data) VALUES (1, '[2, {}]')")
+
+    db = optjournal.RDBDatabase(url, append_mode="optimistic")
+    large = '[3, {{"value": "{}"}}]'.format("x" * 5000)
+    db.append_operations([_models.OperationModel(study_id=1, data=large)])
+    assert [op.data for op in db.read_operations(1, 0)] == ["[2, {}]", large]
+    rows = engine.execute("SELECT data, large_data FROM optjournal_operations ORDER BY id")
+    assert [tuple(row) for row in rows] == [("[2, {}]", None), ("", large)]
+    with pytest.raises(IntegrityError):
+        engine.execute("INSERT INTO optjournal_operations (study_id, data, seq) VALUES (1, '', 0)")
+
+
+def test_unknown_append_mode():
+    with pytest.raises(ValueError):
+        optjournal.RDBDatabase("sqlite:///:memory:", append_mode="foo")
+
+
+def test_retry_policy():
+    policy = optjournal.RetryPolicy(max_retries=3, base_delay_ms=1)
+    db = optjournal.RDBDatabase("sqlite:///:memory:", retry_policy=policy)
+    errors = []
+
+    def fail(error, n_failures):
+        def func():
+            if len(errors) < n_failures:
+                errors.append(error)
+                raise error
+            return 42
+
+        return func
+
+    locked = OperationalError("INSERT ...", {}, Exception("database is locked"))
+    assert db._retry(fail(locked, 2)) == 42
+    assert (policy.n_retries, policy.n_exhausted) == (2, 0)
+    assert policy.contention_seconds > 0
+
+    errors.clear()
+    with pytest.raises(OperationalError):
+        db._retry(fail(locked, 10))
+    assert len(errors) == 4
+    assert (policy.n_retries, policy.n_exhausted) == (5, 1)
+
+    # Other errors are not retried.
+    for error in [
+        ValueError(),
+        IntegrityError("INSERT ...", {}, Exception("UNIQUE")),
+        OperationalError("INSERT ...", {}, Exception("no such table: optjournal_operations")),
+        OperationalError("SELECT 1", {}, Exception(1045, "Access denied for user")),
+    ]:
+        errors.clear()
+        with pytest.raises(type(error)):
+            db._retry(fail(error, 1))
+        assert len(errors) == 1
+    assert policy.n_retries == 5
+
+    # Unless they are conflicts between appends.
+    errors.clear()
+    conflict = IntegrityError(
+        "INSERT ...",
+        {},
+        Exception(
+            "UNIQUE constraint failed: optjournal_operations.study_id, optjournal_operations.seq"
+        ),
+    )
+    assert db._retry(fail(conflict, 1), retry_on_conflict=True) == 42
+
+    # Other integrity errors aren't conflicts.
+    for orig in [Exception("FOREIGN KEY constraint failed"), Exception(1452, "Cannot add")]:
+        errors.clear()
+        with pytest.raises(IntegrityError):
+            db._retry(fail(IntegrityError("INSERT ...", {}, orig), 1), retry_on_conflict=True)
+        assert len(errors) == 1
+
+
+def test_append_to_deleted_study(tmp_path):
+    policy = optjournal.RetryPolicy(base_delay_ms=1)
+    db = optjournal.RDBDatabase(
+        "sqlite:///{}".format(tmp_path / "db.sqlite3"), retry_policy=policy
+    )
+
+    @event.listens_for(db._engine, "connect")
+    def enable_foreign_keys(conn, record):
+        conn.execute("PRAGMA foreign_keys = ON")
+
+    db._engine.dispose()
+    study_id = db.create_study("foo").id
+    db.delete_study(study_id)
+    with pytest.raises(IntegrityError):
+        db.append_operations([_models.OperationModel(study_id=study_id, data="[2, {}]")])
+    assert policy.n_retries == 0
+
+
+def test_retryable_errors():
+    class PostgresError(Exception):
+        def __init__(self, pgcode):
+            self.pgcode = pgcode
+
+    policy = optjournal.RetryPolicy()
+    retryable = [
+        Exception("database is locked"),
+        Exception(1205, "Lock wait timeout exceeded"),
+        Exception(1213, "Deadlock found when trying to get lock"),
+        Exception(2006, "MySQL server has gone away"),
+        PostgresError("40001"),
+        PostgresError("40P01"),
+        PostgresError("08006"),
+    ]
+    for orig in retryable:
+        assert policy.is_retryable(OperationalError("SELECT 1", {}, orig))
+
+    permanent = [
+        Exception("unable to open database file"),
+        Exception(1045, "Access denied for user"),
+        PostgresError("42P01"),
+    ]
+    for orig in permanent:
+        assert not policy.is_retryable(OperationalError("SELECT 1", {}, orig))
+
+    disconnected = OperationalError("SELECT 1", {}, Exception(), connection_invalidated=True)
+    assert policy.is_retryable(disconnected)
+
+
+def test_retry_policy_delay():
+    policy = optjournal.RetryPolicy(base_delay_ms=10, max_delay_ms=50, deadline_ms=1000)
+    for n_retries in range(10):
+        assert 0 <= policy.delay_seconds(n_retries) <= min(0.01 * 2 ** n_retries, 0.05)
+
+    assert policy.can_retry(0, 0.5)
+    assert not policy.can_retry(0, 1.0)
+    assert not policy.can_retry(policy.max_retries, 0)
+
+
+def test_sqlite_options(tmp_path):
+    options = optjournal.SQLiteOptions(busy_timeout_ms=1000, checkpoint_interval_ms=10)
+    url = "sqlite:///{}".format(tmp_path / "db.sqlite3")
+    storage = optjournal.JournalStorage(optjournal.RDBDatabase(url, sqlite_options=options))
+    study = optuna.create_study(storage=storage)
+    study.optimize(lambda t: t.suggest_float("x", 0, 1), n_trials=3)
+    other = optjournal.JournalStorage(url)
+    assert len(optuna.load_study(study.study_name, storage=other).trials) == 3
+
+    db = storage._db
+    with db._engine.connect() as conn:
+        pragmas = {
+            name: conn.execute("PRAGMA {}".format(name)).scalar()
+            for name in ["journal_mode", "synchronous", "busy_timeout", "wal_autocheckpoint"]
+        }
+    assert pragmas == {
+        "journal_mode": "wal",
+        "synchronous": 1,
+        "busy_timeout": 1000,
+        "wal_autocheckpoint": 0,
+    }
+
+    assert db._wal_checkpointer.is_alive()
+    db._wal_checkpointer.stop()
+    db._wal_checkpointer.join()
+
+    # In-memory databases keep a connection per thread.
+    db = optjournal.RDBDatabase("sqlite:///:memory:", sqlite_options=optjournal.SQLiteOptions())
+    assert db.find_study_by_name(db.create_study("foo").name) is not None
+
+    with pytest.raises(ValueError):
+        optjournal.RDBDatabase("postgresql://localhost/foo", sqlite_options=options)
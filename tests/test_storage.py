@@ -1,6 +1,14 @@
+import gc
+import threading
+import time
+
 import optuna
+from optuna.trial import TrialState
+import pytest
 
 import optjournal
+from optjournal._operation import _Operation
+from optjournal._study import _Study
 
 
 def test_basic():
@@ -32,3 +40,379 @@ def test_get_all_study_summaries():
     summary = storage.get_all_study_summaries()[0]
     assert summary.study_name == "foo"
     assert summary.best_trial is None
+
+
+@pytest.mark.parametrize("backend", ["rdb", "fs"])
+def test_stored_study_summaries(tmp_path, backend):
+    if backend == "rdb":
+        db = optjournal.RDBDatabase("sqlite:///{}".format(tmp_path / "db.sqlite3"))
+    else:
+        db = optjournal.FileSystemDatabase(str(tmp_path))
+    storage = optjournal.JournalStorage(db)
+    study = optuna.create_study(study_name="foo", storage=storage)
+    study.set_user_attr("bar", [1, 2])
+    study.optimize(lambda t: t.suggest_float("x", 0, 1), n_trials=5)
+    optuna.create_study(study_name="empty", storage=storage)
+
+    # The stored summaries are up to date and no journal is read.
+    storage._db.load_snapshots_and_operations = None
+    summaries = storage.get_all_study_summaries()
+    assert [s.study_name for s in summaries] == ["foo", "empty"]
+    assert summaries[0].n_trials == 5
+    assert summaries[0].best_trial.number == study.best_trial.number
+    assert summaries[0].best_trial.value == study.best_value
+    assert summaries[0].user_attrs == {"bar": [1, 2]}
+    assert summaries[0].datetime_start == study.trials[0].datetime_start
+    assert summaries[0].direction == optuna.study.StudyDirection.MINIMIZE
+    del storage._db.load_snapshots_and_operations
+
+    # Operations that don't update the stored summary make it stale.
+    trial_id = storage.create_new_trial(study._study_id)
+    storage.set_trial_param(trial_id, "x", 0.5, optuna.distributions.UniformDistribution(0, 1))
+    storage.read_trials_from_remote_storage(study._study_id)
+    other = optjournal.JournalStorage(db)
+    assert storage._db.load_study_summaries()[0][1] is None
+    assert [s.n_trials for s in other.get_all_study_summaries()] == [6, 0]
+
+    # Replaying a stale summary stores it.
+    assert db.load_study_summaries()[0][1].n_trials == 6
+
+
+def test_checkpoint(tmp_path):
+    db = optjournal.FileSystemDatabase(str(tmp_path))
+    policy = optjournal.CheckpointPolicy(every_n_ops=1)
+    storage = optjournal.JournalStorage(db, checkpoint_policy=policy)
+    study = optuna.create_study(study_name="foo", storage=storage)
+    study.optimize(lambda t: t.suggest_float("x", 0, 1), n_trials=10)
+
+    snapshot = db.load_snapshot(study._study_id, "study")
+    assert snapshot is not None
+    assert len(_Study.deserialize(snapshot.data).trials) == 10
+
+    # Operations appended after the checkpoint are replayed on top of it.
+    storage = optjournal.JournalStorage(optjournal.FileSystemDatabase(str(tmp_path)))
+    study = optuna.load_study(study_name="foo", storage=storage)
+    study.optimize(lambda t: t.suggest_float("x", 0, 1), n_trials=5)
+
+    storage = optjournal.JournalStorage(optjournal.FileSystemDatabase(str(tmp_path)))
+    study = optuna.load_study(study_name="foo", storage=storage)
+    assert len(study.trials) == 15
+    assert [t.number for t in study.trials] == list(range(15))
+
+
+def test_replay(tmp_path):
+    def objective(trial):
+        trial.set_user_attr("foo", trial.number)
+        trial.set_system_attr("bar", trial.number)
+        for step in range(3):
+            trial.report(step, step)
+        return trial.suggest_float("x", 0, 1) + trial.suggest_int("y", 0, 3)
+
+    storage = optjournal.JournalStorage(optjournal.FileSystemDatabase(str(tmp_path)))
+    study = optuna.create_study(study_name="foo", storage=storage)
+    study.optimize(objective, n_trials=5)
+
+    storage = optjournal.JournalStorage(optjournal.FileSystemDatabase(str(tmp_path)))
+    replayed = optuna.load_study(study_name="foo", storage=storage)
+    assert replayed.trials == study.trials
+    for trial in replayed.trials:
+        assert trial.user_attrs == {"foo": trial.number}
+        assert trial.system_attrs == {"bar": trial.number}
+        assert trial.distributions == {
+            "x": optuna.distributions.UniformDistribution(0, 1),
+            "y": optuna.distributions.IntUniformDistribution(0, 3),
+        }
+
+
+def test_threads(tmp_path):
+    storage = optjournal.JournalStorage(optjournal.FileSystemDatabase(str(tmp_path)))
+    studies = [optuna.create_study(study_name=str(i), storage=storage) for i in range(3)]
+
+    def optimize(study):
+        study.optimize(lambda t: t.suggest_float("x", 0, 1), n_trials=20, n_jobs=4)
+
+    threads = [threading.Thread(target=optimize, args=(study,)) for study in studies]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    storage = optjournal.JournalStorage(optjournal.FileSystemDatabase(str(tmp_path)))
+    for study in studies:
+        trials = optuna.load_study(study_name=study.study_name, storage=storage).trials
+        assert [t.number for t in trials] == list(range(20))
+        assert all(t.state == optuna.trial.TrialState.COMPLETE for t in trials)
+
+
+def test_finished_trials_are_shared():
+    storage = optjournal.JournalStorage("sqlite:///:memory:")
+    study = optuna.create_study(storage=storage)
+    study.optimize(lambda t: t.suggest_float("x", 0, 1), n_trials=3)
+    running_trial_id = storage.create_new_trial(study._study_id)
+
+    trials = storage.get_all_trials(study._study_id)
+    assert trials[0] is storage.get_trial(trials[0]._trial_id)
+    assert trials[3] is not storage.get_trial(running_trial_id)
+    assert storage.get_all_trials(study._study_id) == trials
+
+    with pytest.raises(AttributeError):
+        trials[0].value = 1.0
+    with pytest.raises(TypeError):
+        trials[0].params["x"] = 1.0
+
+    # Finished trials that are modified afterwards are copied first.
+    storage.set_trial_state(running_trial_id, optuna.trial.TrialState.FAIL)
+    storage._enqueue_op(
+        study._study_id,
+        _Operation.SET_TRIAL_USER_ATTR,
+        {"trial_id": trials[0]._trial_id, "key": "foo", "value": 1},
+    )
+    storage.read_trials_from_remote_storage(study._study_id)
+    assert trials[0].user_attrs == {}
+    assert storage.get_trial(trials[0]._trial_id).user_attrs == {"foo": 1}
+
+    restored = _Study.deserialize(storage._studies[study._study_id].serialize())
+    assert restored.trials == storage.get_all_trials(study._study_id)
+    assert all(t._frozen for t in restored.trials)
+
+
+def test_trials_by_state():
+    storage = optjournal.JournalStorage("sqlite:///:memory:")
+    study = optuna.create_study(storage=storage)
+    study.optimize(lambda t: t.suggest_float("x", 0, 1), n_trials=3)
+    study.optimize(lambda t: 1 / 0, n_trials=2, catch=(ZeroDivisionError,))
+    running_trial_id = storage.create_new_trial(study._study_id)
+    study.optimize(lambda t: t.suggest_float("x", 0, 1), n_trials=1)
+
+    study_id = study._study_id
+    complete, fail, running = TrialState.COMPLETE, TrialState.FAIL, TrialState.RUNNING
+    assert storage.get_n_trials(study_id) == 7
+    assert storage.get_n_trials(study_id, complete) == 4
+    assert storage.get_n_trials(study_id, (complete, fail)) == 6
+    assert [t.number for t in storage.get_all_trials(study_id, states=(complete,))] == [
+        0, 1, 2, 6
+    ]
+    assert [t.number for t in storage.get_all_trials(study_id, states=(fail, complete))] == [
+        0, 1, 2, 3, 4, 6
+    ]
+    assert [
+        t._trial_id for t in storage.get_all_trials(study_id, deepcopy=False, states=(running,))
+    ] == [running_trial_id]
+
+    storage.set_trial_values(running_trial_id, [0.5])
+    storage.set_trial_state(running_trial_id, complete)
+    assert storage.get_n_trials(study_id, running) == 0
+    assert storage.get_n_trials(study_id, complete) == 5
+
+    # Snapshots taken before the index existed.
+    state = storage._studies[study_id]
+    del state.trial_numbers_by_state
+    restored = _Study.deserialize(state.serialize())
+    assert restored.get_n_trials((complete,)) == 5
+    assert [t.number for t in restored.get_trials((fail,))] == [3, 4]
+
+
+def test_sync_policy(tmp_path):
+    def new_storage(sync_policy=None):
+        db = optjournal.FileSystemDatabase(str(tmp_path))
+        return optjournal.JournalStorage(db, sync_policy=sync_policy)
+
+    storage = new_storage(optjournal.SyncPolicy())
+    study = optuna.create_study(study_name="foo", storage=storage)
+    trial = study.ask()
+    for step in range(10):
+        trial.report(step, step)
+    trial.set_user_attr("foo", 1)
+    study.set_user_attr("bar", 2)
+
+    # Applied locally but not written yet.
+    other = optuna.load_study(study_name="foo", storage=new_storage())
+    assert other.trials[0].intermediate_values == {}
+    assert other.user_attrs == {}
+    assert storage.get_trial(trial._trial_id).intermediate_values == {
+        step: step for step in range(10)
+    }
+    assert storage.get_trial(trial._trial_id).user_attrs == {"foo": 1}
+    assert storage._studies[study._study_id].user_attrs == {"bar": 2}
+
+    # State transitions sync.
+    study.tell(trial, 1.0)
+    other = optuna.load_study(study_name="foo", storage=new_storage())
+    assert other.trials == study.trials
+    assert other.user_attrs == {"bar": 2}
+
+    storage = new_storage(optjournal.SyncPolicy(max_buffer_bytes=1))
+    study = optuna.load_study(study_name="foo", storage=storage)
+    trial = study.ask()
+    trial.report(1.0, 0)
+    other = optuna.load_study(study_name="foo", storage=new_storage())
+    assert other.trials[1].intermediate_values == {0: 1.0}
+
+
+def test_tailer(tmp_path):
+    def new_storage(**kwargs):
+        return optjournal.JournalStorage(optjournal.FileSystemDatabase(str(tmp_path)), **kwargs)
+
+    writer = optuna.create_study(study_name="foo", storage=new_storage())
+    storage = new_storage(tail_interval_ms=10)
+    study = optuna.load_study(study_name="foo", storage=storage)
+    assert study.trials == []
+
+    writer.optimize(lambda t: t.suggest_float("x", 0, 1), n_trials=3)
+    for _ in range(100):
+        if len(storage.get_all_trials(study._study_id)) == 3:
+            break
+        time.sleep(0.01)
+    assert storage.get_all_trials(study._study_id) == writer.trials
+
+    # Own writes are still applied synchronously.
+    study.optimize(lambda t: t.suggest_float("x", 0, 1), n_trials=2)
+    assert [t.number for t in storage.get_all_trials(study._study_id)] == list(range(5))
+
+    tailer = storage._tailer
+    del storage, study
+    gc.collect()
+    tailer.join(1)
+    assert not tailer.is_alive()
+
+
+def test_tailer_checkpoint_with_buffered_writes(tmp_path):
+    db = optjournal.FileSystemDatabase(str(tmp_path))
+    writer = optjournal.JournalStorage(db)
+    study_id = writer.create_new_study("foo")
+    storage = optjournal.JournalStorage(
+        db,
+        checkpoint_policy=optjournal.CheckpointPolicy(every_n_ops=1),
+        sync_policy=optjournal.SyncPolicy(interval_ms=60000),
+        tail_interval_ms=10,
+    )
+    trial_id = storage.create_new_trial(study_id)
+    storage.set_trial_user_attr(trial_id, "buffered", True)
+
+    # The tailer applies the write of another storage, but doesn't checkpoint the buffered one.
+    writer.set_study_user_attr(study_id, "written", True)
+    while "written" not in storage._studies[study_id].user_attrs:
+        time.sleep(0.01)
+    time.sleep(0.1)
+    snapshot = db.load_snapshot(study_id, "study")
+    assert snapshot is not None
+    assert _Study.deserialize(snapshot.data).trials[0].user_attrs == {}
+
+    storage.read_trials_from_remote_storage(study_id)
+    other = optjournal.JournalStorage(optjournal.FileSystemDatabase(str(tmp_path)))
+    assert other.get_all_trials(study_id)[0].user_attrs == {"buffered": True}
+    storage.stop_tailing()
+
+
+def test_failed_flush(tmp_path):
+    db = optjournal.FileSystemDatabase(str(tmp_path))
+    append_operations = db.append_operations
+    failures = []
+
+    def fail_once(ops):
+        if failures:
+            raise failures.pop()
+        append_operations(ops)
+
+    db.append_operations = fail_once
+    storage = optjournal.JournalStorage(db)
+    study = optuna.create_study(storage=storage)
+    trial_id = storage.create_new_trial(study._study_id)
+    distribution = optuna.distributions.UniformDistribution(0, 1)
+    storage.set_trial_param(trial_id, "x", 0.5, distribution)
+
+    failures.append(OSError("append failed"))
+    with pytest.raises(OSError):
+        storage.set_trial_state(trial_id, TrialState.COMPLETE)
+
+    # The operations of the failed flush are written by the next one.
+    storage.read_trials_from_remote_storage(study._study_id)
+    other = optjournal.JournalStorage(optjournal.FileSystemDatabase(str(tmp_path)))
+    trial = other.get_all_trials(study._study_id)[0]
+    assert trial.params == {"x": 0.5}
+    assert trial.state == TrialState.COMPLETE
+
+
+def test_failed_flush_of_several_studies(tmp_path):
+    db = optjournal.FileSystemDatabase(str(tmp_path))
+    append_operations = db.append_operations
+    started = threading.Event()
+    release = threading.Event()
+
+    def block_leader(ops):
+        if not release.is_set():
+            started.set()
+            release.wait()
+        append_operations(ops)
+
+    storage = optjournal.JournalStorage(db)
+    study_ids = [storage.create_new_study(name) for name in ["a", "b", "c"]]
+    trial_ids = [storage.create_new_trial(study_id) for study_id in study_ids]
+    storage._group_commit._append = block_leader
+
+    # Locking the journal of "b" fails after "a" has been written in the same batch.
+    file_lock = db._file_lock
+    failing_path = str(db._journal_path(study_ids[1]))
+
+    def fail_b(file, **kwargs):
+        if file.name == failing_path:
+            raise RuntimeError("Cannot acquire file lock")
+        return file_lock(file, **kwargs)
+
+    db._file_lock = fail_b
+    errors = []
+
+    def finish(trial_id):
+        try:
+            storage.set_trial_state(trial_id, TrialState.COMPLETE)
+        except RuntimeError as e:
+            errors.append(e)
+
+    leader = threading.Thread(target=finish, args=(trial_ids[2],))
+    leader.start()
+    started.wait()
+    followers = [threading.Thread(target=finish, args=(t,)) for t in trial_ids[:2]]
+    for thread in followers:
+        thread.start()
+    while len(storage._group_commit._pending) < 2:
+        time.sleep(0.001)
+    release.set()
+    for thread in [leader] + followers:
+        thread.join()
+    assert len(errors) == 2
+
+    db._file_lock = file_lock
+    for study_id in study_ids:
+        storage.read_trials_from_remote_storage(study_id)
+        data = [r.data for r in db.read_operations(study_id, 0)]
+        assert len(data) == len(set(data))
+
+    other = optjournal.JournalStorage(optjournal.FileSystemDatabase(str(tmp_path)))
+    for study_id in study_ids:
+        assert [t.state for t in other.get_all_trials(study_id)] == [TrialState.COMPLETE]
+
+
+def test_tailer_ownership_checks(tmp_path):
+    storage = optjournal.JournalStorage(
+        optjournal.FileSystemDatabase(str(tmp_path)), tail_interval_ms=10
+    )
+    study = optuna.create_study(storage=storage)
+    study.optimize(lambda t: 0, n_trials=1)
+
+    # Finishing the trial again would raise if this thread synced it, but the tailer skips it
+    # and applies the rest of the batch.
+    data = {
+        "trial_id": study.trials[0]._trial_id,
+        "state": TrialState.COMPLETE.value,
+        "worker_id": storage._worker_id(),
+        "datetime_complete": 0.0,
+    }
+    storage._enqueue_op(study._study_id, _Operation.SET_TRIAL_STATE, data)
+    storage._enqueue_op(study._study_id, _Operation.SET_STUDY_USER_ATTR, {"key": "k", "value": 1})
+    storage.read_trials_from_remote_storage(study._study_id)
+    for _ in range(100):
+        if storage._studies[study._study_id].user_attrs:
+            break
+        time.sleep(0.01)
+    storage.stop_tailing()
+    assert storage._studies[study._study_id].user_attrs == {"k": 1}
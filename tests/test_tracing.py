@@ -0,0 +1,78 @@
+import json
+
+import optuna
+
+import optjournal
+
+
+def test_trace(tmp_path):
+    tracer = optjournal.Tracer()
+    db = optjournal.FileSystemDatabase(str(tmp_path / "db"), tracer=tracer)
+    storage = optjournal.JournalStorage(db, tracer=tracer)
+    study = optuna.create_study(storage=storage)
+    study.optimize(lambda t: t.suggest_float("x", 0, 1), n_trials=3)
+
+    path = tmp_path / "trace.json"
+    tracer.dump(str(path))
+    with open(path) as f:
+        events = json.load(f)["traceEvents"]
+
+    spans = [e for e in events if e["ph"] == "X"]
+    categories = {e["cat"] for e in spans}
+    assert categories == {"storage", "db", "lock", "replay"}
+    names = {e["name"] for e in spans}
+    assert {"create_new_trial", "set_trial_param", "append_operations", "iter_operations"} <= names
+    assert {"study_lock", "file_lock", "apply"} <= names
+
+    set_param = next(e for e in spans if e["name"] == "set_trial_param")
+    assert set_param["args"]["study_id"] == study._study_id
+    assert set_param["args"]["trial_id"] == study.trials[0]._trial_id
+    assert "worker_id" in set_param["args"]
+    assert all(e["dur"] >= 0 for e in spans)
+
+    # Spans of a call enclose those of the calls it makes.
+    append = next(e for e in spans if e["name"] == "append_operations")
+    lock = next(e for e in spans if e["name"] == "file_lock" and e["ts"] >= append["ts"])
+    assert lock["ts"] + lock["dur"] <= append["ts"] + append["dur"]
+
+
+def test_trace_keyword_arguments(tmp_path):
+    tracer = optjournal.Tracer()
+    db = optjournal.FileSystemDatabase(str(tmp_path / "db"), tracer=tracer)
+    storage = optjournal.JournalStorage(db, tracer=tracer)
+    study = optuna.create_study(storage=storage)
+    study.optimize(lambda t: t.suggest_float("x", 0, 1), n_trials=1)
+    trial_id = study.trials[0]._trial_id
+
+    assert len(storage.get_all_trials(study_id=study._study_id)) == 1
+    assert storage.get_trial(trial_id=trial_id).number == 0
+    assert db.read_operations(study_id=study._study_id, next_op_id=0)
+
+    get_trial = [e for e in tracer.events if e["name"] == "get_trial"][-1]
+    assert get_trial["args"]["trial_id"] == trial_id
+    read = [e for e in tracer.events if e["name"] == "read_operations"][-1]
+    assert read["args"]["study_id"] == study._study_id
+
+
+def test_merge_traces(tmp_path):
+    paths = []
+    for i in range(2):
+        tracer = optjournal.Tracer()
+        with tracer.span("foo", "test", {"i": i}):
+            pass
+        paths.append(str(tmp_path / "{}.json".format(i)))
+        tracer.dump(paths[-1])
+
+    optjournal.merge_traces(paths, str(tmp_path / "merged.json"))
+    with open(tmp_path / "merged.json") as f:
+        events = json.load(f)["traceEvents"]
+    assert [e["args"]["i"] for e in events if e["ph"] == "X"] == [0, 1]
+
+
+def test_max_events():
+    tracer = optjournal.Tracer(max_events=2)
+    for _ in range(3):
+        with tracer.span("foo", "test"):
+            pass
+    assert len(tracer.events) == 2
+    assert tracer.n_dropped == 1